@@ -25,6 +25,8 @@ description:
   - You can specify multiple services at once by separating them with commas, .e.g., C(services=httpd,nfs,puppet).
   - When specifying what service to handle there is a special service value, I(host), which will handle alerts/downtime for the I(host itself), e.g., C(service=host). This keyword may not be given with other services at the same time. I(Setting alerts/downtime for a host does not affect alerts/downtime for any of the services running on it.) To schedule downtime for all services on particular host use keyword "all", e.g., C(service=all).
   - When using the M(nagios) module you will need to specify your Nagios server using the C(delegate_to) parameter.
+  - When the Nagios status file can be read, commands whose effect is already in place are not sent and the task reports no change.
+    A downtime is considered in place when one is active for the host or service and either it was entered by the same I(author) for at least as many I(minutes), or it already lasts until the end of the requested window.
 version_added: "0.7"
 options:
   action:
@@ -36,7 +38,11 @@ options:
                "silence_nagios", "unsilence_nagios", "command" ]
   host:
     description:
-      - Host to operate on in Nagios.
+      - Host to operate on in Nagios. A list of hosts, or a comma separated
+        string of hosts, may be given to act on many hosts at once; all
+        commands are then written to the command file together.
+        C(hosts) is an alias for C(host).
+    aliases: [ "hosts" ]
     required: false
     default: null
   cmdfile:
@@ -102,6 +108,9 @@ EXAMPLES = '''
 # silence ALL alerts
 - nagios: action=silence host={{ inventory_hostname }}
 
+# schedule downtime for a service on every host of a group
+- nagios: action=downtime minutes=30 service=httpd hosts={{ groups['webservers'] | join(',') }}
+
 # unsilence all alerts
 - nagios: action=unsilence host={{ inventory_hostname }}
 
@@ -116,14 +125,23 @@ EXAMPLES = '''
 '''
 
 import ConfigParser
+import json
 import types
+import tempfile
 import time
+import os
 import os.path
 
+try:
+    from select import PIPE_BUF
+except ImportError:
+    # smallest value allowed by POSIX
+    PIPE_BUF = 512
+
 ######################################################################
 
 
-def which_cmdfile():
+def which_nagios_cfg():
     locations = [
         # rhel
         '/etc/nagios/nagios.cfg',
@@ -150,12 +168,145 @@ def which_cmdfile():
 
     for path in locations:
         if os.path.exists(path):
-            for line in open(path):
-                if line.startswith('command_file'):
-                    return line.split('=')[1].strip()
+            return path
 
     return None
 
+
+# main config options the module needs
+CFG_OPTIONS = ['command_file', 'status_file']
+
+# resolved options are kept here, keyed on the mtime of the files read
+CFG_CACHE = '~/.ansible/cache/nagios_cfg.json'
+
+_cfg_options = None
+
+
+def cfg_targets(base, key, value):
+    if not os.path.isabs(value):
+        value = os.path.join(base, value)
+    if key.endswith('_file'):
+        return ([value], [])
+
+    files = []
+    dirs = []
+    for root, dirnames, filenames in os.walk(value):
+        dirs.append(root)
+        files.extend([os.path.join(root, x) for x in sorted(filenames)
+                      if x.endswith('.cfg')])
+    return (files, dirs)
+
+
+def parse_nagios_cfg(path):
+    """
+    Read CFG_OPTIONS from the main config file.
+
+    include_file/include_dir are followed as they hold main config
+    options. cfg_file/cfg_dir only hold object definitions, so they are
+    never read.
+
+    Returns the options found and the mtime of every file and directory
+    read.
+    """
+
+    options = {}
+    mtimes = {}
+    base = os.path.dirname(path)
+    pending = [path]
+    while pending:
+        cfg = pending.pop(0)
+        if cfg in mtimes:
+            continue
+        try:
+            mtimes[cfg] = os.path.getmtime(cfg)
+            fp = open(cfg)
+        except (IOError, OSError):
+            continue
+        try:
+            for line in fp:
+                key, sep, value = line.strip().partition('=')
+                if not sep or key.startswith('#'):
+                    continue
+                key = key.strip()
+                value = value.strip()
+                if key in CFG_OPTIONS:
+                    options.setdefault(key, value)
+                elif key in ['include_file', 'include_dir']:
+                    files, dirs = cfg_targets(base, key, value)
+                    for d in dirs:
+                        mtimes[d] = os.path.getmtime(d)
+                    pending.extend(files)
+        finally:
+            fp.close()
+
+    return (options, mtimes)
+
+
+def load_cfg_cache(path, cfg_path):
+    try:
+        fp = open(path)
+        try:
+            cache = json.load(fp)
+        finally:
+            fp.close()
+        if cache['cfg'] != cfg_path:
+            return None
+        for cfg, mtime in cache['mtimes'].items():
+            if os.path.getmtime(cfg) != mtime:
+                return None
+        return cache['options']
+    except (IOError, OSError, ValueError, KeyError, AttributeError):
+        return None
+
+
+def save_cfg_cache(path, cfg_path, options, mtimes):
+    try:
+        cache_dir = os.path.dirname(path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        fp = os.fdopen(fd, 'w')
+        try:
+            json.dump({'cfg': cfg_path, 'options': options,
+                       'mtimes': mtimes}, fp)
+        finally:
+            fp.close()
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        # the cache is only an optimization
+        pass
+
+
+def nagios_cfg_options():
+    global _cfg_options
+    if _cfg_options is not None:
+        return _cfg_options
+
+    path = which_nagios_cfg()
+    if path is None:
+        _cfg_options = {}
+        return _cfg_options
+
+    cache_path = os.path.expanduser(CFG_CACHE)
+    _cfg_options = load_cfg_cache(cache_path, path)
+    if _cfg_options is None:
+        _cfg_options, mtimes = parse_nagios_cfg(path)
+        save_cfg_cache(cache_path, path, _cfg_options, mtimes)
+
+    return _cfg_options
+
+
+def which_cfg_option(option):
+    return nagios_cfg_options().get(option)
+
+
+def which_cmdfile():
+    return which_cfg_option('command_file')
+
+
+def which_statusfile():
+    return which_cfg_option('status_file')
+
 ######################################################################
 
 
@@ -175,7 +326,7 @@ def main():
         argument_spec=dict(
             action=dict(required=True, default=None, choices=ACTION_CHOICES),
             author=dict(default='Ansible'),
-            host=dict(required=False, default=None),
+            host=dict(required=False, default=None, type='list', aliases=['hosts']),
             minutes=dict(default=30),
             cmdfile=dict(default=which_cmdfile()),
             services=dict(default=None, aliases=['service']),
@@ -238,6 +389,117 @@ def main():
     ##################################################################
 
 
+######################################################################
+class NagiosStatus(object):
+    """
+    Index of the Nagios status file (status.dat), limited to what is
+    needed to tell whether a downtime or notification command would
+    change anything.
+
+    The file is streamed line by line. Only host, service, downtime
+    and program status blocks are kept, and only for the given hosts,
+    so large status files can be read cheaply.
+    """
+
+    BLOCKS = ['hoststatus', 'servicestatus', 'hostdowntime',
+              'servicedowntime', 'programstatus']
+
+    def __init__(self, path, hosts):
+        self.hosts = set(hosts)
+        # host -> notifications_enabled
+        self.host_notifications = {}
+        # host -> {service -> notifications_enabled}
+        self.service_notifications = {}
+        # host -> [downtime]
+        self.host_downtimes = {}
+        # (host, service) -> [downtime]
+        self.service_downtimes = {}
+        self.notifications_enabled = None
+
+        fp = open(path)
+        try:
+            self._parse(fp)
+        finally:
+            fp.close()
+
+    def _parse(self, fp):
+        block_type = None
+        block = None
+        for line in fp:
+            line = line.strip()
+            if block is None:
+                if line.endswith('{'):
+                    block_type = line[:-1].strip()
+                    if block_type in self.BLOCKS:
+                        block = {}
+                continue
+            if line == '}':
+                self._add(block_type, block)
+                block = None
+                continue
+            key, sep, value = line.partition('=')
+            if key == 'host_name' and value not in self.hosts:
+                # skip the rest of blocks about other hosts
+                block_type = None
+            elif sep:
+                block[key] = value
+
+    def _add(self, block_type, block):
+        host = block.get('host_name')
+        if block_type == 'hoststatus':
+            self.host_notifications[host] = block.get('notifications_enabled') == '1'
+        elif block_type == 'servicestatus':
+            services = self.service_notifications.setdefault(host, {})
+            services[block.get('service_description')] = block.get('notifications_enabled') == '1'
+        elif block_type == 'hostdowntime':
+            self.host_downtimes.setdefault(host, []).append(block)
+        elif block_type == 'servicedowntime':
+            key = (host, block.get('service_description'))
+            self.service_downtimes.setdefault(key, []).append(block)
+        elif block_type == 'programstatus':
+            self.notifications_enabled = block.get('enable_notifications') == '1'
+
+    def knows_host(self, host):
+        return host in self.host_notifications
+
+    def services(self, host):
+        return self.service_notifications.get(host, {}).keys()
+
+    def in_downtime(self, host, author, duration, service=None):
+        """
+        Whether a downtime is already in place: one is active now and
+        either was entered by the same author for at least the requested
+        duration (so re-runs don't stack downtimes), or already lasts
+        until the end of the requested window.
+        """
+
+        if service is None:
+            downtimes = self.host_downtimes.get(host, [])
+        else:
+            downtimes = self.service_downtimes.get((host, service), [])
+
+        now = int(time.time())
+        for downtime in downtimes:
+            try:
+                start_time = int(downtime.get('start_time', 0))
+                end_time = int(downtime.get('end_time', 0))
+                downtime_duration = int(downtime.get('duration', 0))
+            except ValueError:
+                continue
+            if not start_time <= now <= end_time:
+                continue
+            if downtime.get('author') == author and downtime_duration >= duration:
+                return True
+            if end_time >= now + duration:
+                return True
+        return False
+
+    def notifications(self, host, service=None):
+        if service is None:
+            return self.host_notifications.get(host)
+        return self.service_notifications.get(host, {}).get(service)
+
+
 ######################################################################
 class Nagios(object):
     """
@@ -258,7 +520,7 @@ class Nagios(object):
         self.module = module
         self.action = kwargs['action']
         self.author = kwargs['author']
-        self.host = kwargs['host']
+        self.hosts = kwargs['host'] or []
         self.minutes = int(kwargs['minutes'])
         self.cmdfile = kwargs['cmdfile']
         self.command = kwargs['command']
@@ -268,8 +530,20 @@ class Nagios(object):
         else:
             self.services = kwargs['services'].split(',')
 
+        self.command_buffer = []
         self.command_results = []
 
+        # Without a readable status file every command is sent, as
+        # there is no way to tell whether it changes anything.
+        self.status = None
+        if self.action != 'command':
+            statusfile = which_statusfile()
+            if statusfile and os.path.exists(statusfile):
+                try:
+                    self.status = NagiosStatus(statusfile, self.hosts)
+                except IOError:
+                    pass
+
     def _now(self):
         """
         The time in seconds since 12:00:00AM Jan 1, 1970
@@ -279,16 +553,49 @@ class Nagios(object):
 
     def _write_command(self, cmd):
         """
-        Write the given command to the Nagios command file
+        Queue the given command for the Nagios command file
+
+        Commands are written by _flush_commands() once all of them
+        have been formatted.
+        """
+
+        self.command_buffer.append(cmd)
+        self.command_results.append(cmd.strip())
+
+    def _flush_commands(self):
+        """
+        Write all queued commands to the Nagios command file
+
+        The command file is opened once. Commands are grouped into
+        writes of at most PIPE_BUF bytes without splitting a command,
+        so every write to the FIFO is atomic and cannot interleave
+        with commands written by other processes.
         """
 
+        chunks = []
+        chunk = ''
+        for cmd in self.command_buffer:
+            if chunk and len(chunk) + len(cmd) > PIPE_BUF:
+                chunks.append(chunk)
+                chunk = ''
+            chunk += cmd
+        if chunk:
+            chunks.append(chunk)
+        self.command_buffer = []
+
+        if not chunks:
+            return
+
         try:
-            fp = open(self.cmdfile, 'w')
-            fp.write(cmd)
-            fp.flush()
-            fp.close()
-            self.command_results.append(cmd.strip())
-        except IOError:
+            fd = os.open(self.cmdfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            try:
+                for chunk in chunks:
+                    while chunk:
+                        written = os.write(fd, chunk)
+                        chunk = chunk[written:]
+            finally:
+                os.close(fd)
+        except (IOError, OSError):
             self.module.fail_json(msg='unable to write to nagios command file',
                                   cmdfile=self.cmdfile)
 
@@ -837,55 +1144,104 @@ class Nagios(object):
         Figure out what you want to do from ansible, and then do the
         needful (at the earliest).
         """
+        if self.action == 'silence_nagios':
+            if self.status is None or self.status.notifications_enabled is not False:
+                self.silence_nagios()
+
+        elif self.action == 'unsilence_nagios':
+            if self.status is None or self.status.notifications_enabled is not True:
+                self.unsilence_nagios()
+            
+        elif self.action == 'command':
+            self.nagios_cmd(self.command)
+
+        else:
+            for host in self.hosts:
+                self.act_on_host(host)
+
+        self._flush_commands()
+        self.module.exit_json(nagios_commands=self.command_results,
+                              changed=bool(self.command_results))
+
+    def act_on_host(self, host):
+        """
+        Queue the commands for an action that targets a host, leaving
+        out those the status file shows to be in effect already.
+        """
+        status = self.status
+        if status is not None and not status.knows_host(host):
+            status = None
+        duration = self.minutes * 60
+
         # host or service downtime?
         if self.action == 'downtime':
             if self.services == 'host':
-                self.schedule_host_downtime(self.host, self.minutes)
+                if status is None or not status.in_downtime(host, self.author, duration):
+                    self.schedule_host_downtime(host, self.minutes)
             elif self.services == 'all':
-                self.schedule_host_svc_downtime(self.host, self.minutes)
+                if status is None:
+                    self.schedule_host_svc_downtime(host, self.minutes)
+                else:
+                    # only the services not in downtime yet
+                    services = [x for x in status.services(host)
+                                if not status.in_downtime(host, self.author, duration, x)]
+                    self.schedule_svc_downtime(host,
+                                               services=services,
+                                               minutes=self.minutes)
             else:
-                self.schedule_svc_downtime(self.host,
-                                           services=self.services,
+                services = self.services
+                if status is not None:
+                    services = [x for x in services
+                                if not status.in_downtime(host, self.author, duration, x)]
+                self.schedule_svc_downtime(host,
+                                           services=services,
                                            minutes=self.minutes)
 
         # toggle the host AND service alerts
         elif self.action == 'silence':
-            self.silence_host(self.host)
+            if status is None:
+                self.silence_host(host)
+            else:
+                if [x for x in status.services(host) if status.notifications(host, x)]:
+                    self.disable_host_svc_notifications(host)
+                if status.notifications(host):
+                    self.disable_host_notifications(host)
 
         elif self.action == 'unsilence':
-            self.unsilence_host(self.host)
+            if status is None:
+                self.unsilence_host(host)
+            else:
+                if [x for x in status.services(host) if not status.notifications(host, x)]:
+                    self.enable_host_svc_notifications(host)
+                if not status.notifications(host):
+                    self.enable_host_notifications(host)
 
         # toggle host/svc alerts
         elif self.action == 'enable_alerts':
             if self.services == 'host':
-                self.enable_host_notifications(self.host)
+                if status is None or status.notifications(host) is not True:
+                    self.enable_host_notifications(host)
             else:
-                self.enable_svc_notifications(self.host,
-                                              services=self.services)
+                services = [x for x in self.services
+                            if status is None or status.notifications(host, x) is not True]
+                self.enable_svc_notifications(host,
+                                              services=services)
 
         elif self.action == 'disable_alerts':
             if self.services == 'host':
-                self.disable_host_notifications(self.host)
+                if status is None or status.notifications(host) is not False:
+                    self.disable_host_notifications(host)
             else:
-                self.disable_svc_notifications(self.host,
-                                               services=self.services)
-        elif self.action == 'silence_nagios':
-            self.silence_nagios()
-            
-        elif self.action == 'unsilence_nagios':
-            self.unsilence_nagios()
-            
-        elif self.action == 'command':
-            self.nagios_cmd(self.command)
-            
+                services = [x for x in self.services
+                            if status is None or status.notifications(host, x) is not False]
+                self.disable_svc_notifications(host,
+                                               services=services)
+
         # wtf?
         else:
             self.module.fail_json(msg="unknown action specified: '%s'" % \
                                       self.action)
 
-        self.module.exit_json(nagios_commands=self.command_results,
-                              changed=True)
-
 ######################################################################
 # import module snippets
 from ansible.module_utils.basic import *
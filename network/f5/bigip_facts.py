@@ -64,6 +64,14 @@ options:
         default: 'yes'
         choices: ['yes', 'no']
         version_added: 2.0
+    wsdl_cache:
+        description:
+            - Directory in which iControl WSDLs are cached between runs, so
+              they are not downloaded and parsed again by every task. Set to
+              an empty string to disable caching.
+        required: false
+        default: ~/.ansible/cache/bigsuds
+        version_added: 2.0
     session:
         description:
             - BIG-IP session support; may be useful to avoid concurrency
@@ -86,10 +94,67 @@ options:
         description:
             - Shell-style glob matching string used to filter fact keys. Not
               applicable for software and system_info fact categories.
+            - A filter starting with a folder path, such as C(/Prod/*), must
+              match from the start of the key, and only that folder and its
+              subfolders are queried.
+        required: false
+        default: null
+        choices: []
+        aliases: []
+    max_connections:
+        description:
+            - Maximum number of iControl connections used to collect facts.
+              When greater than 1, fact categories and the fields within each
+              category are fetched in parallel, and every connection uses its
+              own BIG-IP session. The time spent on each category is returned
+              in C(timing).
+        required: false
+        default: 1
+        choices: []
+        aliases: []
+        version_added: 2.0
+    chunk_size:
+        description:
+            - Maximum number of objects passed to a single iControl request.
+              Large object lists are fetched in chunks of this size to keep
+              SOAP messages small. Use 0 to fetch each list in one request.
+        required: false
+        default: 1000
+        choices: []
+        aliases: []
+        version_added: 2.0
+    fields:
+        description:
+            - Dictionary mapping fact categories to the list of fields to
+              collect for them. Only the requested fields are fetched, one
+              iControl call per field. Categories not listed are collected
+              with all their fields. Not applicable for certificate, key and
+              software fact categories.
         required: false
         default: null
         choices: []
         aliases: []
+        version_added: 2.0
+    cache_ttl:
+        description:
+            - Number of seconds collected fact categories are cached on the
+              control machine, per server and user. iControl exposes no
+              modification time for configuration objects, so the cache is
+              time based only and changes made on the device within that
+              time are not seen. Use 0 to disable the cache.
+        required: false
+        default: 0
+        choices: []
+        aliases: []
+        version_added: 2.0
+    cache_dir:
+        description:
+            - Directory holding the fact cache.
+        required: false
+        default: ~/.ansible/cache/bigip_facts
+        choices: []
+        aliases: []
+        version_added: 2.0
 '''
 
 EXAMPLES = '''
@@ -109,6 +174,25 @@ EXAMPLES = '''
       password=mysecret
       include=interface,vlan
 
+  - name: Collect virtual server and pool facts over 8 connections
+    local_action: >
+      bigip_facts
+      server=lb.mydomain.com
+      user=admin
+      password=mysecret
+      include=virtual_server,pool
+      max_connections=8
+
+  - name: Collect only the destination and default pool of virtual servers
+    local_action:
+      module: bigip_facts
+      server: lb.mydomain.com
+      user: admin
+      password: mysecret
+      include: virtual_server
+      fields:
+        virtual_server: [destination, default_pool_name]
+
 '''
 
 try:
@@ -119,7 +203,17 @@ except ImportError:
 else:
     bigsuds_found = True
 
+import collections
+import copy
 import fnmatch
+import hashlib
+import json
+import os
+import Queue
+import sys
+import tempfile
+import threading
+import time
 import traceback
 import re
 
@@ -136,8 +230,16 @@ class F5(object):
         api: iControl API instance.
     """
 
-    def __init__(self, host, user, password, session=False):
-        self.api = bigsuds.BIGIP(hostname=host, username=user, password=password)
+    def __init__(self, host, user, password, session=False, cachedir=None):
+        if cachedir:
+            cachedir = os.path.expanduser(cachedir)
+        else:
+            cachedir = None
+        self.api = bigsuds.BIGIP(hostname=host, username=user, password=password,
+                                 cachedir=cachedir)
+        self.folder = "/"
+        self.saved_active_folder = None
+        self.saved_recursive_query_state = None
         if session:
             self.start_session()
 
@@ -165,6 +267,27 @@ class F5(object):
     def get_active_folder(self):
         return self.api.System.Session.get_active_folder()
 
+    def enable_folder_query_state(self, folder="/"):
+        """Query from the given folder with recursion enabled.
+
+        The previous active folder and recursive query state are saved so
+        restore_query_state() can put them back.
+        """
+        self.folder = folder
+        self.saved_active_folder = self.get_active_folder()
+        self.saved_recursive_query_state = self.get_recursive_query_state()
+        if self.saved_active_folder != folder:
+            self.set_active_folder(folder)
+        if self.saved_recursive_query_state != "STATE_ENABLED":
+            self.enable_recursive_query_state()
+
+    def restore_query_state(self):
+        if self.saved_active_folder and self.saved_active_folder != self.folder:
+            self.set_active_folder(self.saved_active_folder)
+        if self.saved_recursive_query_state and \
+           self.saved_recursive_query_state != "STATE_ENABLED":
+            self.set_recursive_query_state(self.saved_recursive_query_state)
+
 
 class Interfaces(object):
     """Interfaces class.
@@ -180,12 +303,14 @@ class Interfaces(object):
         self.api = api
         self.interfaces = api.Networking.Interfaces.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.interfaces = filter(re_filter.search, self.interfaces)
+            self.interfaces = filter(regex.search, self.interfaces)
 
     def get_list(self):
         return self.interfaces
 
+    def set_list(self, interfaces):
+        self.interfaces = interfaces
+
     def get_active_media(self):
         return self.api.Networking.Interfaces.get_active_media(self.interfaces)
 
@@ -285,12 +410,14 @@ class SelfIPs(object):
         self.api = api
         self.self_ips = api.Networking.SelfIPV2.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.self_ips = filter(re_filter.search, self.self_ips)
+            self.self_ips = filter(regex.search, self.self_ips)
 
     def get_list(self):
         return self.self_ips
 
+    def set_list(self, self_ips):
+        self.self_ips = self_ips
+
     def get_address(self):
         return self.api.Networking.SelfIPV2.get_address(self.self_ips)
 
@@ -339,12 +466,14 @@ class Trunks(object):
         self.api = api
         self.trunks = api.Networking.Trunk.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.trunks = filter(re_filter.search, self.trunks)
+            self.trunks = filter(regex.search, self.trunks)
 
     def get_list(self):
         return self.trunks
 
+    def set_list(self, trunks):
+        self.trunks = trunks
+
     def get_active_lacp_state(self):
         return self.api.Networking.Trunk.get_active_lacp_state(self.trunks)
 
@@ -399,12 +528,14 @@ class Vlans(object):
         self.api = api
         self.vlans = api.Networking.VLAN.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.vlans = filter(re_filter.search, self.vlans)
+            self.vlans = filter(regex.search, self.vlans)
 
     def get_list(self):
         return self.vlans
 
+    def set_list(self, vlans):
+        self.vlans = vlans
+
     def get_auto_lasthop(self):
         return self.api.Networking.VLAN.get_auto_lasthop(self.vlans)
 
@@ -493,12 +624,14 @@ class VirtualServers(object):
         self.api = api
         self.virtual_servers = api.LocalLB.VirtualServer.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.virtual_servers = filter(re_filter.search, self.virtual_servers)
+            self.virtual_servers = filter(regex.search, self.virtual_servers)
 
     def get_list(self):
         return self.virtual_servers
 
+    def set_list(self, virtual_servers):
+        self.virtual_servers = virtual_servers
+
     def get_actual_hardware_acceleration(self):
         return self.api.LocalLB.VirtualServer.get_actual_hardware_acceleration(self.virtual_servers)
 
@@ -643,12 +776,14 @@ class Pools(object):
         self.api = api
         self.pool_names = api.LocalLB.Pool.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.pool_names = filter(re_filter.search, self.pool_names)
+            self.pool_names = filter(regex.search, self.pool_names)
 
     def get_list(self):
         return self.pool_names
 
+    def set_list(self, pool_names):
+        self.pool_names = pool_names
+
     def get_action_on_service_down(self):
         return self.api.LocalLB.Pool.get_action_on_service_down(self.pool_names)
 
@@ -748,12 +883,14 @@ class Devices(object):
         self.api = api
         self.devices = api.Management.Device.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.devices = filter(re_filter.search, self.devices)
+            self.devices = filter(regex.search, self.devices)
 
     def get_list(self):
         return self.devices
 
+    def set_list(self, devices):
+        self.devices = devices
+
     def get_active_modules(self):
         return self.api.Management.Device.get_active_modules(self.devices)
 
@@ -853,12 +990,14 @@ class DeviceGroups(object):
         self.api = api
         self.device_groups = api.Management.DeviceGroup.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.device_groups = filter(re_filter.search, self.device_groups)
+            self.device_groups = filter(regex.search, self.device_groups)
 
     def get_list(self):
         return self.device_groups
 
+    def set_list(self, device_groups):
+        self.device_groups = device_groups
+
     def get_all_preferred_active(self):
         return self.api.Management.DeviceGroup.get_all_preferred_active(self.device_groups)
 
@@ -901,12 +1040,14 @@ class TrafficGroups(object):
         self.api = api
         self.traffic_groups = api.Management.TrafficGroup.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.traffic_groups = filter(re_filter.search, self.traffic_groups)
+            self.traffic_groups = filter(regex.search, self.traffic_groups)
 
     def get_list(self):
         return self.traffic_groups
 
+    def set_list(self, traffic_groups):
+        self.traffic_groups = traffic_groups
+
     def get_auto_failback_enabled_state(self):
         return self.api.Management.TrafficGroup.get_auto_failback_enabled_state(self.traffic_groups)
 
@@ -949,12 +1090,14 @@ class Rules(object):
         self.api = api
         self.rules = api.LocalLB.Rule.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.traffic_groups = filter(re_filter.search, self.rules)
+            self.rules = filter(regex.search, self.rules)
 
     def get_list(self):
         return self.rules
 
+    def set_list(self, rules):
+        self.rules = rules
+
     def get_description(self):
         return self.api.LocalLB.Rule.get_description(rule_names=self.rules)
 
@@ -981,12 +1124,14 @@ class Nodes(object):
         self.api = api
         self.nodes = api.LocalLB.NodeAddressV2.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.nodes = filter(re_filter.search, self.nodes)
+            self.nodes = filter(regex.search, self.nodes)
 
     def get_list(self):
         return self.nodes
 
+    def set_list(self, nodes):
+        self.nodes = nodes
+
     def get_address(self):
         return self.api.LocalLB.NodeAddressV2.get_address(nodes=self.nodes)
 
@@ -1035,12 +1180,14 @@ class VirtualAddresses(object):
         self.api = api
         self.virtual_addresses = api.LocalLB.VirtualAddressV2.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.virtual_addresses = filter(re_filter.search, self.virtual_addresses)
+            self.virtual_addresses = filter(regex.search, self.virtual_addresses)
 
     def get_list(self):
         return self.virtual_addresses
 
+    def set_list(self, virtual_addresses):
+        self.virtual_addresses = virtual_addresses
+
     def get_address(self):
         return self.api.LocalLB.VirtualAddressV2.get_address(self.virtual_addresses)
 
@@ -1092,12 +1239,14 @@ class AddressClasses(object):
         self.api = api
         self.address_classes = api.LocalLB.Class.get_address_class_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.address_classes = filter(re_filter.search, self.address_classes)
+            self.address_classes = filter(regex.search, self.address_classes)
 
     def get_list(self):
         return self.address_classes
 
+    def set_list(self, address_classes):
+        self.address_classes = address_classes
+
     def get_address_class(self):
         key = self.api.LocalLB.Class.get_address_class(self.address_classes)
         value = self.api.LocalLB.Class.get_address_class_member_data_value(key)
@@ -1124,9 +1273,9 @@ class Certificates(object):
         self.certificate_list = api.Management.KeyCertificate.get_certificate_list(mode=mode)
         self.certificates = [x['certificate']['cert_info']['id'] for x in self.certificate_list]
         if regex:
-            re_filter = re.compile(regex)
-            self.certificates = filter(re_filter.search, self.certificates)
-            self.certificate_list = [x for x in self.certificate_list if x['certificate']['cert_info']['id'] in self.certificates]
+            self.certificates = filter(regex.search, self.certificates)
+            certificates = set(self.certificates)
+            self.certificate_list = [x for x in self.certificate_list if x['certificate']['cert_info']['id'] in certificates]
 
     def get_list(self):
         return self.certificates
@@ -1151,9 +1300,9 @@ class Keys(object):
         self.key_list = api.Management.KeyCertificate.get_key_list(mode=mode)
         self.keys = [x['key_info']['id'] for x in self.key_list]
         if regex:
-            re_filter = re.compile(regex)
-            self.keys = filter(re_filter.search, self.keys)
-            self.key_list = [x for x in self.key_list if x['key_info']['id'] in self.keys]
+            self.keys = filter(regex.search, self.keys)
+            keys = set(self.keys)
+            self.key_list = [x for x in self.key_list if x['key_info']['id'] in keys]
 
     def get_list(self):
         return self.keys
@@ -1176,12 +1325,14 @@ class ProfileClientSSL(object):
         self.api = api
         self.profiles = api.LocalLB.ProfileClientSSL.get_list()
         if regex:
-            re_filter = re.compile(regex)
-            self.profiles = filter(re_filter.search, self.profiles)
+            self.profiles = filter(regex.search, self.profiles)
 
     def get_list(self):
         return self.profiles
 
+    def set_list(self, profiles):
+        self.profiles = profiles
+
     def get_alert_timeout(self):
         return self.api.LocalLB.ProfileClientSSL.get_alert_timeout(self.profiles)
 
@@ -1364,215 +1515,501 @@ class SystemInfo(object):
         return self.api.System.SystemInfo.get_uptime()
 
 
-def generate_dict(api_obj, fields):
+class Job(object):
+    """Job class.
+
+    Unit of work executed by a SessionPool worker.
+
+    Attributes:
+        func: Callable invoked with the worker's F5 instance and args.
+        args: Extra positional arguments for func.
+        start: Time the job started running.
+        end: Time the job finished running.
+    """
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.start = None
+        self.end = None
+        self.result = None
+        self.exc_info = None
+        self.done = threading.Event()
+
+    def run(self, f5):
+        self.start = time.time()
+        try:
+            self.result = self.func(f5, *self.args)
+        except Exception:
+            self.exc_info = sys.exc_info()
+        self.end = time.time()
+        self.done.set()
+
+    def fail(self, exc_info):
+        self.start = self.end = time.time()
+        self.exc_info = exc_info
+        self.done.set()
+
+    def get(self):
+        self.done.wait()
+        if self.exc_info:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+
+class SessionPool(object):
+    """iControl session pool class.
+
+    Bounded pool of worker threads, each owning its own F5 connection.
+    Connections are opened lazily, so no more sessions are created than
+    there are jobs to run.
+
+    Attributes:
+        size: Maximum number of concurrent connections.
+        session: Whether connections use BIG-IP sessions.
+        folder: Folder queried recursively by every connection.
+        cachedir: Directory in which iControl WSDLs are cached.
+    """
+
+    def __init__(self, host, user, password, size=1, session=False,
+                 folder="/", cachedir=None):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.folder = folder
+        self.cachedir = cachedir
+        self.size = max(1, size)
+        # Query state (active folder, recursion) must not be shared
+        # between concurrent connections.
+        self.session = session or self.size > 1
+        self.jobs = Queue.Queue()
+        self.errors = []
+        self.workers = []
+        for i in range(self.size):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def _connect(self):
+        f5 = F5(self.host, self.user, self.password, self.session,
+                self.cachedir)
+        f5.enable_folder_query_state(self.folder)
+        return f5
+
+    def _work(self):
+        f5 = None
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            if f5 is None:
+                try:
+                    f5 = self._connect()
+                except Exception:
+                    job.fail(sys.exc_info())
+                    continue
+            job.run(f5)
+        if f5 is not None:
+            try:
+                f5.restore_query_state()
+            except Exception, e:
+                self.errors.append(e)
+
+    def submit(self, func, *args):
+        job = Job(func, args)
+        self.jobs.put(job)
+        return job
+
+    def close(self):
+        for worker in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join()
+        if self.errors:
+            raise self.errors[0]
+
+
+def generate_dict(api_obj, fields, responses):
     result_dict = {}
     lists = []
     supported_fields = []
-    if api_obj.get_list():
-        for field in fields:
-            try:
-                api_response = getattr(api_obj, "get_" + field)()
-            except (MethodNotFound, WebFault):
-                pass
-            else:
-                lists.append(api_response)
-                supported_fields.append(field)
-        for i, j in enumerate(api_obj.get_list()):
-            temp = {}
-            temp.update([(item[0], item[1][i]) for item in zip(supported_fields, lists)])
-            result_dict[j] = temp
+    for field, (supported, api_response) in zip(fields, responses):
+        if supported:
+            lists.append(api_response)
+            supported_fields.append(field)
+    for i, j in enumerate(api_obj.get_list()):
+        temp = {}
+        temp.update([(item[0], item[1][i]) for item in zip(supported_fields, lists)])
+        result_dict[j] = temp
     return result_dict
 
-def generate_simple_dict(api_obj, fields):
+def generate_simple_dict(api_obj, fields, responses):
     result_dict = {}
-    for field in fields:
-        try:
-            api_response = getattr(api_obj, "get_" + field)()
-        except (MethodNotFound, WebFault):
-            pass
-        else:
+    for field, (supported, api_response) in zip(fields, responses):
+        if supported:
             result_dict[field] = api_response
     return result_dict
 
-def generate_interface_dict(f5, regex):
-    interfaces = Interfaces(f5.get_api(), regex)
-    fields = ['active_media', 'actual_flow_control', 'bundle_state',
-              'description', 'dual_media_state', 'enabled_state', 'if_index',
-              'learning_mode', 'lldp_admin_status', 'lldp_tlvmap',
-              'mac_address', 'media', 'media_option', 'media_option_sfp',
-              'media_sfp', 'media_speed', 'media_status', 'mtu',
-              'phy_master_slave_mode', 'prefer_sfp_state', 'flow_control',
-              'sflow_poll_interval', 'sflow_poll_interval_global',
-              'sfp_media_state', 'stp_active_edge_port_state',
-              'stp_enabled_state', 'stp_link_type',
-              'stp_protocol_detection_reset_state']
-    return generate_dict(interfaces, fields)
-
-def generate_self_ip_dict(f5, regex):
-    self_ips = SelfIPs(f5.get_api(), regex)
-    fields = ['address', 'allow_access_list', 'description',
-              'enforced_firewall_policy', 'floating_state', 'fw_rule',
-              'netmask', 'staged_firewall_policy', 'traffic_group',
-              'vlan', 'is_traffic_group_inherited']
-    return generate_dict(self_ips, fields)
-
-def generate_trunk_dict(f5, regex):
-    trunks = Trunks(f5.get_api(), regex)
-    fields = ['active_lacp_state', 'configured_member_count', 'description',
-              'distribution_hash_option', 'interface', 'lacp_enabled_state',
-              'lacp_timeout_option', 'link_selection_policy', 'media_speed',
-              'media_status', 'operational_member_count', 'stp_enabled_state',
-              'stp_protocol_detection_reset_state']
-    return generate_dict(trunks, fields)
-
-def generate_vlan_dict(f5, regex):
-    vlans = Vlans(f5.get_api(), regex)
-    fields = ['auto_lasthop', 'cmp_hash_algorithm', 'description',
-              'dynamic_forwarding', 'failsafe_action', 'failsafe_state',
-              'failsafe_timeout', 'if_index', 'learning_mode',
-              'mac_masquerade_address', 'member', 'mtu',
-              'sflow_poll_interval', 'sflow_poll_interval_global',
-              'sflow_sampling_rate', 'sflow_sampling_rate_global',
-              'source_check_state', 'true_mac_address', 'vlan_id']
-    return generate_dict(vlans, fields)
-
-def generate_vs_dict(f5, regex):
-    virtual_servers = VirtualServers(f5.get_api(), regex)
-    fields = ['actual_hardware_acceleration', 'authentication_profile',
-              'auto_lasthop', 'bw_controller_policy', 'clone_pool',
-              'cmp_enable_mode', 'connection_limit', 'connection_mirror_state',
-              'default_pool_name', 'description', 'destination',
-              'enabled_state', 'enforced_firewall_policy',
-              'fallback_persistence_profile', 'fw_rule', 'gtm_score',
-              'last_hop_pool', 'nat64_state', 'object_status',
-              'persistence_profile', 'profile', 'protocol',
-              'rate_class', 'rate_limit', 'rate_limit_destination_mask',
-              'rate_limit_mode', 'rate_limit_source_mask', 'related_rule',
-              'rule', 'security_log_profile', 'snat_pool', 'snat_type',
-              'source_address', 'source_address_translation_lsn_pool',
-              'source_address_translation_snat_pool',
-              'source_address_translation_type', 'source_port_behavior',
-              'staged_firewall_policy', 'translate_address_state',
-              'translate_port_state', 'type', 'vlan', 'wildmask']
-    return generate_dict(virtual_servers, fields)
-
-def generate_pool_dict(f5, regex):
-    pools = Pools(f5.get_api(), regex)
-    fields = ['action_on_service_down', 'active_member_count',
-              'aggregate_dynamic_ratio', 'allow_nat_state',
-              'allow_snat_state', 'client_ip_tos', 'client_link_qos',
-              'description', 'gateway_failsafe_device',
-              'ignore_persisted_weight_state', 'lb_method', 'member',
-              'minimum_active_member', 'minimum_up_member',
-              'minimum_up_member_action', 'minimum_up_member_enabled_state',
-              'monitor_association', 'monitor_instance', 'object_status',
-              'profile', 'queue_depth_limit',
-              'queue_on_connection_limit_state', 'queue_time_limit',
-              'reselect_tries', 'server_ip_tos', 'server_link_qos',
-              'simple_timeout', 'slow_ramp_time']
-    return generate_dict(pools, fields)
-
-def generate_device_dict(f5, regex):
-    devices = Devices(f5.get_api(), regex)
-    fields = ['active_modules', 'base_mac_address', 'blade_addresses',
-              'build', 'chassis_id', 'chassis_type', 'comment',
-              'configsync_address', 'contact', 'description', 'edition',
-              'failover_state', 'hostname', 'inactive_modules', 'location',
-              'management_address', 'marketing_name', 'multicast_address',
-              'optional_modules', 'platform_id', 'primary_mirror_address',
-              'product', 'secondary_mirror_address', 'software_version',
-              'timelimited_modules', 'timezone', 'unicast_addresses']
-    return generate_dict(devices, fields)
-
-def generate_device_group_dict(f5, regex):
-    device_groups = DeviceGroups(f5.get_api(), regex)
-    fields = ['all_preferred_active', 'autosync_enabled_state','description',
-              'device', 'full_load_on_sync_state',
-              'incremental_config_sync_size_maximum',
-              'network_failover_enabled_state', 'sync_status', 'type']
-    return generate_dict(device_groups, fields)
-
-def generate_traffic_group_dict(f5, regex):
-    traffic_groups = TrafficGroups(f5.get_api(), regex)
-    fields = ['auto_failback_enabled_state', 'auto_failback_time',
-              'default_device', 'description', 'ha_load_factor',
-              'ha_order', 'is_floating', 'mac_masquerade_address',
-              'unit_id']
-    return generate_dict(traffic_groups, fields)
-
-def generate_rule_dict(f5, regex):
-    rules = Rules(f5.get_api(), regex)
-    fields = ['definition', 'description', 'ignore_vertification',
-              'verification_status']
-    return generate_dict(rules, fields)
-
-def generate_node_dict(f5, regex):
-    nodes = Nodes(f5.get_api(), regex)
-    fields = ['address', 'connection_limit', 'description', 'dynamic_ratio',
-              'monitor_instance', 'monitor_rule', 'monitor_status',
-              'object_status', 'rate_limit', 'ratio', 'session_status']
-    return generate_dict(nodes, fields)
-
-def generate_virtual_address_dict(f5, regex):
-    virtual_addresses = VirtualAddresses(f5.get_api(), regex)
-    fields = ['address', 'arp_state', 'auto_delete_state', 'connection_limit',
-              'description', 'enabled_state', 'icmp_echo_state',
-              'is_floating_state', 'netmask', 'object_status',
-              'route_advertisement_state', 'traffic_group']
-    return generate_dict(virtual_addresses, fields)
-
-def generate_address_class_dict(f5, regex):
-    address_classes = AddressClasses(f5.get_api(), regex)
-    fields = ['address_class', 'description']
-    return generate_dict(address_classes, fields)
-
-def generate_certificate_dict(f5, regex):
-    certificates = Certificates(f5.get_api(), regex)
+def generate_certificate_dict(certificates):
     return dict(zip(certificates.get_list(), certificates.get_certificate_list()))
 
-def generate_key_dict(f5, regex):
-    keys = Keys(f5.get_api(), regex)
+def generate_key_dict(keys):
     return dict(zip(keys.get_list(), keys.get_key_list()))
 
-def generate_client_ssl_profile_dict(f5, regex):
-    profiles = ProfileClientSSL(f5.get_api(), regex)
-    fields = ['alert_timeout', 'allow_nonssl_state', 'authenticate_depth',
-              'authenticate_once_state', 'ca_file', 'cache_size',
-              'cache_timeout', 'certificate_file', 'chain_file',
-              'cipher_list', 'client_certificate_ca_file', 'crl_file',
-              'default_profile', 'description',
-              'forward_proxy_ca_certificate_file', 'forward_proxy_ca_key_file',
-              'forward_proxy_ca_passphrase',
-              'forward_proxy_certificate_extension_include',
-              'forward_proxy_certificate_lifespan',
-              'forward_proxy_enabled_state',
-              'forward_proxy_lookup_by_ipaddr_port_state', 'handshake_timeout',
-              'key_file', 'modssl_emulation_state', 'passphrase',
-              'peer_certification_mode', 'profile_mode',
-              'renegotiation_maximum_record_delay', 'renegotiation_period',
-              'renegotiation_state', 'renegotiation_throughput',
-              'retain_certificate_state', 'secure_renegotiation_mode',
-              'server_name', 'session_ticket_state', 'sni_default_state',
-              'sni_require_state', 'ssl_option', 'strict_resume_state',
-              'unclean_shutdown_state', 'is_base_profile', 'is_system_profile']
-    return generate_dict(profiles, fields)
-
-def generate_system_info_dict(f5):
-    system_info = SystemInfo(f5.get_api())
-    fields = ['base_mac_address',
-              'blade_temperature', 'chassis_slot_information',
-              'globally_unique_identifier', 'group_id',
-              'hardware_information',
-              'marketing_name',
-              'product_information', 'pva_version', 'system_id',
-              'system_information', 'time',
-              'time_zone', 'uptime']
-    return generate_simple_dict(system_info, fields)
-
-def generate_software_list(f5):
-    software = Software(f5.get_api())
-    software_list = software.get_all_software_status()
-    return software_list
+def generate_software_list(software):
+    return software.get_all_software_status()
+
+INTERFACE_FIELDS = ['active_media', 'actual_flow_control', 'bundle_state',
+                    'description', 'dual_media_state', 'enabled_state',
+                    'if_index', 'learning_mode', 'lldp_admin_status',
+                    'lldp_tlvmap', 'mac_address', 'media', 'media_option',
+                    'media_option_sfp', 'media_sfp', 'media_speed',
+                    'media_status', 'mtu', 'phy_master_slave_mode',
+                    'prefer_sfp_state', 'flow_control',
+                    'sflow_poll_interval', 'sflow_poll_interval_global',
+                    'sfp_media_state', 'stp_active_edge_port_state',
+                    'stp_enabled_state', 'stp_link_type',
+                    'stp_protocol_detection_reset_state']
+
+SELF_IP_FIELDS = ['address', 'allow_access_list', 'description',
+                  'enforced_firewall_policy', 'floating_state', 'fw_rule',
+                  'netmask', 'staged_firewall_policy', 'traffic_group',
+                  'vlan', 'is_traffic_group_inherited']
+
+TRUNK_FIELDS = ['active_lacp_state', 'configured_member_count', 'description',
+                'distribution_hash_option', 'interface', 'lacp_enabled_state',
+                'lacp_timeout_option', 'link_selection_policy', 'media_speed',
+                'media_status', 'operational_member_count',
+                'stp_enabled_state', 'stp_protocol_detection_reset_state']
+
+VLAN_FIELDS = ['auto_lasthop', 'cmp_hash_algorithm', 'description',
+               'dynamic_forwarding', 'failsafe_action', 'failsafe_state',
+               'failsafe_timeout', 'if_index', 'learning_mode',
+               'mac_masquerade_address', 'member', 'mtu',
+               'sflow_poll_interval', 'sflow_poll_interval_global',
+               'sflow_sampling_rate', 'sflow_sampling_rate_global',
+               'source_check_state', 'true_mac_address', 'vlan_id']
+
+VIRTUAL_SERVER_FIELDS = ['actual_hardware_acceleration',
+                         'authentication_profile', 'auto_lasthop',
+                         'bw_controller_policy', 'clone_pool',
+                         'cmp_enable_mode', 'connection_limit',
+                         'connection_mirror_state', 'default_pool_name',
+                         'description', 'destination', 'enabled_state',
+                         'enforced_firewall_policy',
+                         'fallback_persistence_profile', 'fw_rule',
+                         'gtm_score', 'last_hop_pool', 'nat64_state',
+                         'object_status', 'persistence_profile', 'profile',
+                         'protocol', 'rate_class', 'rate_limit',
+                         'rate_limit_destination_mask', 'rate_limit_mode',
+                         'rate_limit_source_mask', 'related_rule', 'rule',
+                         'security_log_profile', 'snat_pool', 'snat_type',
+                         'source_address',
+                         'source_address_translation_lsn_pool',
+                         'source_address_translation_snat_pool',
+                         'source_address_translation_type',
+                         'source_port_behavior', 'staged_firewall_policy',
+                         'translate_address_state', 'translate_port_state',
+                         'type', 'vlan', 'wildmask']
+
+POOL_FIELDS = ['action_on_service_down', 'active_member_count',
+               'aggregate_dynamic_ratio', 'allow_nat_state',
+               'allow_snat_state', 'client_ip_tos', 'client_link_qos',
+               'description', 'gateway_failsafe_device',
+               'ignore_persisted_weight_state', 'lb_method', 'member',
+               'minimum_active_member', 'minimum_up_member',
+               'minimum_up_member_action', 'minimum_up_member_enabled_state',
+               'monitor_association', 'monitor_instance', 'object_status',
+               'profile', 'queue_depth_limit',
+               'queue_on_connection_limit_state', 'queue_time_limit',
+               'reselect_tries', 'server_ip_tos', 'server_link_qos',
+               'simple_timeout', 'slow_ramp_time']
+
+DEVICE_FIELDS = ['active_modules', 'base_mac_address', 'blade_addresses',
+                 'build', 'chassis_id', 'chassis_type', 'comment',
+                 'configsync_address', 'contact', 'description', 'edition',
+                 'failover_state', 'hostname', 'inactive_modules', 'location',
+                 'management_address', 'marketing_name', 'multicast_address',
+                 'optional_modules', 'platform_id', 'primary_mirror_address',
+                 'product', 'secondary_mirror_address', 'software_version',
+                 'timelimited_modules', 'timezone', 'unicast_addresses']
+
+DEVICE_GROUP_FIELDS = ['all_preferred_active', 'autosync_enabled_state',
+                       'description', 'device', 'full_load_on_sync_state',
+                       'incremental_config_sync_size_maximum',
+                       'network_failover_enabled_state', 'sync_status',
+                       'type']
+
+TRAFFIC_GROUP_FIELDS = ['auto_failback_enabled_state', 'auto_failback_time',
+                        'default_device', 'description', 'ha_load_factor',
+                        'ha_order', 'is_floating', 'mac_masquerade_address',
+                        'unit_id']
+
+RULE_FIELDS = ['definition', 'description', 'ignore_vertification',
+               'verification_status']
+
+NODE_FIELDS = ['address', 'connection_limit', 'description', 'dynamic_ratio',
+               'monitor_instance', 'monitor_rule', 'monitor_status',
+               'object_status', 'rate_limit', 'ratio', 'session_status']
+
+VIRTUAL_ADDRESS_FIELDS = ['address', 'arp_state', 'auto_delete_state',
+                          'connection_limit', 'description', 'enabled_state',
+                          'icmp_echo_state', 'is_floating_state', 'netmask',
+                          'object_status', 'route_advertisement_state',
+                          'traffic_group']
+
+ADDRESS_CLASS_FIELDS = ['address_class', 'description']
+
+CLIENT_SSL_PROFILE_FIELDS = ['alert_timeout', 'allow_nonssl_state',
+                             'authenticate_depth', 'authenticate_once_state',
+                             'ca_file', 'cache_size', 'cache_timeout',
+                             'certificate_file', 'chain_file', 'cipher_list',
+                             'client_certificate_ca_file', 'crl_file',
+                             'default_profile', 'description',
+                             'forward_proxy_ca_certificate_file',
+                             'forward_proxy_ca_key_file',
+                             'forward_proxy_ca_passphrase',
+                             'forward_proxy_certificate_extension_include',
+                             'forward_proxy_certificate_lifespan',
+                             'forward_proxy_enabled_state',
+                             'forward_proxy_lookup_by_ipaddr_port_state',
+                             'handshake_timeout', 'key_file',
+                             'modssl_emulation_state', 'passphrase',
+                             'peer_certification_mode', 'profile_mode',
+                             'renegotiation_maximum_record_delay',
+                             'renegotiation_period', 'renegotiation_state',
+                             'renegotiation_throughput',
+                             'retain_certificate_state',
+                             'secure_renegotiation_mode', 'server_name',
+                             'session_ticket_state', 'sni_default_state',
+                             'sni_require_state', 'ssl_option',
+                             'strict_resume_state', 'unclean_shutdown_state',
+                             'is_base_profile', 'is_system_profile']
+
+SYSTEM_INFO_FIELDS = ['base_mac_address', 'blade_temperature',
+                      'chassis_slot_information',
+                      'globally_unique_identifier', 'group_id',
+                      'hardware_information', 'marketing_name',
+                      'product_information', 'pva_version', 'system_id',
+                      'system_information', 'time', 'time_zone', 'uptime']
+
+# Fact category name -> (category class, fields, generator).  Categories
+# with fields are fetched one field getter at a time and assembled by the
+# generator; the others are rendered by the generator straight from the
+# category object.
+FACT_CATEGORIES = {
+    'address_class': (AddressClasses, ADDRESS_CLASS_FIELDS, generate_dict),
+    'certificate': (Certificates, None, generate_certificate_dict),
+    'client_ssl_profile': (ProfileClientSSL, CLIENT_SSL_PROFILE_FIELDS, generate_dict),
+    'device': (Devices, DEVICE_FIELDS, generate_dict),
+    'device_group': (DeviceGroups, DEVICE_GROUP_FIELDS, generate_dict),
+    'interface': (Interfaces, INTERFACE_FIELDS, generate_dict),
+    'key': (Keys, None, generate_key_dict),
+    'node': (Nodes, NODE_FIELDS, generate_dict),
+    'pool': (Pools, POOL_FIELDS, generate_dict),
+    'rule': (Rules, RULE_FIELDS, generate_dict),
+    'self_ip': (SelfIPs, SELF_IP_FIELDS, generate_dict),
+    'software': (Software, None, generate_software_list),
+    'system_info': (SystemInfo, SYSTEM_INFO_FIELDS, generate_simple_dict),
+    'traffic_group': (TrafficGroups, TRAFFIC_GROUP_FIELDS, generate_dict),
+    'trunk': (Trunks, TRUNK_FIELDS, generate_dict),
+    'virtual_address': (VirtualAddresses, VIRTUAL_ADDRESS_FIELDS, generate_dict),
+    'virtual_server': (VirtualServers, VIRTUAL_SERVER_FIELDS, generate_dict),
+    'vlan': (Vlans, VLAN_FIELDS, generate_dict),
+}
+
+# Categories that are not keyed by object name and so cannot be filtered.
+UNFILTERED_CATEGORIES = ('software', 'system_info')
+
+def filter_folder(fact_filter):
+    """Return the folder a filter is confined to.
+
+    A filter starting with a path such as /Prod/app/web* can only match
+    objects below /Prod/app, so listing can start there instead of
+    recursing over every partition from /.
+    """
+    if not fact_filter or not fact_filter.startswith("/"):
+        return "/"
+    folders = []
+    for part in fact_filter.split("/")[1:-1]:
+        if re.search(r"[*?\[]", part):
+            break
+        folders.append(part)
+    return "/" + "/".join(folders)
+
+def load_category(f5, category, regex):
+    cls, fields, generator = FACT_CATEGORIES[category]
+    if category in UNFILTERED_CATEGORIES:
+        api_obj = cls(f5.get_api())
+    else:
+        api_obj = cls(f5.get_api(), regex)
+    if fields is None:
+        return generator(api_obj)
+    return api_obj
+
+def split_list(api_obj, chunk_size):
+    """Yield copies of a category object covering at most chunk_size names."""
+    names = api_obj.get_list()
+    if not chunk_size:
+        chunk_size = max(len(names), 1)
+    for i in range(0, len(names), chunk_size):
+        chunk_obj = copy.copy(api_obj)
+        chunk_obj.set_list(names[i:i + chunk_size])
+        yield chunk_obj
+
+def fetch_field(f5, api_obj, field):
+    # Category objects are bound to the connection that listed them; run
+    # the getter against a copy bound to this worker's connection instead.
+    worker_obj = copy.copy(api_obj)
+    worker_obj.api = f5.get_api()
+    try:
+        return (True, getattr(worker_obj, "get_" + field)())
+    except (MethodNotFound, WebFault):
+        return (False, None)
+
+
+class FactCollector(object):
+    """Fact collector class.
+
+    Collects fact categories over a SessionPool. Every category is listed
+    concurrently, then the field getters of all categories are queued
+    together so independent SOAP calls overlap. Object lists are fetched in
+    chunks of at most chunk_size names, and only a bounded number of getter
+    jobs is queued at any time; each chunk is merged into the facts as soon
+    as it completes, so memory use does not grow with the number of
+    in-flight SOAP responses.
+
+    Attributes:
+        pool: SessionPool used to run iControl calls.
+        chunk_size: Maximum number of names per iControl request.
+        fields: Fields to fetch for each category, overriding the defaults
+            in FACT_CATEGORIES.
+        facts: Collected facts, keyed by category.
+        timing: Wall clock seconds spent on each category.
+    """
+
+    def __init__(self, pool, chunk_size=None, fields=None):
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.fields = fields or {}
+        self.max_pending = pool.size * 2
+        self.pending = collections.deque()
+        self.pending_jobs = 0
+        self.facts = {}
+        self.timing = {}
+        self.spans = {}
+
+    def _record(self, category, jobs):
+        start = min([job.start for job in jobs])
+        end = max([job.end for job in jobs])
+        if category in self.spans:
+            start = min(start, self.spans[category][0])
+            end = max(end, self.spans[category][1])
+        self.spans[category] = (start, end)
+        self.timing[category] = round(end - start, 3)
+
+    def _submit(self, category, api_obj, fields):
+        jobs = [self.pool.submit(fetch_field, api_obj, field) for field in fields]
+        self.pending.append((category, api_obj, fields, jobs))
+        self.pending_jobs += len(jobs)
+        while len(self.pending) > 1 and self.pending_jobs > self.max_pending:
+            self._merge()
+
+    def _merge(self):
+        category, api_obj, fields, jobs = self.pending.popleft()
+        self.pending_jobs -= len(jobs)
+        generator = FACT_CATEGORIES[category][2]
+        responses = [job.get() for job in jobs]
+        self.facts[category].update(generator(api_obj, fields, responses))
+        self._record(category, jobs)
+
+    def collect(self, include, regex):
+        list_jobs = [(category, self.pool.submit(load_category, category, regex))
+                     for category in include]
+        for category, job in list_jobs:
+            api_obj = job.get()
+            self._record(category, [job])
+            fields = FACT_CATEGORIES[category][1]
+            if fields is None:
+                self.facts[category] = api_obj
+                continue
+            fields = self.fields.get(category, fields)
+            self.facts[category] = {}
+            if category in UNFILTERED_CATEGORIES:
+                self._submit(category, api_obj, fields)
+            else:
+                for chunk_obj in split_list(api_obj, self.chunk_size):
+                    self._submit(category, chunk_obj, fields)
+        while self.pending:
+            self._merge()
+        return self.facts
+
+class FactCache(object):
+    """Fact cache class.
+
+    On-disk cache of fact categories, one JSON file per server, user,
+    category, filter and field selection, so facts collected with the
+    permissions of one account are never served to another. Entries are
+    served while younger than the TTL. Expired entries are evicted whenever
+    the cache is written.
+
+    Attributes:
+        path: Cache directory.
+        ttl: Maximum age of a cache entry, in seconds.
+    """
+
+    def __init__(self, path, ttl, server, user, fact_filter=None, fields=None):
+        self.path = path
+        self.ttl = ttl
+        self.server = server
+        self.user = user
+        self.fact_filter = fact_filter
+        self.fields = fields or {}
+
+    def _file(self, category):
+        key = json.dumps([self.server, self.user, category, self.fact_filter,
+                          self.fields.get(category)])
+        return os.path.join(self.path, hashlib.sha1(key).hexdigest() + '.json')
+
+    def get(self, category):
+        try:
+            f = open(self._file(category))
+            try:
+                entry = json.load(f)
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return None
+        if time.time() - entry.get('time', 0) > self.ttl:
+            return None
+        return entry.get('facts')
+
+    def set(self, category, facts):
+        if not os.path.isdir(self.path):
+            # facts may include key passphrases
+            os.makedirs(self.path, 0700)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path)
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump({'time': time.time(), 'facts': facts}, f)
+        finally:
+            f.close()
+        os.rename(tmp_path, self._file(category))
+
+    def evict(self):
+        now = time.time()
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            entry_path = os.path.join(self.path, name)
+            try:
+                if now - os.path.getmtime(entry_path) > self.ttl:
+                    os.remove(entry_path)
+            except OSError:
+                # another run may have evicted it already
+                pass
+
 
 def disable_ssl_cert_validation():
     # You probably only want to do this for testing and never in production.
@@ -1588,9 +2025,15 @@ def main():
             user = dict(type='str', required=True),
             password = dict(type='str', required=True),
             validate_certs = dict(default='yes', type='bool'),
+            wsdl_cache = dict(type='str', default='~/.ansible/cache/bigsuds'),
             session = dict(type='bool', default=False),
             include = dict(type='list', required=True),
             filter = dict(type='str', required=False),
+            max_connections = dict(type='int', default=1),
+            chunk_size = dict(type='int', default=1000),
+            fields = dict(type='dict', required=False),
+            cache_ttl = dict(type='int', default=0),
+            cache_dir = dict(type='str', default='~/.ansible/cache/bigip_facts'),
         )
     )
 
@@ -1601,10 +2044,20 @@ def main():
     user = module.params['user']
     password = module.params['password']
     validate_certs = module.params['validate_certs']
+    wsdl_cache = module.params['wsdl_cache']
     session = module.params['session']
     fact_filter = module.params['filter']
+    max_connections = module.params['max_connections']
+    chunk_size = module.params['chunk_size']
+    fields = module.params['fields'] or {}
+    cache_ttl = module.params['cache_ttl']
+    cache_dir = os.path.expanduser(module.params['cache_dir'])
     if fact_filter:
         regex = fnmatch.translate(fact_filter)
+        if fact_filter.startswith("/"):
+            # anchor paths so /Prod/* does not also match /Common/Prod/*
+            regex = r"\A" + regex
+        regex = re.compile(regex)
     else:
         regex = None
     include = map(lambda x: x.lower(), module.params['include'])
@@ -1616,67 +2069,61 @@ def main():
     include_test = map(lambda x: x in valid_includes, include)
     if not all(include_test):
         module.fail_json(msg="value of include must be one or more of: %s, got: %s" % (",".join(valid_includes), ",".join(include)))
+    if max_connections < 1:
+        module.fail_json(msg="max_connections must be at least 1")
+    if chunk_size < 0:
+        module.fail_json(msg="chunk_size must not be negative")
+    for category, category_fields in fields.items():
+        if category not in include:
+            module.fail_json(msg="fields given for category %s, which is not included" % category)
+        valid_fields = FACT_CATEGORIES[category][1]
+        if valid_fields is None:
+            module.fail_json(msg="fields are not supported for category %s" % category)
+        if isinstance(category_fields, basestring):
+            category_fields = category_fields.split(',')
+        category_fields = [x.strip().lower() for x in category_fields]
+        invalid_fields = [x for x in category_fields if x not in valid_fields]
+        if invalid_fields:
+            module.fail_json(msg="fields for %s must be one or more of: %s, got: %s" % (category, ",".join(valid_fields), ",".join(invalid_fields)))
+        fields[category] = category_fields
 
     if not validate_certs:
         disable_ssl_cert_validation()
 
     try:
         facts = {}
+        timing = {}
+        cached = []
 
         if len(include) > 0:
-            f5 = F5(server, user, password, session)
-            saved_active_folder = f5.get_active_folder()
-            saved_recursive_query_state = f5.get_recursive_query_state()
-            if saved_active_folder != "/":
-                f5.set_active_folder("/")
-            if saved_recursive_query_state != "STATE_ENABLED":
-                f5.enable_recursive_query_state()
-
-            if 'interface' in include:
-                facts['interface'] = generate_interface_dict(f5, regex)
-            if 'self_ip' in include:
-                facts['self_ip'] = generate_self_ip_dict(f5, regex)
-            if 'trunk' in include:
-                facts['trunk'] = generate_trunk_dict(f5, regex)
-            if 'vlan' in include:
-                facts['vlan'] = generate_vlan_dict(f5, regex)
-            if 'virtual_server' in include:
-                facts['virtual_server'] = generate_vs_dict(f5, regex)
-            if 'pool' in include:
-                facts['pool'] = generate_pool_dict(f5, regex)
-            if 'device' in include:
-                facts['device'] = generate_device_dict(f5, regex)
-            if 'device_group' in include:
-                facts['device_group'] = generate_device_group_dict(f5, regex)
-            if 'traffic_group' in include:
-                facts['traffic_group'] = generate_traffic_group_dict(f5, regex)
-            if 'rule' in include:
-                facts['rule'] = generate_rule_dict(f5, regex)
-            if 'node' in include:
-                facts['node'] = generate_node_dict(f5, regex)
-            if 'virtual_address' in include:
-                facts['virtual_address'] = generate_virtual_address_dict(f5, regex)
-            if 'address_class' in include:
-                facts['address_class'] = generate_address_class_dict(f5, regex)
-            if 'software' in include:
-                facts['software'] = generate_software_list(f5)
-            if 'certificate' in include:
-                facts['certificate'] = generate_certificate_dict(f5, regex)
-            if 'key' in include:
-                facts['key'] = generate_key_dict(f5, regex)
-            if 'client_ssl_profile' in include:
-                facts['client_ssl_profile'] = generate_client_ssl_profile_dict(f5, regex)
-            if 'system_info' in include:
-                facts['system_info'] = generate_system_info_dict(f5)
-
-            # restore saved state
-            if saved_active_folder and saved_active_folder != "/":
-                f5.set_active_folder(saved_active_folder)
-            if saved_recursive_query_state and \
-               saved_recursive_query_state != "STATE_ENABLED":
-                f5.set_recursive_query_state(saved_recursive_query_state)
-
-        result = {'ansible_facts': facts}
+            # keep the documented category order for reproducible output
+            include = [x for x in valid_includes if x in include]
+            pool = SessionPool(server, user, password, max_connections,
+                               session, filter_folder(fact_filter),
+                               wsdl_cache)
+            try:
+                if cache_ttl > 0:
+                    cache = FactCache(cache_dir, cache_ttl, server, user,
+                                      fact_filter, fields)
+                    for category in include:
+                        category_facts = cache.get(category)
+                        if category_facts is not None:
+                            facts[category] = category_facts
+                            cached.append(category)
+                    include = [x for x in include if x not in cached]
+
+                collector = FactCollector(pool, chunk_size, fields)
+                facts.update(collector.collect(include, regex))
+                timing = collector.timing
+            finally:
+                pool.close()
+
+            if cache_ttl > 0 and include:
+                for category in include:
+                    cache.set(category, facts[category])
+                cache.evict()
+
+        result = {'ansible_facts': facts, 'timing': timing, 'cached': cached}
 
     except Exception, e:
         module.fail_json(msg="received exception: %s\ntraceback: %s" % (e, traceback.format_exc()))
@@ -59,6 +59,14 @@ options:
         default: 'yes'
         choices: ['yes', 'no']
         version_added: 2.0
+    wsdl_cache:
+        description:
+            - Directory in which iControl WSDLs are cached between runs, so
+              they are not downloaded and parsed again by every task. Set to
+              an empty string to disable caching.
+        required: false
+        default: ~/.ansible/cache/bigsuds
+        version_added: 2.0
     state:
         description:
             - Monitor state
@@ -170,6 +178,8 @@ except ImportError:
 else:
     bigsuds_found = True
 
+import os
+
 TEMPLATE_TYPE = 'TTYPE_HTTP'
 DEFAULT_PARENT_TYPE = 'http'
 
@@ -179,9 +189,14 @@ DEFAULT_PARENT_TYPE = 'http'
 # these should be re-useable for other monitor types
 #
 
-def bigip_api(bigip, user, password):
+def bigip_api(bigip, user, password, cachedir=None):
 
-    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password)
+    if cachedir:
+        cachedir = os.path.expanduser(cachedir)
+    else:
+        cachedir = None
+    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password,
+                        cachedir=cachedir)
     return api
 
 
@@ -328,6 +343,7 @@ def main():
             user      = dict(required=True),
             password  = dict(required=True),
             validate_certs = dict(default='yes', type='bool'),
+            wsdl_cache = dict(default='~/.ansible/cache/bigsuds'),
             partition = dict(default='Common'),
             state     = dict(default='present', choices=['present', 'absent']),
             name      = dict(required=True),
@@ -349,6 +365,7 @@ def main():
     user = module.params['user']
     password = module.params['password']
     validate_certs = module.params['validate_certs']
+    wsdl_cache = module.params['wsdl_cache']
     partition = module.params['partition']
     parent_partition = module.params['parent_partition']
     state = module.params['state']
@@ -371,7 +388,7 @@ def main():
 
     if not bigsuds_found:
         module.fail_json(msg="the python bigsuds module is required")
-    api = bigip_api(server, user, password)
+    api = bigip_api(server, user, password, wsdl_cache)
     monitor_exists = check_monitor_exists(module, api, monitor, parent)
 
 
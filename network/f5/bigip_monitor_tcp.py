@@ -57,6 +57,14 @@ options:
         default: 'yes'
         choices: ['yes', 'no']
         version_added: 2.0
+    wsdl_cache:
+        description:
+            - Directory in which iControl WSDLs are cached between runs, so
+              they are not downloaded and parsed again by every task. Set to
+              an empty string to disable caching.
+        required: false
+        default: ~/.ansible/cache/bigsuds
+        version_added: 2.0
     state:
         description:
             - Monitor state
@@ -188,6 +196,8 @@ except ImportError:
 else:
     bigsuds_found = True
 
+import os
+
 TEMPLATE_TYPE = DEFAULT_TEMPLATE_TYPE = 'TTYPE_TCP'
 TEMPLATE_TYPE_CHOICES = ['tcp', 'tcp_echo', 'tcp_half_open']
 DEFAULT_PARENT = DEFAULT_TEMPLATE_TYPE_CHOICE = DEFAULT_TEMPLATE_TYPE.replace('TTYPE_', '').lower()
@@ -198,9 +208,14 @@ DEFAULT_PARENT = DEFAULT_TEMPLATE_TYPE_CHOICE = DEFAULT_TEMPLATE_TYPE.replace('T
 # these should be re-useable for other monitor types
 #
 
-def bigip_api(bigip, user, password):
+def bigip_api(bigip, user, password, cachedir=None):
 
-    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password)
+    if cachedir:
+        cachedir = os.path.expanduser(cachedir)
+    else:
+        cachedir = None
+    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password,
+                        cachedir=cachedir)
     return api
 
 
@@ -348,6 +363,7 @@ def main():
             user      = dict(required=True),
             password  = dict(required=True),
             validate_certs = dict(default='yes', type='bool'),
+            wsdl_cache = dict(default='~/.ansible/cache/bigsuds'),
             partition = dict(default='Common'),
             state     = dict(default='present', choices=['present', 'absent']),
             name      = dict(required=True),
@@ -369,6 +385,7 @@ def main():
     user = module.params['user']
     password = module.params['password']
     validate_certs = module.params['validate_certs']
+    wsdl_cache = module.params['wsdl_cache']
     partition = module.params['partition']
     parent_partition = module.params['parent_partition']
     state = module.params['state']
@@ -395,7 +412,7 @@ def main():
 
     if not bigsuds_found:
         module.fail_json(msg="the python bigsuds module is required")
-    api = bigip_api(server, user, password)
+    api = bigip_api(server, user, password, wsdl_cache)
     monitor_exists = check_monitor_exists(module, api, monitor, parent)
 
 
@@ -62,6 +62,14 @@ options:
         default: 'yes'
         choices: ['yes', 'no']
         version_added: 2.0
+    wsdl_cache:
+        description:
+            - Directory in which iControl WSDLs are cached between runs, so
+              they are not downloaded and parsed again by every task. Set to
+              an empty string to disable caching.
+        required: false
+        default: ~/.ansible/cache/bigsuds
+        version_added: 2.0
     state:
         description:
             - Pool member state
@@ -159,6 +167,8 @@ except ImportError:
 else:
     bigsuds_found = True
 
+import os
+
 # ==========================
 # bigip_node module specific
 #
@@ -170,8 +180,13 @@ STATUSES={'enabled': 'SESSION_STATUS_ENABLED',
           'disabled': 'SESSION_STATUS_DISABLED',
           'offline': 'SESSION_STATUS_FORCED_DISABLED'}
 
-def bigip_api(bigip, user, password):
-    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password)
+def bigip_api(bigip, user, password, cachedir=None):
+    if cachedir:
+        cachedir = os.path.expanduser(cachedir)
+    else:
+        cachedir = None
+    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password,
+                        cachedir=cachedir)
     return api
 
 def disable_ssl_cert_validation():
@@ -258,6 +273,7 @@ def main():
             user = dict(type='str', required=True),
             password = dict(type='str', required=True),
             validate_certs = dict(default='yes', type='bool'),
+            wsdl_cache = dict(type='str', default='~/.ansible/cache/bigsuds'),
             state = dict(type='str', default='present',
                          choices=['present', 'absent', 'disabled', 'enabled']),
             partition = dict(type='str', default='Common'),
@@ -275,6 +291,7 @@ def main():
     user = module.params['user']
     password = module.params['password']
     validate_certs = module.params['validate_certs']
+    wsdl_cache = module.params['wsdl_cache']
     state = module.params['state']
     partition = module.params['partition']
     host = module.params['host']
@@ -289,7 +306,7 @@ def main():
         module.fail_json(msg="host parameter invalid when state=absent")
 
     try:
-        api = bigip_api(server, user, password)
+        api = bigip_api(server, user, password, wsdl_cache)
         result = {'changed': False}  # default
 
         if state == 'absent':
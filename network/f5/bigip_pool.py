@@ -62,6 +62,14 @@ options:
         default: 'yes'
         choices: ['yes', 'no']
         version_added: 2.0
+    wsdl_cache:
+        description:
+            - Directory in which iControl WSDLs are cached between runs, so
+              they are not downloaded and parsed again by every task. Set to
+              an empty string to disable caching.
+        required: false
+        default: ~/.ansible/cache/bigsuds
+        version_added: 2.0
     state:
         description:
             - Pool/pool member state
@@ -154,6 +162,19 @@ options:
         default: null
         choices: []
         aliases: []
+    members:
+        description:
+            - "List of pool members, each either a C(host:port) string or a
+              dictionary with C(host) and C(port) keys. With state=present the
+              pool membership is reconciled to exactly this list: missing
+              members are added and unlisted members are removed, each in a
+              single batched call. With state=absent the listed members are
+              removed from the pool. Mutually exclusive with host and port."
+        required: False
+        default: null
+        choices: []
+        aliases: []
+        version_added: 2.0
 '''
 
 EXAMPLES = '''
@@ -216,6 +237,21 @@ EXAMPLES = '''
 
 - hosts: localhost
   tasks:
+  - name: Set all pool members in one task
+    local_action:
+      module: bigip_pool
+      server: lb.mydomain.com
+      user: admin
+      password: mysecret
+      state: present
+      name: matthite-pool
+      partition: matthite
+      members:
+        - 10.0.0.11:80
+        - 10.0.0.12:80
+        - host: 10.0.0.13
+          port: 8080
+
   - name: Delete pool
     local_action: >
       bigip_pool
@@ -235,12 +271,19 @@ except ImportError:
 else:
     bigsuds_found = True
 
+import os
+
 # ===========================================
 # bigip_pool module specific support methods.
 #
 
-def bigip_api(bigip, user, password):
-    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password)
+def bigip_api(bigip, user, password, cachedir=None):
+    if cachedir:
+        cachedir = os.path.expanduser(cachedir)
+    else:
+        cachedir = None
+    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password,
+                        cachedir=cachedir)
     return api
 
 def disable_ssl_cert_validation():
@@ -350,6 +393,62 @@ def add_pool_member(api, pool, address, port):
     members = [{'address': address, 'port': port}]
     api.LocalLB.Pool.add_member_v2(pool_names=[pool], members=[members])
 
+def get_pool_members(api, pool):
+    return api.LocalLB.Pool.get_member_v2(pool_names=[pool])[0]
+
+def add_pool_members(api, pool, members):
+    api.LocalLB.Pool.add_member_v2(pool_names=[pool], members=[members])
+
+def remove_pool_members(api, pool, members):
+    api.LocalLB.Pool.remove_member_v2(pool_names=[pool], members=[members])
+
+def delete_node_addresses(api, addresses):
+    # try all nodes in one call; if any of them is still in use by another
+    # pool the whole call fails, so fall back to deleting them one by one
+    addresses = list(set(addresses))
+    if not addresses:
+        return []
+    try:
+        api.LocalLB.NodeAddressV2.delete_node_address(nodes=addresses)
+        return addresses
+    except bigsuds.OperationFailed, e:
+        if "is referenced by a member of pool" not in str(e):
+            # genuine exception
+            raise
+    return [x for x in addresses if delete_node_address(api, x)]
+
+def parse_members(module, members, partition):
+    # iControl rejects the whole add_member_v2 call on a duplicate member,
+    # so each (address, port) is only kept once
+    result = []
+    seen = set()
+    for member in members:
+        if isinstance(member, dict):
+            host = member.get('host', member.get('address'))
+            port = member.get('port')
+        else:
+            host, sep, port = str(member).rpartition(':')
+        try:
+            port = int(port)
+        except (TypeError, ValueError):
+            module.fail_json(msg="invalid pool member: %s" % member)
+        if not host or not 1 <= port <= 65535:
+            module.fail_json(msg="invalid pool member: %s" % member)
+        if "/" not in host:
+            host = "/%s/%s" % (partition, host)
+        if (host, port) in seen:
+            continue
+        seen.add((host, port))
+        result.append({'address': host, 'port': port})
+    return result
+
+def diff_pool_members(current, desired):
+    current_keys = set([(x['address'], x['port']) for x in current])
+    desired_keys = set([(x['address'], x['port']) for x in desired])
+    to_add = [x for x in desired if (x['address'], x['port']) not in current_keys]
+    to_remove = [x for x in current if (x['address'], x['port']) not in desired_keys]
+    return (to_add, to_remove)
+
 def main():
     lb_method_choices = ['round_robin', 'ratio_member',
                          'least_connection_member', 'observed_member',
@@ -374,6 +473,7 @@ def main():
             user = dict(type='str', required=True),
             password = dict(type='str', required=True),
             validate_certs = dict(default='yes', type='bool'),
+            wsdl_cache = dict(type='str', default='~/.ansible/cache/bigsuds'),
             state = dict(type='str', default='present', choices=['present', 'absent']),
             name = dict(type='str', required=True, aliases=['pool']),
             partition = dict(type='str', default='Common'),
@@ -384,7 +484,8 @@ def main():
             slow_ramp_time = dict(type='int'),
             service_down_action = dict(type='str', choices=service_down_choices),
             host = dict(type='str', aliases=['address']),
-            port = dict(type='int')
+            port = dict(type='int'),
+            members = dict(type='list')
         ),
         supports_check_mode=True
     )
@@ -396,6 +497,7 @@ def main():
     user = module.params['user']
     password = module.params['password']
     validate_certs = module.params['validate_certs']
+    wsdl_cache = module.params['wsdl_cache']
     state = module.params['state']
     name = module.params['name']
     partition = module.params['partition']
@@ -422,6 +524,9 @@ def main():
     host = module.params['host']
     address = "/%s/%s" % (partition, host)
     port = module.params['port']
+    members = module.params['members']
+    if members is not None:
+        members = parse_members(module, members, partition)
 
     if not validate_certs:
         disable_ssl_cert_validation()
@@ -431,6 +536,9 @@ def main():
     if (host and not port) or (port and not host):
         module.fail_json(msg="both host and port must be supplied")
 
+    if members is not None and (host or port):
+        module.fail_json(msg="members is mutually exclusive with host and port")
+
     if 1 > port > 65535:
         module.fail_json(msg="valid ports must be in range 1 - 65535")
 
@@ -454,11 +562,24 @@ def main():
         module.fail_json(msg="quorum requires monitors parameter")
 
     try:
-        api = bigip_api(server, user, password)
+        api = bigip_api(server, user, password, wsdl_cache)
         result = {'changed': False}  # default
 
         if state == 'absent':
-            if host and port and pool:
+            if members is not None:
+                if pool_exists(api, pool):
+                    current = get_pool_members(api, pool)
+                    missing = diff_pool_members(current, members)[0]
+                    to_remove = [x for x in members if x not in missing]
+                    if to_remove:
+                        if not module.check_mode:
+                            remove_pool_members(api, pool, to_remove)
+                            deleted = delete_node_addresses(api, [x['address'] for x in to_remove])
+                            result = {'changed': True, 'deleted': deleted}
+                        else:
+                            result = {'changed': True}
+                    result['members_removed'] = to_remove
+            elif host and port and pool:
                 # member removal takes precedent
                 if pool_exists(api, pool) and member_exists(api, pool, address, port):
                     if not module.check_mode:
@@ -513,9 +634,14 @@ def main():
                             set_action_on_service_down(api, pool, service_down_action)
                         if host and port:
                             add_pool_member(api, pool, address, port)
+                        if members:
+                            add_pool_members(api, pool, members)
                 else:
                     # check-mode return value
                     result = {'changed': True}
+                if members is not None and not update:
+                    result['members_added'] = members
+                    result['members_removed'] = []
             else:
                 # pool exists -- potentially modify attributes
                 update = True
@@ -543,6 +669,19 @@ def main():
                     if not module.check_mode:
                         add_pool_member(api, pool, address, port)
                     result = {'changed': True}
+                if members is not None:
+                    current = get_pool_members(api, pool)
+                    to_add, to_remove = diff_pool_members(current, members)
+                    if to_add or to_remove:
+                        result = {'changed': True}
+                        if not module.check_mode:
+                            if to_remove:
+                                remove_pool_members(api, pool, to_remove)
+                                result['deleted'] = delete_node_addresses(api, [x['address'] for x in to_remove])
+                            if to_add:
+                                add_pool_members(api, pool, to_add)
+                    result['members_added'] = to_add
+                    result['members_removed'] = to_remove
 
     except Exception, e:
         module.fail_json(msg="received exception: %s" % e)
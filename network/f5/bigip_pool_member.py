@@ -64,6 +64,14 @@ options:
         default: 'yes'
         choices: ['yes', 'no']
         version_added: 2.0
+    wsdl_cache:
+        description:
+            - Directory in which iControl WSDLs are cached between runs, so
+              they are not downloaded and parsed again by every task. Set to
+              an empty string to disable caching.
+        required: false
+        default: ~/.ansible/cache/bigsuds
+        version_added: 2.0
     state:
         description:
             - Pool member state
@@ -73,8 +81,9 @@ options:
         aliases: []
     pool:
         description:
-            - Pool name. This pool must exist.
-        required: true
+            - Pool name. This pool must exist. Required unless every entry of
+              members names its pool.
+        required: false
         default: null
         choices: []
         aliases: []
@@ -87,15 +96,15 @@ options:
         aliases: []
     host:
         description:
-            - Pool member IP
-        required: true
+            - Pool member IP. Required unless members is given.
+        required: false
         default: null
         choices: []
         aliases: ['address', 'name']
     port:
         description:
-            - Pool member port
-        required: true
+            - Pool member port. Required unless members is given.
+        required: false
         default: null
         choices: []
         aliases: []
@@ -127,6 +136,39 @@ options:
         default: null
         choices: []
         aliases: []
+    session_state:
+        description:
+            - Set new sessions to the pool member enabled or disabled.
+        required: false
+        default: null
+        choices: ['enabled', 'disabled']
+        aliases: []
+        version_added: 2.0
+    monitor_state:
+        description:
+            - Set the pool member enabled or forced offline.
+        required: false
+        default: null
+        choices: ['enabled', 'disabled']
+        aliases: []
+        version_added: 2.0
+    members:
+        description:
+            - List of pool members to manage in one task, each a dictionary
+              with C(host) and C(port) keys and optionally C(pool), C(state)
+              and any of the pool member attributes above. Module level
+              values are used as defaults for every member. Current values
+              are read with one call per attribute and changes are applied
+              with one call per attribute, covering all pools at once.
+              The changes made, or that would be made in check mode, are
+              returned in C(added), C(removed) and C(updated), and the node
+              addresses deleted along with removed members in C(deleted).
+              Mutually exclusive with host and port.
+        required: false
+        default: null
+        choices: []
+        aliases: []
+        version_added: 2.0
 '''
 
 EXAMPLES = '''
@@ -180,6 +222,24 @@ EXAMPLES = '''
       host="{{ ansible_default_ipv4["address"] }}"
       port=80
 
+  - name: Drain a batch of pool members
+    local_action:
+      module: bigip_pool_member
+      server: lb.mydomain.com
+      user: admin
+      password: mysecret
+      pool: matthite-pool
+      partition: matthite
+      session_state: disabled
+      members:
+        - host: 10.0.0.11
+          port: 80
+        - host: 10.0.0.12
+          port: 80
+        - pool: matthite-pool-ssl
+          host: 10.0.0.11
+          port: 443
+
 '''
 
 try:
@@ -189,12 +249,19 @@ except ImportError:
 else:
     bigsuds_found = True
 
+import os
+
 # ===========================================
 # bigip_pool_member module specific support methods.
 #
 
-def bigip_api(bigip, user, password):
-    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password)
+def bigip_api(bigip, user, password, cachedir=None):
+    if cachedir:
+        cachedir = os.path.expanduser(cachedir)
+    else:
+        cachedir = None
+    api = bigsuds.BIGIP(hostname=bigip, username=user, password=password,
+                        cachedir=cachedir)
     return api
 
 def disable_ssl_cert_validation():
@@ -217,21 +284,18 @@ def pool_exists(api, pool):
             raise
     return result
 
-def member_exists(api, pool, address, port):
-    # hack to determine if member exists
-    result = False
+def missing_pools(api, pools):
+    # check every pool in one call by full path, which works in any
+    # partition without touching the session's active folder; only when
+    # one is missing is each pool checked on its own to name it
     try:
-        members = [{'address': address, 'port': port}]
-        api.LocalLB.Pool.get_member_object_status(pool_names=[pool],
-                                                  members=[members])
-        result = True
+        api.LocalLB.Pool.get_object_status(pool_names=pools)
+        return []
     except bigsuds.OperationFailed, e:
-        if "was not found" in str(e):
-            result = False
-        else:
+        if "was not found" not in str(e):
             # genuine exception
             raise
-    return result
+    return [x for x in pools if not pool_exists(api, x)]
 
 def delete_node_address(api, address):
     result = False
@@ -246,49 +310,173 @@ def delete_node_address(api, address):
             raise
     return result
 
-def remove_pool_member(api, pool, address, port):
-    members = [{'address': address, 'port': port}]
-    api.LocalLB.Pool.remove_member_v2(pool_names=[pool], members=[members])
-
-def add_pool_member(api, pool, address, port):
-    members = [{'address': address, 'port': port}]
-    api.LocalLB.Pool.add_member_v2(pool_names=[pool], members=[members])
-
-def get_connection_limit(api, pool, address, port):
-    members = [{'address': address, 'port': port}]
-    result = api.LocalLB.Pool.get_member_connection_limit(pool_names=[pool], members=[members])[0][0]
-    return result
-
-def set_connection_limit(api, pool, address, port, limit):
-    members = [{'address': address, 'port': port}]
-    api.LocalLB.Pool.set_member_connection_limit(pool_names=[pool], members=[members], limits=[[limit]])
-
-def get_description(api, pool, address, port):
-    members = [{'address': address, 'port': port}]
-    result = api.LocalLB.Pool.get_member_description(pool_names=[pool], members=[members])[0][0]
-    return result
-
-def set_description(api, pool, address, port, description):
-    members = [{'address': address, 'port': port}]
-    api.LocalLB.Pool.set_member_description(pool_names=[pool], members=[members], descriptions=[[description]])
-
-def get_rate_limit(api, pool, address, port):
-    members = [{'address': address, 'port': port}]
-    result = api.LocalLB.Pool.get_member_rate_limit(pool_names=[pool], members=[members])[0][0]
-    return result
-
-def set_rate_limit(api, pool, address, port, limit):
-    members = [{'address': address, 'port': port}]
-    api.LocalLB.Pool.set_member_rate_limit(pool_names=[pool], members=[members], limits=[[limit]])
-
-def get_ratio(api, pool, address, port):
-    members = [{'address': address, 'port': port}]
-    result = api.LocalLB.Pool.get_member_ratio(pool_names=[pool], members=[members])[0][0]
+def delete_node_addresses(api, addresses):
+    # try all nodes in one call; if any of them is still in use by another
+    # pool the whole call fails, so fall back to deleting them one by one
+    addresses = list(set(addresses))
+    if not addresses:
+        return []
+    try:
+        api.LocalLB.NodeAddressV2.delete_node_address(nodes=addresses)
+        return addresses
+    except bigsuds.OperationFailed, e:
+        if "is referenced by a member of pool" not in str(e):
+            # genuine exception
+            raise
+    return [x for x in addresses if delete_node_address(api, x)]
+
+# member attribute -> (iControl getter, iControl setter, setter argument)
+MEMBER_ATTRIBUTES = {
+    'connection_limit': ('get_member_connection_limit', 'set_member_connection_limit', 'limits'),
+    'description': ('get_member_description', 'set_member_description', 'descriptions'),
+    'rate_limit': ('get_member_rate_limit', 'set_member_rate_limit', 'limits'),
+    'ratio': ('get_member_ratio', 'set_member_ratio', 'ratios'),
+    'session_state': ('get_member_session_enabled_state', 'set_member_session_enabled_state', 'session_states'),
+    'monitor_state': ('get_member_monitor_status', 'set_member_monitor_state', 'monitor_states'),
+}
+
+def member_key(member):
+    return (member['pool'], member['address'], member['port'])
+
+def group_by_pool(members):
+    # iControl member calls take a list of pools and a list of member lists,
+    # one per pool, so a single call can cover every pool at once
+    pools = []
+    groups = {}
+    for member in members:
+        if member['pool'] not in groups:
+            pools.append(member['pool'])
+            groups[member['pool']] = []
+        groups[member['pool']].append(member)
+    return (pools, [groups[x] for x in pools])
+
+def member_refs(groups):
+    return [[{'address': x['address'], 'port': x['port']} for x in group] for group in groups]
+
+def get_member_values(api, attribute, members):
+    pools, groups = group_by_pool(members)
+    getter = getattr(api.LocalLB.Pool, MEMBER_ATTRIBUTES[attribute][0])
+    result = getter(pool_names=pools, members=member_refs(groups))
+    values = []
+    for group_values in result:
+        for value in group_values:
+            if attribute == 'session_state':
+                value = value.split("STATE_")[-1].lower()
+            elif attribute == 'monitor_state':
+                if value == 'MONITOR_STATUS_FORCED_DOWN':
+                    value = 'disabled'
+                else:
+                    value = 'enabled'
+            values.append(value)
+    return values
+
+def set_member_values(api, attribute, members):
+    pools, groups = group_by_pool(members)
+    values = []
+    for group in groups:
+        group_values = [x[attribute] for x in group]
+        if attribute in ('session_state', 'monitor_state'):
+            group_values = ["STATE_%s" % x.strip().upper() for x in group_values]
+        values.append(group_values)
+    getter, setter, argument = MEMBER_ATTRIBUTES[attribute]
+    kwargs = {'pool_names': pools, 'members': member_refs(groups), argument: values}
+    getattr(api.LocalLB.Pool, setter)(**kwargs)
+
+def reconcile_members(api, members, check_mode):
+    # one bulk read of the membership of every pool involved
+    pools = group_by_pool(members)[0]
+    current = set()
+    for pool, pool_members in zip(pools, api.LocalLB.Pool.get_member_v2(pool_names=pools)):
+        current.update([(pool, x['address'], x['port']) for x in pool_members])
+
+    to_add = []
+    to_remove = []
+    existing = []
+    for member in members:
+        exists = member_key(member) in current
+        if member['state'] == 'absent':
+            if exists:
+                to_remove.append(member)
+        elif exists:
+            existing.append(member)
+        else:
+            to_add.append(member)
+
+    # one bulk read per attribute, then one bulk write per changed attribute
+    updated = []
+    to_set = {}
+    for attribute in sorted(MEMBER_ATTRIBUTES):
+        wanted = [x for x in existing if x[attribute] is not None]
+        if wanted:
+            for member, value in zip(wanted, get_member_values(api, attribute, wanted)):
+                if value != member[attribute]:
+                    to_set.setdefault(attribute, []).append(member)
+                    updated.append({'pool': member['pool'],
+                                    'address': member['address'],
+                                    'port': member['port'],
+                                    'attribute': attribute,
+                                    'before': value,
+                                    'after': member[attribute]})
+        added = [x for x in to_add if x[attribute] is not None]
+        if added:
+            to_set.setdefault(attribute, []).extend(added)
+
+    deleted = []
+    if not check_mode:
+        if to_remove:
+            pools, groups = group_by_pool(to_remove)
+            api.LocalLB.Pool.remove_member_v2(pool_names=pools, members=member_refs(groups))
+            deleted = delete_node_addresses(api, [x['address'] for x in to_remove])
+        if to_add:
+            pools, groups = group_by_pool(to_add)
+            api.LocalLB.Pool.add_member_v2(pool_names=pools, members=member_refs(groups))
+        for attribute in sorted(to_set):
+            set_member_values(api, attribute, to_set[attribute])
+
+    result = {'changed': bool(to_add or to_remove or updated),
+              'added': [dict(zip(('pool', 'address', 'port'), member_key(x))) for x in to_add],
+              'removed': [dict(zip(('pool', 'address', 'port'), member_key(x))) for x in to_remove],
+              'updated': updated,
+              'deleted': deleted}
     return result
 
-def set_ratio(api, pool, address, port, ratio):
-    members = [{'address': address, 'port': port}]
-    api.LocalLB.Pool.set_member_ratio(pool_names=[pool], members=[members], ratios=[[ratio]])
+def parse_member(module, item, defaults, partition):
+    if not isinstance(item, dict):
+        module.fail_json(msg="members must be a list of dictionaries, got: %s" % item)
+    valid_keys = ['pool', 'host', 'address', 'name', 'port', 'state'] + MEMBER_ATTRIBUTES.keys()
+    invalid_keys = [x for x in item if x not in valid_keys]
+    if invalid_keys:
+        module.fail_json(msg="invalid member keys: %s" % ",".join(invalid_keys))
+    member = dict(defaults)
+    member.update(item)
+    host = member.get('host') or member.get('address') or member.get('name')
+    pool = member['pool']
+    if not host or not pool or not member.get('port'):
+        module.fail_json(msg="pool, host and port must be supplied for member: %s" % item)
+    try:
+        member['port'] = int(member['port'])
+    except (TypeError, ValueError):
+        module.fail_json(msg="invalid port for member: %s" % item)
+    if not 1 <= member['port'] <= 65535:
+        module.fail_json(msg="valid ports must be in range 1 - 65535")
+    if member['state'] not in ('present', 'absent'):
+        module.fail_json(msg="member state must be present or absent: %s" % item)
+    for attribute in ('session_state', 'monitor_state'):
+        if member[attribute] not in (None, 'enabled', 'disabled'):
+            module.fail_json(msg="%s must be enabled or disabled: %s" % (attribute, item))
+    for attribute in ('connection_limit', 'rate_limit', 'ratio'):
+        if member[attribute] is not None:
+            try:
+                member[attribute] = int(member[attribute])
+            except (TypeError, ValueError):
+                module.fail_json(msg="%s must be an integer: %s" % (attribute, item))
+    if "/" not in pool:
+        pool = "/%s/%s" % (partition, pool)
+    if "/" not in host:
+        host = "/%s/%s" % (partition, host)
+    member['pool'] = pool
+    member['address'] = host
+    return member
 
 def main():
     module = AnsibleModule(
@@ -297,15 +485,19 @@ def main():
             user = dict(type='str', required=True),
             password = dict(type='str', required=True),
             validate_certs = dict(default='yes', type='bool'),
+            wsdl_cache = dict(type='str', default='~/.ansible/cache/bigsuds'),
             state = dict(type='str', default='present', choices=['present', 'absent']),
-            pool = dict(type='str', required=True),
+            pool = dict(type='str'),
             partition = dict(type='str', default='Common'),
-            host = dict(type='str', required=True, aliases=['address', 'name']),
-            port = dict(type='int', required=True),
+            host = dict(type='str', aliases=['address', 'name']),
+            port = dict(type='int'),
             connection_limit = dict(type='int'),
             description = dict(type='str'),
             rate_limit = dict(type='int'),
-            ratio = dict(type='int')
+            ratio = dict(type='int'),
+            session_state = dict(type='str', choices=['enabled', 'disabled']),
+            monitor_state = dict(type='str', choices=['enabled', 'disabled']),
+            members = dict(type='list')
         ),
         supports_check_mode=True
     )
@@ -317,74 +509,48 @@ def main():
     user = module.params['user']
     password = module.params['password']
     validate_certs = module.params['validate_certs']
+    wsdl_cache = module.params['wsdl_cache']
     state = module.params['state']
     partition = module.params['partition']
-    pool = "/%s/%s" % (partition, module.params['pool'])
-    connection_limit = module.params['connection_limit']
-    description = module.params['description']
-    rate_limit = module.params['rate_limit']
-    ratio = module.params['ratio']
     host = module.params['host']
-    address = "/%s/%s" % (partition, host)
     port = module.params['port']
+    members = module.params['members']
 
     if not validate_certs:
         disable_ssl_cert_validation()
 
     # sanity check user supplied values
 
-    if (host and not port) or (port and not host):
-        module.fail_json(msg="both host and port must be supplied")
-
-    if 1 > port > 65535:
-        module.fail_json(msg="valid ports must be in range 1 - 65535")
+    if members is not None:
+        if host or port:
+            module.fail_json(msg="members is mutually exclusive with host and port")
+    else:
+        if not host or not port:
+            module.fail_json(msg="both host and port must be supplied")
+        if not module.params['pool']:
+            module.fail_json(msg="pool must be supplied")
+        members = [{'host': host, 'port': port}]
+
+    # module level values are defaults for every member
+    defaults = {'pool': module.params['pool'], 'state': state}
+    for attribute in MEMBER_ATTRIBUTES:
+        defaults[attribute] = module.params[attribute]
+    members = [parse_member(module, x, defaults, partition) for x in members]
+    keys = [member_key(x) for x in members]
+    if len(set(keys)) != len(keys):
+        module.fail_json(msg="members must not contain duplicates")
 
     try:
-        api = bigip_api(server, user, password)
-        if not pool_exists(api, pool):
+        api = bigip_api(server, user, password, wsdl_cache)
+        for pool in missing_pools(api, group_by_pool(members)[0]):
             module.fail_json(msg="pool %s does not exist" % pool)
-        result = {'changed': False}  # default
-
-        if state == 'absent':
-            if member_exists(api, pool, address, port):
-                if not module.check_mode:
-                    remove_pool_member(api, pool, address, port)
-                    deleted = delete_node_address(api, address)
-                    result = {'changed': True, 'deleted': deleted}
-                else:
-                    result = {'changed': True}
-
-        elif state == 'present':
-            if not member_exists(api, pool, address, port):
-                if not module.check_mode:
-                    add_pool_member(api, pool, address, port)
-                    if connection_limit is not None:
-                        set_connection_limit(api, pool, address, port, connection_limit)
-                    if description is not None:
-                        set_description(api, pool, address, port, description)
-                    if rate_limit is not None:
-                        set_rate_limit(api, pool, address, port, rate_limit)
-                    if ratio is not None:
-                        set_ratio(api, pool, address, port, ratio)
-                result = {'changed': True}
+        result = reconcile_members(api, members, module.check_mode)
+        if module.params['members'] is None:
+            # a single member keeps returning whether its node was deleted
+            if result['removed']:
+                result['deleted'] = members[0]['address'] in result['deleted']
             else:
-                # pool member exists -- potentially modify attributes
-                if connection_limit is not None and connection_limit != get_connection_limit(api, pool, address, port):
-                    if not module.check_mode:
-                        set_connection_limit(api, pool, address, port, connection_limit)
-                    result = {'changed': True}
-                if description is not None and description != get_description(api, pool, address, port):
-                    if not module.check_mode:
-                        set_description(api, pool, address, port, description)
-                    result = {'changed': True}
-                if rate_limit is not None and rate_limit != get_rate_limit(api, pool, address, port):
-                    if not module.check_mode:
-                        set_rate_limit(api, pool, address, port, rate_limit)
-                    result = {'changed': True}
-                if ratio is not None and ratio != get_ratio(api, pool, address, port):
-                    if not module.check_mode:
-                        set_ratio(api, pool, address, port, ratio)
-                    result = {'changed': True}
+                del result['deleted']
 
     except Exception, e:
         module.fail_json(msg="received exception: %s" % e)
@@ -394,4 +560,3 @@ def main():
 # import module snippets
 from ansible.module_utils.basic import *
 main()
-
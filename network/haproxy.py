@@ -55,7 +55,7 @@ options:
   backend:
     description:
       - Name of the haproxy backend pool.
-        Required, else auto-detection applied.
+        If not given, every backend the host is a member of is used.
     required: false
     default: auto-detected
   weight:
@@ -68,6 +68,26 @@ options:
       - When disabling server, immediately terminate all the sessions attached to the specified server. This can be used to terminate long-running sessions after a server is put into maintenance mode, for instance.
     required: false
     default: false
+  wait:
+    description:
+      - When disabling server, wait until the server has no more current sessions (C(scur) in C(show stat)) in any of the backends, so that it can be safely stopped.
+    required: false
+    default: false
+  drain_timeout:
+    description:
+      - Number of seconds to wait for the sessions to drain when I(wait) is set. The task fails if sessions remain after that time.
+    required: false
+    default: 300
+  poll_interval:
+    description:
+      - Number of seconds between two session counter checks when I(wait) is set.
+    required: false
+    default: 1
+  timeout:
+    description:
+      - Number of seconds to wait for haproxy to answer a command on the socket.
+    required: false
+    default: 30
 '''
 
 EXAMPLES = '''
@@ -85,6 +105,9 @@ examples:
 # disable backend server in 'www' backend pool and drop open sessions to it
 - haproxy: state=disabled host={{ inventory_hostname }} backend=www socket=/var/run/haproxy.sock shutdown_sessions=true
 
+# disable server in all backend pools and wait up to 10 minutes for sessions to drain
+- haproxy: state=disabled host={{ inventory_hostname }} wait=yes drain_timeout=600
+
 # enable server in 'www' backend pool
 - haproxy: state=enabled host={{ inventory_hostname }} backend=www
 
@@ -94,12 +117,20 @@ examples:
 author: Ravi Bhure <ravibhure@gmail.com>
 '''
 
+import csv
 import socket
+import time
 
 
 DEFAULT_SOCKET_LOCATION="/var/run/haproxy.sock"
 RECV_SIZE = 1024
+# printed by haproxy after each response in interactive mode
+PROMPT = '\n> '
 ACTION_CHOICES = ['enabled', 'disabled']
+# 'type' column of 'show stat' for server rows
+SERVER_TYPE = '2'
+# only report servers, for all proxies
+SHOW_STAT_SERVERS = 'show stat -1 4 -1'
 
 ######################################################################
 class TimeoutException(Exception):
@@ -126,27 +157,135 @@ class HAProxy(object):
         self.weight = self.module.params['weight']
         self.socket = self.module.params['socket']
         self.shutdown_sessions = self.module.params['shutdown_sessions']
+        self.wait = self.module.params['wait']
+        self.drain_timeout = self.module.params['drain_timeout']
+        self.poll_interval = self.module.params['poll_interval']
+        self.timeout = self.module.params['timeout']
 
+        self.client = None
+        self.pending = ''
         self.command_results = []
+        self.changed = False
 
-    def execute(self, cmd, timeout=200):
+    def connect(self):
         """
-        Executes a HAProxy command by sending a message to a HAProxy's local
-        UNIX socket and waiting up to 'timeout' milliseconds for the response.
+        Opens the UNIX socket and switches the session to interactive
+        mode, so that it stays open across commands.  Every response is
+        then terminated by PROMPT.
         """
 
         self.client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.client.settimeout(self.timeout)
         self.client.connect(self.socket)
-        self.client.sendall('%s\n' % cmd)
-        result = ''
-        buf = ''
-        buf = self.client.recv(RECV_SIZE)
-        while buf:
-            result += buf
-            buf = self.client.recv(RECV_SIZE)
-        self.command_results = result.strip()
-        self.client.close()
-        return result
+        self.pending = ''
+        self.client.sendall('prompt\n')
+        self.read_response()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def read_response(self):
+        """
+        Reads from the socket until the next PROMPT and returns the data
+        received before it.  Anything read past the prompt belongs to the
+        next pipelined command and is kept in self.pending.
+        """
+
+        chunks = []
+        size = 0
+        tail = ''
+        data = self.pending
+        self.pending = ''
+        while True:
+            if not data:
+                try:
+                    data = self.client.recv(RECV_SIZE)
+                except socket.timeout:
+                    raise TimeoutException()
+                if not data:
+                    raise socket.error("connection closed by haproxy")
+
+            # the prompt may be split across two reads
+            idx = (tail + data).find(PROMPT)
+            if idx != -1:
+                end = idx - len(tail)
+                chunks.append(data)
+                self.pending = data[end + len(PROMPT):]
+                return ''.join(chunks)[:size + end]
+
+            chunks.append(data)
+            size += len(data)
+            tail = (tail + data)[-(len(PROMPT) - 1):]
+            data = ''
+
+    def execute(self, cmd):
+        """
+        Executes a HAProxy command by sending a message to a HAProxy's local
+        UNIX socket and waiting up to 'timeout' seconds for the response.
+        """
+
+        return self.execute_many([cmd])[0]
+
+    def execute_many(self, cmds):
+        """
+        Pipelines a list of commands over the interactive session: all
+        commands are sent in one write, then their responses are read back
+        in order.
+        """
+
+        if not cmds:
+            return []
+        if self.client is None:
+            self.connect()
+
+        self.client.sendall(''.join(['%s\n' % cmd for cmd in cmds]))
+        return [self.read_response() for cmd in cmds]
+
+    def record(self, results):
+        self.command_results.extend([x.strip() for x in results if x.strip()])
+
+    def get_stats(self, cmd='show stat'):
+        """
+        Parses the 'show stat' CSV into a dict of rows keyed by
+        (pxname, svname).
+        """
+
+        output = self.execute(cmd)
+        lines = output.strip().split('\n')
+        reader = csv.reader(lines)
+        header = [x.strip() for x in reader.next()]
+        if header:
+            header[0] = header[0].lstrip('# ')
+
+        stats = {}
+        for row in reader:
+            if len(row) < 2:
+                continue
+            row = dict(zip(header, row))
+            stats[(row['pxname'], row['svname'])] = row
+        return stats
+
+    def get_servers(self, stats, svname, backend):
+        """
+        Returns the stats rows for svname, in the given backend or, when
+        backend is None, in every backend it is a member of.
+        """
+
+        if backend is not None:
+            if (backend, svname) not in stats:
+                self.module.fail_json(msg="server %s/%s not found" % (backend, svname))
+            return [stats[(backend, svname)]]
+
+        servers = []
+        for (pxname, name), row in sorted(stats.items()):
+            if name != svname or name in ('FRONTEND', 'BACKEND'):
+                continue
+            if row.get('type', SERVER_TYPE) != SERVER_TYPE:
+                continue
+            servers.append(row)
+        return servers
 
     def enabled(self, host, backend, weight):
         """
@@ -155,28 +294,30 @@ class HAProxy(object):
         set the weight for haproxy backend server when provides.
         """
         svname = host
-        if self.backend is None:
-            output = self.execute('show stat')
-            #sanitize and make a list of lines
-            output = output.lstrip('# ').strip()
-            output = output.split('\n')
-            result = output
-
-            for line in result:
-                if 'BACKEND' in line:
-                    result =  line.split(',')[0]
-                    pxname = result
-                    cmd = "get weight %s/%s ; enable server %s/%s" % (pxname, svname, pxname, svname)
-                    if weight:
-                        cmd += "; set weight %s/%s %s" % (pxname, svname, weight)
-                    self.execute(cmd)
-
-        else:
-            pxname = backend
-            cmd = "get weight %s/%s ; enable server %s/%s" % (pxname, svname, pxname, svname)
+        servers = self.get_servers(self.get_stats(), svname, backend)
+
+        cmds = []
+        checks = []
+        for row in servers:
+            pxname = row['pxname']
+            if row['status'].startswith('MAINT'):
+                cmds.append("enable server %s/%s" % (pxname, svname))
+                self.changed = True
             if weight:
-                cmd += "; set weight %s/%s %s" % (pxname, svname, weight)
-            self.execute(cmd)
+                # relative weights depend on the initial weight, so compare
+                # the weight reported before and after setting it
+                checks.append(len(cmds))
+                cmds.append("get weight %s/%s" % (pxname, svname))
+                cmds.append("set weight %s/%s %s" % (pxname, svname, weight))
+                cmds.append("get weight %s/%s" % (pxname, svname))
+        results = self.execute_many(cmds)
+        self.record(results)
+
+        for i in checks:
+            if results[i + 1].strip():
+                self.module.fail_json(msg=results[i + 1].strip())
+            if results[i].split(' ')[0] != results[i + 2].split(' ')[0]:
+                self.changed = True
 
     def disabled(self, host, backend, shutdown_sessions):
         """
@@ -185,45 +326,74 @@ class HAProxy(object):
         also it shutdown sessions while disabling backend host server.
         """
         svname = host
-        if self.backend is None:
-            output = self.execute('show stat')
-            #sanitize and make a list of lines
-            output = output.lstrip('# ').strip()
-            output = output.split('\n')
-            result = output
-
-            for line in result:
-                if 'BACKEND' in line:
-                    result =  line.split(',')[0]
-                    pxname = result
-                    cmd = "get weight %s/%s ; disable server %s/%s" % (pxname, svname, pxname, svname)
-                    if shutdown_sessions:
-                        cmd += "; shutdown sessions server %s/%s" % (pxname, svname)
-                    self.execute(cmd)
-
-        else:
-            pxname = backend
-            cmd = "get weight %s/%s ; disable server %s/%s" % (pxname, svname, pxname, svname)
-            if shutdown_sessions:
-                cmd += "; shutdown sessions server %s/%s" % (pxname, svname)
-            self.execute(cmd)
+        servers = self.get_servers(self.get_stats(), svname, backend)
+
+        cmds = []
+        for row in servers:
+            pxname = row['pxname']
+            if not row['status'].startswith('MAINT'):
+                cmds.append("disable server %s/%s" % (pxname, svname))
+                self.changed = True
+            if shutdown_sessions and row.get('scur', '0') not in ('', '0'):
+                cmds.append("shutdown sessions server %s/%s" % (pxname, svname))
+                self.changed = True
+        self.record(self.execute_many(cmds))
+
+        if self.wait:
+            self.wait_for_drain(svname, [row['pxname'] for row in servers])
+
+    def wait_for_drain(self, svname, backends):
+        """
+        Polls the session counters of svname in the given backends until
+        they all reach zero or drain_timeout expires.  Each poll is a
+        single servers-only 'show stat' over the open session, however
+        many backends are watched.
+        """
+
+        deadline = time.time() + self.drain_timeout
+        while True:
+            try:
+                stats = self.get_stats(SHOW_STAT_SERVERS)
+            except socket.error:
+                # the session may have hit haproxy's cli timeout
+                self.close()
+                stats = self.get_stats(SHOW_STAT_SERVERS)
+
+            active = []
+            for pxname in backends:
+                row = stats.get((pxname, svname))
+                if row is not None and row.get('scur', '0') not in ('', '0'):
+                    active.append("%s/%s (%s)" % (pxname, svname, row['scur']))
+            if not active:
+                return
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.module.fail_json(msg="timed out waiting for sessions to drain: %s" % ', '.join(active))
+            time.sleep(min(self.poll_interval, remaining))
 
     def act(self):
         """
         Figure out what you want to do from ansible, and then do it.
         """
 
-        # toggle enable/disbale server
-        if self.state == 'enabled':
-            self.enabled(self.host, self.backend, self.weight)
+        try:
+            # toggle enable/disbale server
+            if self.state == 'enabled':
+                self.enabled(self.host, self.backend, self.weight)
 
-        elif self.state == 'disabled':
-            self.disabled(self.host, self.backend, self.shutdown_sessions)
+            elif self.state == 'disabled':
+                self.disabled(self.host, self.backend, self.shutdown_sessions)
 
-        else:
-            self.module.fail_json(msg="unknown state specified: '%s'" % self.state)
+            else:
+                self.module.fail_json(msg="unknown state specified: '%s'" % self.state)
+        except TimeoutException:
+            self.module.fail_json(msg="timed out waiting for haproxy on %s" % self.socket)
+        except socket.error, e:
+            self.module.fail_json(msg="haproxy socket %s: %s" % (self.socket, e))
 
-        self.module.exit_json(stdout=self.command_results, changed=True)
+        self.close()
+        self.module.exit_json(stdout='\n'.join(self.command_results), changed=self.changed)
 
 def main():
 
@@ -235,7 +405,11 @@ def main():
             backend=dict(required=False, default=None),
             weight=dict(required=False, default=None),
             socket = dict(required=False, default=DEFAULT_SOCKET_LOCATION),
-            shutdown_sessions=dict(required=False, default=False),
+            shutdown_sessions=dict(required=False, default=False, type='bool'),
+            wait=dict(required=False, default=False, type='bool'),
+            drain_timeout=dict(required=False, default=300, type='int'),
+            poll_interval=dict(required=False, default=1, type='int'),
+            timeout=dict(required=False, default=30, type='int'),
         ),
 
     )
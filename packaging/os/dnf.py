@@ -134,22 +134,35 @@ def log(msg):
     syslog.openlog('ansible-dnf', 0, syslog.LOG_USER)
     syslog.syslog(syslog.LOG_NOTICE, msg)
 
-def dnf_base(conf_file=None, cachedir=False):
+def dnf_base(conf_file=None, en_repos=[], dis_repos=[], disable_gpg_check=False,
+             load_available_repos=True):
+    """ Returns a dnf.Base with the repositories set up and the sack
+    (installed and, unless told otherwise, available packages) loaded,
+    once per task. """
 
     my = dnf.Base()
-    my.logging.verbose_level=0
-    my.logging.verbose_level=0
     if conf_file and os.path.exists(conf_file):
-        my.config = conf_file
-    if cachedir or os.geteuid() != 0:
-     if cachedir or os.geteuid() != 0:
-         if hasattr(my, 'setCacheDir'):
-             my.setCacheDir()
-         else:
-             cachedir = cachedir.dnf.Conf()
-             my.repos.setCacheDir(cachedir)
-             my.conf.cache = 0
-
+        my.conf.config_file_path = conf_file
+        my.conf.read()
+    if os.geteuid() != 0:
+        # use a per-user cache when not running as root
+        my.conf.cachedir = dnf.yum.misc.getCacheDir()
+
+    my.read_all_repos()
+    for rid in dis_repos:
+        for repo in my.repos.get_matching(rid):
+            repo.disable()
+    for rid in en_repos:
+        repos = my.repos.get_matching(rid)
+        if not repos:
+            raise dnf.exceptions.RepoError("Unknown repo: '%s'" % rid)
+        for repo in repos:
+            repo.enable()
+    if disable_gpg_check:
+        for repo in my.repos.iter_enabled():
+            repo.gpgcheck = False
+
+    my.fill_sack(load_system_repo=True, load_available_repos=load_available_repos)
     return my
 
 def install_dnf_utils(module):
@@ -300,56 +313,6 @@ def is_update(module, repoq, pkgspec, conf_file, qf=def_qf, en_repos=[], dis_rep
             
     return []
 
-def what_provides(module, repoq, req_spec, conf_file,  qf=def_qf, en_repos=[], dis_repos=[]):
-
-    if not repoq:
-
-        pkgs = []
-        try:
-            my = dnf_base(conf_file)
-            for rid in en_repos:
-                my.repos.enableRepo(rid)
-            for rid in dis_repos:
-                my.repos.disableRepo(rid)
-
-            pkgs = my.returnPackagesByDep(req_spec) + my.returnInstalledPackagesByDep(req_spec)
-            if not pkgs:
-                e,m,u = my.pkgSack.matchPackageNames([req_spec])
-                pkgs.extend(e)
-                pkgs.extend(m)
-                e,m,u = my.rpmdb.matchPackageNames([req_spec])
-                pkgs.extend(e)
-                pkgs.extend(m)
-        except Exception, e:
-            module.fail_json(msg="Failure talking to dnf: %s" % e)
-
-        return set([ po_to_nevra(p) for p in pkgs ])
-
-    else:
-        myrepoq = list(repoq)
-        for repoid in dis_repos:
-            r_cmd = ['--disablerepo', repoid]
-            myrepoq.extend(r_cmd)
-
-        for repoid in en_repos:
-            r_cmd = ['--enablerepo', repoid]
-            myrepoq.extend(r_cmd)
-
-        cmd = myrepoq + ["--qf", qf, "--whatprovides", req_spec]
-        rc,out,err = module.run_command(cmd)
-        cmd = myrepoq + ["--qf", qf, req_spec]
-        rc2,out2,err2 = module.run_command(cmd)
-        if rc == 0 and rc2 == 0:
-            out += out2
-            pkgs = set([ p for p in out.split('\n') if p.strip() ])
-            if not pkgs:
-                pkgs = is_installed(module, repoq, req_spec, conf_file, qf=qf)
-            return pkgs
-        else:
-            module.fail_json(msg='Error from repoquery: %s: %s' % (cmd, err + err2))
-
-    return []
-
 def transaction_exists(pkglist):
     """ 
     checks the package list to see if any packages are 
@@ -389,17 +352,6 @@ def transaction_exists(pkglist):
                     break
     return conflicts
 
-def local_nvra(module, path):
-    """return nvra of a local rpm passed in"""
-    
-    cmd = ['/bin/rpm', '-qp' ,'--qf', 
-            '%{name}-%{version}-%{release}.%{arch}\n', path ]
-    rc, out, err = module.run_command(cmd)
-    if rc != 0:
-        return None
-    nvra = out.split('\n')[0]
-    return nvra
-    
 def pkg_to_dict(pkgstr):
 
     if pkgstr.strip():
@@ -451,180 +403,134 @@ def list_stuff(module, conf_file, stuff):
     else:
         return [ pkg_to_dict(p) for p in is_installed(module, repoq, stuff, conf_file, qf=qf) + is_available(module, repoq, stuff, conf_file, qf=qf) if p.strip() ]
 
-def install(module, items, repoq, dnf_basecmd, conf_file, en_repos, dis_repos):
+def query_spec(my, spec):
+    """ Resolves a name, nevra, glob, provide or file require against the
+    loaded sack. """
 
-    res = {}
-    res['results'] = []
-    res['msg'] = ''
-    res['rc'] = 0
-    res['changed'] = False
+    return dnf.subject.Subject(spec).get_best_query(my.sack)
 
-    for spec in items:
-        pkg = None
-
-        # check if pkgspec is installed (if possible for idempotence)
-        # localpkg
-        if spec.endswith('.rpm') and '://' not in spec:
-            # get the pkg name-v-r.arch
-            if not os.path.exists(spec):
-                res['msg'] += "No Package file matching '%s' found on system" % spec
-                module.fail_json(**res)
-
-            nvra = local_nvra(module, spec)
-            # look for them in the rpmdb
-            if is_installed(module, repoq, nvra, conf_file, en_repos=en_repos, dis_repos=dis_repos):
-                # if they are there, skip it
-                continue
-            pkg = spec
-
-        # URL
-        elif '://' in spec:
-            pkg = spec
-
-        #groups :(
-        elif  spec.startswith('@'):
-            # complete wild ass guess b/c it's a group
-            pkg = spec
-
-        # range requires or file-requires or pkgname :(
-        else:
-            # most common case is the pkg is already installed and done
-            # short circuit all the bs - and search for it as a pkg in is_installed
-            # if you find it then we're done
-            if not set(['*','?']).intersection(set(spec)):
-                pkgs = is_installed(module, repoq, spec, conf_file, en_repos=en_repos, dis_repos=dis_repos, is_pkg=True)
-                if pkgs:
-                    res['results'].append('%s providing %s is already installed' % (pkgs[0], spec))
-                    continue
-            
-            # look up what pkgs provide this
-            pkglist = what_provides(module, repoq, spec, conf_file, en_repos=en_repos, dis_repos=dis_repos)
-            if not pkglist:
-                res['msg'] += "No Package matching '%s' found available, installed or updated" % spec
-                module.fail_json(**res)
-
-            # if any of the packages are involved in a transaction, fail now
-            # so that we don't hang on the dnf operation later
-            conflicts = transaction_exists(pkglist)
-            if len(conflicts) > 0:
-                res['msg'] += "The following packages have pending transactions: %s" % ", ".join(conflicts)
-                module.fail_json(**res)
-
-            # if any of them are installed
-            # then nothing to do
-
-            found = False
-            for this in pkglist:
-                if is_installed(module, repoq, this, conf_file, en_repos=en_repos, dis_repos=dis_repos, is_pkg=True):
-                    found = True
-                    res['results'].append('%s providing %s is already installed' % (this, spec))
-                    break
+def mark_group(my, spec, action):
 
-            # if the version of the pkg you have installed is not in ANY repo, but there are
-            # other versions in the repos (both higher and lower) then the previous checks won't work.
-            # so we check one more time. This really only works for pkgname - not for file provides or virt provides
-            # but virt provides should be all caught in what_provides on its own.
-            # highly irritating
-            if not found:
-                if is_installed(module, repoq, spec, conf_file, en_repos=en_repos, dis_repos=dis_repos):
-                    found = True
-                    res['results'].append('package providing %s is already installed' % (spec))
-                    
-            if found:
-                continue
-
-            # if not - then pass in the spec as what to install
-            # we could get here if nothing provides it but that's not
-            # the error we're catching here
-            pkg = spec
-
-        cmd = dnf_basecmd + ['install', pkg]
-
-        if module.check_mode:
-            module.exit_json(changed=True)
-
-        changed = True
-
-        rc, out, err = module.run_command(cmd)
-
-        # Fail on invalid urls:
-        if (rc == 1 and '://' in spec and ('No package %s available.' % spec in out or 'Cannot open: %s. Skipping.' % spec in err)):
-            err = 'Package at %s could not be installed' % spec
-            module.fail_json(changed=False,msg=err,rc=1)
-        elif (rc != 0 and 'Nothing to do' in err) or 'Nothing to do' in out:
-            # avoid failing in the 'Nothing To Do' case
-            # this may happen with an URL spec.
-            # for an already installed group,
-            # we get rc = 0 and 'Nothing to do' in out, not in err.
-            rc = 0
-            err = ''
-            out = '%s: Nothing to do' % spec
-            changed = False
-
-        res['rc'] += rc
-        res['results'].append(out)
-        res['msg'] += err
-
-        # FIXME - if we did an install - go and check the rpmdb to see if it actually installed
-        # look for the pkg in rpmdb
-        # look for the pkg via obsoletes
-
-        # accumulate any changes
-        res['changed'] |= changed
+    if my.comps is None:
+        my.read_comps()
+    group = my.comps.group_by_pattern(spec[1:])
+    if not group:
+        raise dnf.exceptions.MarkingError("No group '%s' available" % spec[1:])
 
-    module.exit_json(**res)
+    if action == 'install':
+        my.group_install(group, dnf.const.GROUP_PACKAGE_TYPES)
+    elif action == 'remove':
+        my.group_remove(group)
+    else:
+        my.group_upgrade(group)
+
+def check_signatures(module, my, pkgs, res):
+
+    for po in pkgs:
+        result, err = my.package_signature_check(po)
+        if result == 1:
+            # the key is not imported yet, import it from the repo config
+            my.package_import_key(po, askcb=lambda po, userid, hexkeyid: True)
+            result, err = my.package_signature_check(po)
+        if result != 0:
+            res['msg'] += err
+            module.fail_json(**res)
+
+def run_transaction(module, my, res, disable_gpg_check):
+    """ Resolves everything marked for the whole list at once, then
+    downloads and runs a single transaction. """
+
+    try:
+        if not my.resolve():
+            module.exit_json(**res)
+    except dnf.exceptions.DepsolveError, e:
+        res['msg'] += "Depsolve Error occured: %s" % e
+        module.fail_json(**res)
+
+    install_set = list(my.transaction.install_set)
+    remove_set = list(my.transaction.remove_set)
+
+    # if any of the packages are involved in a transaction, fail now
+    # so that we don't hang on the dnf operation later
+    conflicts = transaction_exists([po_to_nevra(po) for po in install_set])
+    if len(conflicts) > 0:
+        res['msg'] += "The following packages have pending transactions: %s" % ", ".join(conflicts)
+        module.fail_json(**res)
+
+    res['changed'] = True
+    res['results'].extend(['Installed: %s' % po_to_nevra(po) for po in install_set])
+    res['results'].extend(['Removed: %s' % po_to_nevra(po) for po in remove_set])
+
+    if module.check_mode:
+        module.exit_json(**res)
+
+    try:
+        my.download_packages(install_set)
+        if not disable_gpg_check:
+            check_signatures(module, my, install_set, res)
+        my.do_transaction()
+    except dnf.exceptions.Error, e:
+        res['rc'] = 1
+        res['msg'] += str(e)
+        module.fail_json(**res)
 
+    module.exit_json(**res)
 
-def remove(module, items, repoq, dnf_basecmd, conf_file, en_repos, dis_repos):
+def install(module, items, my, disable_gpg_check):
 
     res = {}
     res['results'] = []
     res['msg'] = ''
-    res['changed'] = False
     res['rc'] = 0
+    res['changed'] = False
 
-    for pkg in items:
-        is_group = False
-        # group remove - this is doom on a stick
-        if pkg.startswith('@'):
-            is_group = True
-        else:
-            if not is_installed(module, repoq, pkg, conf_file, en_repos=en_repos, dis_repos=dis_repos):
-                res['results'].append('%s is not installed' % pkg)
-                continue
-
-        # run an actual dnf transaction
-        cmd = dnf_basecmd + ["remove", pkg]
-
-        if module.check_mode:
-            module.exit_json(changed=True)
+    installed = my.sack.query().installed()
 
-        rc, out, err = module.run_command(cmd)
+    for spec in items:
+        try:
+            # URL or localpkg
+            if spec.endswith('.rpm') or '://' in spec:
+                if '://' not in spec and not os.path.exists(spec):
+                    res['msg'] += "No Package file matching '%s' found on system" % spec
+                    module.fail_json(**res)
+
+                if module.check_mode and '://' in spec:
+                    # don't download anything in check mode
+                    res['results'].append('%s would be installed' % spec)
+                    res['changed'] = True
+                    continue
 
-        res['rc'] += rc
-        res['results'].append(out)
-        res['msg'] += err
+                for po in my.add_remote_rpms([spec]):
+                    # look for them in the rpmdb, if they are there, skip it
+                    if installed.filter(name=po.name, evr=po.evr, arch=po.arch):
+                        res['results'].append('%s is already installed' % po_to_nevra(po))
+                    else:
+                        my.package_install(po)
 
-        # compile the results into one batch. If anything is changed 
-        # then mark changed
-        # at the end - if we've end up failed then fail out of the rest
-        # of the process
+            #groups :(
+            elif spec.startswith('@'):
+                mark_group(my, spec, 'install')
 
-        # at this point we should check to see if the pkg is no longer present
-        
-        if not is_group: # we can't sensibly check for a group being uninstalled reliably
-            # look to see if the pkg shows up from is_installed. If it doesn't
-            if not is_installed(module, repoq, pkg, conf_file, en_repos=en_repos, dis_repos=dis_repos):
-                res['changed'] = True
+            # range requires or file-requires or pkgname
             else:
-                module.fail_json(**res)
+                pkgs = query_spec(my, spec).installed()
+                if pkgs:
+                    res['results'].append('%s providing %s is already installed' % (po_to_nevra(pkgs[0]), spec))
+                    continue
+
+                my.install(spec)
 
-        if rc != 0:
+        except dnf.exceptions.MarkingError:
+            res['msg'] += "No Package matching '%s' found available, installed or updated" % spec
+            module.fail_json(**res)
+        except dnf.exceptions.Error, e:
+            res['msg'] += "Package at %s could not be installed: %s" % (spec, e)
             module.fail_json(**res)
-            
-    module.exit_json(**res)
 
-def latest(module, items, repoq, dnf_basecmd, conf_file, en_repos, dis_repos):
+    run_transaction(module, my, res, disable_gpg_check)
+
+
+def remove(module, items, my, disable_gpg_check):
 
     res = {}
     res['results'] = []
@@ -633,78 +539,54 @@ def latest(module, items, repoq, dnf_basecmd, conf_file, en_repos, dis_repos):
     res['rc'] = 0
 
     for spec in items:
+        try:
+            # group remove - this is doom on a stick
+            if spec.startswith('@'):
+                mark_group(my, spec, 'remove')
+            elif not my.remove(spec):
+                res['results'].append('%s is not installed' % spec)
+        except dnf.exceptions.MarkingError:
+            res['results'].append('%s is not installed' % spec)
+        except dnf.exceptions.Error, e:
+            res['msg'] += "%s could not be removed: %s" % (spec, e)
+            module.fail_json(**res)
 
-        pkg = None
-        basecmd = 'update'
-        cmd = ''
-        # groups, again
-        if spec.startswith('@'):
-            pkg = spec
-        
-        elif spec == '*': #update all
-            # use check-update to see if there is any need
-            rc,out,err = module.run_command(dnf_basecmd + ['check-update'])
-            if rc == 100:
-                cmd = dnf_basecmd + [basecmd]
-            else:
-                res['results'].append('All packages up to date')
-                continue
-        
-        # dep/pkgname  - find it
-        else:
-            if is_installed(module, repoq, spec, conf_file, en_repos=en_repos, dis_repos=dis_repos):
-                basecmd = 'update'
-            else:
-                basecmd = 'install'
-
-            pkglist = what_provides(module, repoq, spec, conf_file, en_repos=en_repos, dis_repos=dis_repos)
-            if not pkglist:
-                res['msg'] += "No Package matching '%s' found available, installed or updated" % spec
-                module.fail_json(**res)
-            
-            nothing_to_do = True
-            for this in pkglist:
-                if basecmd == 'install' and is_available(module, repoq, this, conf_file, en_repos=en_repos, dis_repos=dis_repos):
-                    nothing_to_do = False
-                    break
-                    
-                if basecmd == 'update' and is_update(module, repoq, this, conf_file, en_repos=en_repos, dis_repos=en_repos):
-                    nothing_to_do = False
-                    break
-                    
-            if nothing_to_do:
-                res['results'].append("All packages providing %s are up to date" % spec)
-                continue
+    run_transaction(module, my, res, disable_gpg_check)
 
-            # if any of the packages are involved in a transaction, fail now
-            # so that we don't hang on the dnf operation later
-            conflicts = transaction_exists(pkglist)
-            if len(conflicts) > 0:
-                res['msg'] += "The following packages have pending transactions: %s" % ", ".join(conflicts)
-                module.fail_json(**res)
+def latest(module, items, my, disable_gpg_check):
 
-            pkg = spec
-        if not cmd:
-            cmd = dnf_basecmd + [basecmd, pkg]
+    res = {}
+    res['results'] = []
+    res['msg'] = ''
+    res['changed'] = False
+    res['rc'] = 0
 
-        if module.check_mode:
-            return module.exit_json(changed=True)
+    for spec in items:
+        try:
+            # groups, again
+            if spec.startswith('@'):
+                mark_group(my, spec, 'upgrade')
 
-        rc, out, err = module.run_command(cmd)
+            elif spec == '*': #update all
+                my.upgrade_all()
 
-        res['rc'] += rc
-        res['results'].append(out)
-        res['msg'] += err
+            # dep/pkgname  - find it
+            else:
+                pkgs = query_spec(my, spec)
+                if not pkgs:
+                    res['msg'] += "No Package matching '%s' found available, installed or updated" % spec
+                    module.fail_json(**res)
 
-        # FIXME if it is - update it and check to see if it applied
-        # check to see if there is no longer an update available for the pkgspec
+                if pkgs.installed():
+                    my.upgrade(spec)
+                else:
+                    my.install(spec)
 
-        if rc:
-            res['failed'] = True
-        else:
-            res['changed'] = True
+        except dnf.exceptions.Error, e:
+            res['msg'] += "%s: %s" % (spec, e)
+            module.fail_json(**res)
 
-    module.exit_json(**res)
+    run_transaction(module, my, res, disable_gpg_check)
 
 def ensure(module, state, pkgspec, conf_file, enablerepo, disablerepo,
            disable_gpg_check):
@@ -712,66 +594,33 @@ def ensure(module, state, pkgspec, conf_file, enablerepo, disablerepo,
     # take multiple args comma separated
     items = pkgspec.split(',')
 
-    # need debug level 2 to get 'Nothing to do' for groupinstall.
-    dnf_basecmd = [dnfbin, '-d', '2', '-y']
-
-        
-    if not repoquery:
-        repoq = None
-    else:
-        repoq = [repoquery, '--show-duplicates', '--plugins', '--quiet', '-q']
-
-    if conf_file and os.path.exists(conf_file):
-        dnf_basecmd += ['-c', conf_file]
-        if repoq:
-            repoq += ['-c', conf_file]
-
     dis_repos =[]
     en_repos = []
     if disablerepo:
         dis_repos = disablerepo.split(',')
     if enablerepo:
         en_repos = enablerepo.split(',')
-           
-    for repoid in dis_repos:
-        r_cmd = ['--disablerepo=%s' % repoid]
-        dnf_basecmd.extend(r_cmd)
 
-    for repoid in en_repos:
-        r_cmd = ['--enablerepo=%s' % repoid]
-        dnf_basecmd.extend(r_cmd)
+    # removing packages only needs the rpmdb, group removal still needs
+    # the comps from the repos
+    load_available_repos = state not in ['removed', 'absent'] or \
+        [spec for spec in items if spec.startswith('@')]
 
-    if state in ['installed', 'present', 'latest']:
-        my = dnf_base(conf_file)
-        try:
-            for r in dis_repos:
-                my.repos.disableRepo(r)
-
-            current_repos = dnf.yum.config.RepoConf()
-            for r in en_repos:
-                try:
-                    my.repos.enableRepo(r)
-                    new_repos = my.repos.repos.keys()
-                    for i in new_repos:
-                        if not i in current_repos:
-                            rid = my.repos.getRepo(i)
-                            a = rid.repoXML.repoid
-                    current_repos = new_repos
-                except dnf.exceptions.Error, e:
-                    module.fail_json(msg="Error setting/accessing repo %s: %s" % (r, e))
-        except dnf.exceptions.Error, e:
-            module.fail_json(msg="Error accessing repos: %s" % e)
+    # load the repos and the sack once for the whole list
+    try:
+        my = dnf_base(conf_file, en_repos, dis_repos, disable_gpg_check,
+                      bool(load_available_repos))
+    except dnf.exceptions.RepoError, e:
+        module.fail_json(msg="Error setting/accessing repos: %s" % e)
+    except dnf.exceptions.Error, e:
+        module.fail_json(msg="Failure talking to dnf: %s" % e)
 
     if state in ['installed', 'present']:
-        if disable_gpg_check:
-            dnf_basecmd.append('--nogpgcheck')
-        install(module, items, repoq, dnf_basecmd, conf_file, en_repos, dis_repos)
+        install(module, items, my, disable_gpg_check)
     elif state in ['removed', 'absent']:
-        remove(module, items, repoq, dnf_basecmd, conf_file, en_repos, dis_repos)
+        remove(module, items, my, disable_gpg_check)
     elif state == 'latest':
-        if disable_gpg_check:
-            dnf_basecmd.append('--nogpgcheck')
-        latest(module, items, repoq, dnf_basecmd, conf_file, en_repos, dis_repos)
+        latest(module, items, my, disable_gpg_check)
 
     # should be caught by AnsibleModule argument_spec
     return dict(changed=False, failed=True, results='', errors='unexpected state')
@@ -809,7 +658,8 @@ def main():
 
     # this should not be needed, but exists as a failsafe
     params = module.params
-    if params['install_repoquery'] and not repoquery and not module.check_mode:
+    # repoquery is only used to list packages
+    if params['list'] and params['install_repoquery'] and not repoquery and not module.check_mode:
         install_dnf_utils(module)
 
     if params['list']:
@@ -53,8 +53,6 @@ EXAMPLES = '''
 - macports: name=foo state=inactive
 '''
 
-import pipes
-
 def update_package_db(module, port_path):
     """ Updates packages list. """
 
@@ -64,121 +62,110 @@ def update_package_db(module, port_path):
         module.fail_json(msg="could not update package db")
 
 
-def query_package(module, port_path, name, state="present"):
-    """ Returns whether a package is installed or not. """
-
-    if state == "present":
+def get_installed_packages(module, port_path):
+    """ Returns a dict mapping each installed port to whether it is active, from one listing. """
 
-        rc, out, err = module.run_command("%s installed | grep -q ^.*%s" % (pipes.quote(port_path), pipes.quote(name)), use_unsafe_shell=True)
-        if rc == 0:
-            return True
+    rc, out, err = module.run_command("%s installed" % port_path)
 
-        return False
-
-    elif state == "active":
+    installed = {}
+    for line in out.splitlines():
+        # lines look like "  curl @7.38.0_0+ssl (active)", after a header
+        if not line.startswith(" "):
+            continue
+        fields = line.split()
+        if fields:
+            installed[fields[0]] = installed.get(fields[0], False) or "(active)" in fields
+    return installed
 
-        rc, out, err = module.run_command("%s installed %s | grep -q active" % (pipes.quote(port_path), pipes.quote(name)), use_unsafe_shell=True)
 
-        if rc == 0:
-            return True
+def run_port_command(module, port_path, command, packages):
+    """ Runs one port command for all packages and returns a fresh listing to verify it. """
 
-        return False
+    rc, out, err = module.run_command("%s %s %s" % (port_path, command, " ".join(packages)))
+    return out, get_installed_packages(module, port_path)
 
 
 def remove_packages(module, port_path, packages):
     """ Uninstalls one or more packages if installed. """
 
-    remove_c = 0
-    # Using a for loop incase of error, we can report the package that failed
-    for package in packages:
-        # Query the package first, to see if we even need to remove
-        if not query_package(module, port_path, package):
-            continue
-
-        rc, out, err = module.run_command("%s uninstall %s" % (port_path, package))
-
-        if query_package(module, port_path, package):
-            module.fail_json(msg="failed to remove %s: %s" % (package, out))
+    # Query the packages first, to see if we even need to remove
+    installed = get_installed_packages(module, port_path)
+    to_remove = [package for package in packages if package in installed]
 
-        remove_c += 1
+    if not to_remove:
+        module.exit_json(changed=False, msg="package(s) already absent")
 
-    if remove_c > 0:
+    out, installed = run_port_command(module, port_path, "uninstall", to_remove)
 
-        module.exit_json(changed=True, msg="removed %s package(s)" % remove_c)
+    failed = [package for package in to_remove if package in installed]
+    if failed:
+        module.fail_json(msg="failed to remove %s: %s" % (", ".join(failed), out))
 
-    module.exit_json(changed=False, msg="package(s) already absent")
+    module.exit_json(changed=True, msg="removed %s package(s)" % len(to_remove))
 
 
 def install_packages(module, port_path, packages):
     """ Installs one or more packages if not already installed. """
 
-    install_c = 0
+    installed = get_installed_packages(module, port_path)
+    to_install = [package for package in packages if package not in installed]
 
-    for package in packages:
-        if query_package(module, port_path, package):
-            continue
-
-        rc, out, err = module.run_command("%s install %s" % (port_path, package))
-
-        if not query_package(module, port_path, package):
-            module.fail_json(msg="failed to install %s: %s" % (package, out))
+    if not to_install:
+        module.exit_json(changed=False, msg="package(s) already present")
 
-        install_c += 1
+    out, installed = run_port_command(module, port_path, "install", to_install)
 
-    if install_c > 0:
-        module.exit_json(changed=True, msg="installed %s package(s)" % (install_c))
+    failed = [package for package in to_install if package not in installed]
+    if failed:
+        module.fail_json(msg="failed to install %s: %s" % (", ".join(failed), out))
 
-    module.exit_json(changed=False, msg="package(s) already present")
+    module.exit_json(changed=True, msg="installed %s package(s)" % len(to_install))
 
 
 def activate_packages(module, port_path, packages):
     """ Activate a package if it's inactive. """
 
-    activate_c = 0
+    installed = get_installed_packages(module, port_path)
 
     for package in packages:
-        if not query_package(module, port_path, package):
+        if package not in installed:
             module.fail_json(msg="failed to activate %s, package(s) not present" % (package))
 
-        if query_package(module, port_path, package, state="active"):
-            continue
-
-        rc, out, err = module.run_command("%s activate %s" % (port_path, package))
+    to_activate = [package for package in packages if not installed[package]]
 
-        if not query_package(module, port_path, package, state="active"):
-            module.fail_json(msg="failed to activate %s: %s" % (package, out))
+    if not to_activate:
+        module.exit_json(changed=False, msg="package(s) already active")
 
-        activate_c += 1
+    out, installed = run_port_command(module, port_path, "activate", to_activate)
 
-    if activate_c > 0:
-        module.exit_json(changed=True, msg="activated %s package(s)" % (activate_c))
+    failed = [package for package in to_activate if not installed.get(package)]
+    if failed:
+        module.fail_json(msg="failed to activate %s: %s" % (", ".join(failed), out))
 
-    module.exit_json(changed=False, msg="package(s) already active")
+    module.exit_json(changed=True, msg="activated %s package(s)" % len(to_activate))
 
 
 def deactivate_packages(module, port_path, packages):
     """ Deactivate a package if it's active. """
 
-    deactivated_c = 0
+    installed = get_installed_packages(module, port_path)
 
     for package in packages:
-        if not query_package(module, port_path, package):
+        if package not in installed:
             module.fail_json(msg="failed to activate %s, package(s) not present" % (package))
 
-        if not query_package(module, port_path, package, state="active"):
-            continue
-
-        rc, out, err = module.run_command("%s deactivate %s" % (port_path, package))
+    to_deactivate = [package for package in packages if installed[package]]
 
-        if query_package(module, port_path, package, state="active"):
-            module.fail_json(msg="failed to deactivated %s: %s" % (package, out))
+    if not to_deactivate:
+        module.exit_json(changed=False, msg="package(s) already inactive")
 
-        deactivated_c += 1
+    out, installed = run_port_command(module, port_path, "deactivate", to_deactivate)
 
-    if deactivated_c > 0:
-        module.exit_json(changed=True, msg="deactivated %s package(s)" % (deactivated_c))
+    failed = [package for package in to_deactivate if installed.get(package)]
+    if failed:
+        module.fail_json(msg="failed to deactivated %s: %s" % (", ".join(failed), out))
 
-    module.exit_json(changed=False, msg="package(s) already inactive")
+    module.exit_json(changed=True, msg="deactivated %s package(s)" % len(to_deactivate))
 
 
 def main():
@@ -34,7 +34,8 @@ options:
     name:
         required: true
         description:
-        - Name of the package.
+        - Name of the package, or a list of packages. All packages are
+          handled with a single pkg_add or pkg_delete run.
     state:
         required: true
         choices: [ present, latest, absent ]
@@ -48,6 +49,9 @@ EXAMPLES = '''
 # Make sure nmap is installed
 - openbsd_pkg: name=nmap state=present
 
+# Make sure several packages are installed in one pkg_add run
+- openbsd_pkg: name=nmap,tcpdump,vim--nox11 state=present
+
 # Make sure nmap is the latest version
 - openbsd_pkg: name=nmap state=latest
 
@@ -77,153 +81,114 @@ def execute_command(cmd, module):
     cmd_args = shlex.split(cmd)
     return module.run_command(cmd_args)
 
-# Function used for getting the name of a currently installed package.
-def get_current_name(name, pkg_spec, module):
-    info_cmd = 'pkg_info'
-    (rc, stdout, stderr) = execute_command("%s" % (info_cmd), module)
+# Function used for taking one snapshot of the installed packages.
+def get_installed_packages(module):
+    (rc, stdout, stderr) = execute_command('pkg_info', module)
     if rc != 0:
-        return (rc, stdout, stderr)
+        module.fail_json(msg="failed in get_installed_packages(): " + stderr)
 
+    return [line.split()[0] for line in stdout.splitlines() if line.strip()]
+
+# Function used for building the pattern matching installed packages for a
+# package spec, the way pkg_info -e would.
+def get_package_pattern(name, pkg_spec):
     if pkg_spec['version']:
-        pattern = "^%s" % name
+        pattern = "^%s$" % re.escape(name)
     elif pkg_spec['flavor']:
-        pattern = "^%s-.*-%s\s" % (pkg_spec['stem'], pkg_spec['flavor'])
+        pattern = "^%s-[0-9][^-]*-%s$" % (re.escape(pkg_spec['stem']), re.escape(pkg_spec['flavor']))
     else:
-        pattern = "^%s-" % pkg_spec['stem']
+        pattern = "^%s-[0-9]" % re.escape(pkg_spec['stem'])
 
     if debug:
-        syslog.syslog("get_current_name(): pattern = %s" % pattern)
+        syslog.syslog("get_package_pattern(): pattern = %s" % pattern)
 
-    for line in stdout.splitlines():
-        if debug:
-            syslog.syslog("get_current_name: line = %s" % line)
-        match = re.search(pattern, line)
-        if match:
-            current_name = line.split()[0]
-
-    return current_name
+    return re.compile(pattern)
 
-# Function used to find out if a package is currently installed.
-def get_package_state(name, pkg_spec, module):
-    info_cmd = 'pkg_info -e'
+# Function used for getting the name of a currently installed package.
+def get_current_name(pattern, installed_packages):
+    current_name = None
+    for pkgname in installed_packages:
+        if pattern.search(pkgname):
+            current_name = pkgname
 
-    if pkg_spec['version']:
-        command = "%s %s" % (info_cmd, name)
-    elif pkg_spec['flavor']:
-        command = "%s %s-*-%s" % (info_cmd, pkg_spec['stem'], pkg_spec['flavor'])
-    else:
-        command = "%s %s-*" % (info_cmd, pkg_spec['stem'])
+    return current_name
 
-    rc, stdout, stderr = execute_command(command, module)
+# Function used for running one pkg_add or pkg_delete for several packages.
+def run_pkg_command(cmd, names, module):
+    (rc, stdout, stderr) = execute_command("%s %s" % (cmd, " ".join(names)), module)
+    return (rc, stdout, stderr)
 
-    if (stderr):
-        module.fail_json(msg="failed in get_package_state(): " + stderr)
+# Function used to check that the packages are installed after pkg_add,
+# since neither its return code nor stderr can be trusted for that.
+def verify_installed(names, patterns, module):
+    installed_packages = get_installed_packages(module)
+    return [name for name in names
+            if get_current_name(patterns[name], installed_packages) is None]
 
-    if rc == 0:
-        return True
-    else:
-        return False
-
-# Function used to make sure a package is present.
-def package_present(name, installed_state, pkg_spec, module):
+# Function used to make sure packages are present.
+def package_present(names, current_names, patterns, module):
     if module.check_mode:
         install_cmd = 'pkg_add -Imn'
     else:
         install_cmd = 'pkg_add -Im'
 
-    if installed_state is False:
-
-        # Attempt to install the package
-        (rc, stdout, stderr) = execute_command("%s %s" % (install_cmd, name), module)
+    missing = [name for name in names if current_names[name] is None]
+    if not missing:
+        return (0, '', '', False)
 
-        # The behaviour of pkg_add is a bit different depending on if a
-        # specific version is supplied or not.
-        #
-        # When a specific version is supplied the return code will be 0 when
-        # a package is found and 1 when it is not, if a version is not
-        # supplied the tool will exit 0 in both cases:
-        if pkg_spec['version']:
-            # Depend on the return code.
-            if debug:
-                syslog.syslog("package_present(): depending on return code")
-            if rc:
-                changed=False
-        else:
-            # Depend on stderr instead.
-            if debug:
-                syslog.syslog("package_present(): depending on stderr")
-            if stderr:
-                # There is a corner case where having an empty directory in
-                # installpath prior to the right location will result in a
-                # "file:/local/package/directory/ is empty" message on stderr
-                # while still installing the package, so we need to look for
-                # for a message like "packagename-1.0: ok" just in case.
-                match = re.search("\W%s-[^:]+: ok\W" % name, stdout)
-                if match:
-                    # It turns out we were able to install the package.
-                    if debug:
-                        syslog.syslog("package_present(): we were able to install package")
-                    pass
-                else:
-                    # We really did fail, fake the return code.
-                    if debug:
-                        syslog.syslog("package_present(): we really did fail")
-                    rc = 1
-                    changed=False
-            else:
-                if debug:
-                    syslog.syslog("package_present(): stderr was not set")
-
-        if rc == 0:
-            if module.check_mode:
-                module.exit_json(changed=True)
-
-            changed=True
+    # Attempt to install all missing packages at once.
+    (rc, stdout, stderr) = run_pkg_command(install_cmd, missing, module)
 
-    else:
-        rc = 0
-        stdout = ''
-        stderr = ''
-        changed=False
+    if module.check_mode:
+        # pkg_add exits 0 for packages it cannot find when no version is
+        # given, so look for its complaint on stderr as well.
+        failed = [name for name in missing
+                  if re.search("Can't find %s(\s|$)" % re.escape(name), stderr)]
+        if rc or failed:
+            stderr = "failed to install %s\n%s" % (", ".join(failed or missing), stderr)
+            return (1, stdout, stderr, False)
+        return (0, stdout, stderr, True)
+
+    failed = verify_installed(missing, patterns, module)
+    if failed:
+        if debug:
+            syslog.syslog("package_present(): failed to install %s" % failed)
+        stderr = "failed to install %s\n%s" % (", ".join(failed), stderr)
+        return (1, stdout, stderr, False)
 
-    return (rc, stdout, stderr, changed)
+    return (0, stdout, stderr, True)
 
-# Function used to make sure a package is the latest available version.
-def package_latest(name, installed_state, pkg_spec, module):
+# Function used to make sure packages are the latest available version.
+def package_latest(names, current_names, patterns, module):
     if module.check_mode:
         upgrade_cmd = 'pkg_add -umn'
     else:
         upgrade_cmd = 'pkg_add -um'
 
-    pre_upgrade_name = ''
-
-    if installed_state is True:
-
-        # Fetch name of currently installed package.
-        pre_upgrade_name = get_current_name(name, pkg_spec, module)
-
-        if debug:
-            syslog.syslog("package_latest(): pre_upgrade_name = %s" % pre_upgrade_name)
+    installed = [name for name in names if current_names[name] is not None]
+    rc = 0
+    stdout = ''
+    stderr = ''
+    changed = False
 
-        # Attempt to upgrade the package.
-        (rc, stdout, stderr) = execute_command("%s %s" % (upgrade_cmd, name), module)
+    if installed:
+        # Attempt to upgrade all installed packages at once.
+        (rc, stdout, stderr) = run_pkg_command(upgrade_cmd, installed, module)
 
         # Look for output looking something like "nmap-6.01->6.25: ok" to see if
         # something changed (or would have changed). Use \W to delimit the match
         # from progress meter output.
-        match = re.search("\W%s->.+: ok\W" % pre_upgrade_name, stdout)
-        if match:
-            if module.check_mode:
-                module.exit_json(changed=True)
-
-            changed = True
-        else:
-            changed = False
-
-        # FIXME: This part is problematic. Based on the issues mentioned (and
-        # handled) in package_present() it is not safe to blindly trust stderr
-        # as an indicator that the command failed, and in the case with
-        # empty installpath directories this will break.
+        for name in installed:
+            pre_upgrade_name = current_names[name]
+            if debug:
+                syslog.syslog("package_latest(): pre_upgrade_name = %s" % pre_upgrade_name)
+            if re.search("\W%s->.+: ok\W" % re.escape(pre_upgrade_name), stdout):
+                changed = True
+
+        # FIXME: This part is problematic. pkg_add may print to stderr while
+        # still succeeding (see verify_installed()), so it is not safe to
+        # blindly trust stderr as an indicator that the command failed, and
+        # in the case with empty installpath directories this will break.
         #
         # For now keep this safeguard here, but ignore it if we managed to
         # parse out a successful update above. This way we will report a
@@ -231,43 +196,32 @@ def package_latest(name, installed_state, pkg_spec, module):
         # otherwise.
         if changed != True:
             if stderr:
-                rc=1
+                rc = 1
+        if rc != 0:
+            return (rc, stdout, stderr, changed)
 
-        return (rc, stdout, stderr, changed)
+    # Packages that were not installed at all just need to be made present.
+    if debug:
+        syslog.syslog("package_latest(): calling package_present() for the packages not installed")
+    (present_rc, present_stdout, present_stderr, present_changed) = package_present(names, current_names, patterns, module)
 
-    else:
-        # If package was not installed at all just make it present.
-        if debug:
-            syslog.syslog("package_latest(): package is not installed, calling package_present()")
-        return package_present(name, installed_state, pkg_spec, module)
+    return (present_rc, stdout + present_stdout, stderr + present_stderr, changed or present_changed)
 
-# Function used to make sure a package is not installed.
-def package_absent(name, installed_state, module):
+# Function used to make sure packages are not installed.
+def package_absent(names, current_names, module):
     if module.check_mode:
         remove_cmd = 'pkg_delete -In'
     else:
         remove_cmd = 'pkg_delete -I'
 
-    if installed_state is True:
-
-        # Attempt to remove the package.
-        rc, stdout, stderr = execute_command("%s %s" % (remove_cmd, name), module)
-
-        if rc == 0:
-            if module.check_mode:
-                module.exit_json(changed=True)
-
-            changed=True
-        else:
-            changed=False
+    installed = [name for name in names if current_names[name] is not None]
+    if not installed:
+        return (0, '', '', False)
 
-    else:
-        rc = 0
-        stdout = ''
-        stderr = ''
-        changed=False
+    # Attempt to remove all installed packages at once.
+    rc, stdout, stderr = run_pkg_command(remove_cmd, installed, module)
 
-    return (rc, stdout, stderr, changed)
+    return (rc, stdout, stderr, rc == 0)
 
 # Function used to parse the package name based on packages-specs(7).
 # The general name structure is "stem-version[-flavors]".
@@ -361,7 +315,7 @@ def upgrade_packages(module):
 def main():
     module = AnsibleModule(
         argument_spec = dict(
-            name = dict(required=True),
+            name = dict(required=True, type='list'),
             state = dict(required=True, choices=['absent', 'installed', 'latest', 'present', 'removed']),
         ),
         supports_check_mode = True
@@ -377,27 +331,34 @@ def main():
     result['name'] = name
     result['state'] = state
 
-    if name == '*':
-        if state != 'latest':
-            module.fail_json(msg="the package name '*' is only valid when using state=latest")
+    if '*' in name:
+        if state != 'latest' or len(name) != 1:
+            module.fail_json(msg="the package name '*' is only valid alone and when using state=latest")
         else:
             # Perform an upgrade of all installed packages.
             (rc, stdout, stderr, changed) = upgrade_packages(module)
     else:
-        # Parse package name and put results in the pkg_spec dictionary.
-        pkg_spec = {}
-        parse_package_name(name, pkg_spec, module)
+        # Take one snapshot of the installed packages for all names.
+        installed_packages = get_installed_packages(module)
+
+        patterns = {}
+        current_names = {}
+        for pkgname in name:
+            # Parse package name and put results in the pkg_spec dictionary.
+            pkg_spec = {}
+            parse_package_name(pkgname, pkg_spec, module)
+            patterns[pkgname] = get_package_pattern(pkgname, pkg_spec)
 
-        # Get package state.
-        installed_state = get_package_state(name, pkg_spec, module)
+            # Get package state.
+            current_names[pkgname] = get_current_name(patterns[pkgname], installed_packages)
 
         # Perform requested action.
         if state in ['installed', 'present']:
-            (rc, stdout, stderr, changed) = package_present(name, installed_state, pkg_spec, module)
+            (rc, stdout, stderr, changed) = package_present(name, current_names, patterns, module)
         elif state in ['absent', 'removed']:
-            (rc, stdout, stderr, changed) = package_absent(name, installed_state, module)
+            (rc, stdout, stderr, changed) = package_absent(name, current_names, module)
         elif state == 'latest':
-            (rc, stdout, stderr, changed) = package_latest(name, installed_state, pkg_spec, module)
+            (rc, stdout, stderr, changed) = package_latest(name, current_names, patterns, module)
 
     if rc != 0:
         if stderr:
@@ -51,8 +51,6 @@ EXAMPLES = '''
 - opkg: name=foo,bar state=absent
 '''
 
-import pipes
-
 def update_package_db(module, opkg_path):
     """ Updates packages list. """
 
@@ -62,62 +60,56 @@ def update_package_db(module, opkg_path):
         module.fail_json(msg="could not update package db")
 
 
-def query_package(module, opkg_path, name, state="present"):
-    """ Returns whether a package is installed or not. """
-
-    if state == "present":
+def get_installed_packages(module, opkg_path):
+    """ Returns the names of all installed packages, from one listing. """
 
-        rc, out, err = module.run_command("%s list-installed | grep -q \"^%s \"" % (pipes.quote(opkg_path), pipes.quote(name)), use_unsafe_shell=True)
-        if rc == 0:
-            return True
+    rc, out, err = module.run_command("%s list-installed" % opkg_path)
+    if rc != 0:
+        module.fail_json(msg="could not list installed packages: %s" % err)
 
-        return False
+    # lines look like "name - version"
+    return set([line.split(" ")[0] for line in out.splitlines() if line.strip()])
 
 
 def remove_packages(module, opkg_path, packages):
     """ Uninstalls one or more packages if installed. """
 
-    remove_c = 0
-    # Using a for loop incase of error, we can report the package that failed
-    for package in packages:
-        # Query the package first, to see if we even need to remove
-        if not query_package(module, opkg_path, package):
-            continue
-
-        rc, out, err = module.run_command("%s remove %s" % (opkg_path, package))
+    # Query the packages first, to see if we even need to remove
+    installed = get_installed_packages(module, opkg_path)
+    to_remove = [package for package in packages if package in installed]
 
-        if query_package(module, opkg_path, package):
-            module.fail_json(msg="failed to remove %s: %s" % (package, out))
+    if not to_remove:
+        module.exit_json(changed=False, msg="package(s) already absent")
 
-        remove_c += 1
+    rc, out, err = module.run_command("%s remove %s" % (opkg_path, " ".join(to_remove)))
 
-    if remove_c > 0:
+    # verify against a fresh listing, so we can report the packages that failed
+    installed = get_installed_packages(module, opkg_path)
+    failed = [package for package in to_remove if package in installed]
+    if failed:
+        module.fail_json(msg="failed to remove %s: %s" % (", ".join(failed), out))
 
-        module.exit_json(changed=True, msg="removed %s package(s)" % remove_c)
-
-    module.exit_json(changed=False, msg="package(s) already absent")
+    module.exit_json(changed=True, msg="removed %s package(s)" % len(to_remove))
 
 
 def install_packages(module, opkg_path, packages):
     """ Installs one or more packages if not already installed. """
 
-    install_c = 0
-
-    for package in packages:
-        if query_package(module, opkg_path, package):
-            continue
-
-        rc, out, err = module.run_command("%s install %s" % (opkg_path, package))
+    installed = get_installed_packages(module, opkg_path)
+    to_install = [package for package in packages if package not in installed]
 
-        if not query_package(module, opkg_path, package):
-            module.fail_json(msg="failed to install %s: %s" % (package, out))
+    if not to_install:
+        module.exit_json(changed=False, msg="package(s) already present")
 
-        install_c += 1
+    rc, out, err = module.run_command("%s install %s" % (opkg_path, " ".join(to_install)))
 
-    if install_c > 0:
-        module.exit_json(changed=True, msg="installed %s package(s)" % (install_c))
+    # verify against a fresh listing, so we can report the packages that failed
+    installed = get_installed_packages(module, opkg_path)
+    failed = [package for package in to_install if package not in installed]
+    if failed:
+        module.fail_json(msg="failed to install %s: %s" % (", ".join(failed), out))
 
-    module.exit_json(changed=False, msg="package(s) already present")
+    module.exit_json(changed=True, msg="installed %s package(s)" % len(to_install))
 
 
 def main():
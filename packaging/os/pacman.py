@@ -88,38 +88,47 @@ import sys
 
 PACMAN_PATH = "/usr/bin/pacman"
 
-def get_version(pacman_output):
-    """Take pacman -Qi or pacman -Si output and get the Version"""
-    lines = pacman_output.split('\n')
-    for line in lines:
-        if 'Version' in line:
-            return line.split(':')[1].strip()
-    return None
-
-def query_package(module, name, state="present"):
+def get_package_index(module):
+    """Read the installed packages and the packages available in the sync
+    databases with one pacman call each. Returns two dicts mapping package
+    names to versions; the sync dict also holds 'repo/name' keys."""
+    installed = {}
+    rc, stdout, stderr = module.run_command("pacman -Q", check_rc=False)
+    for line in stdout.splitlines():
+        fields = line.split()
+        if len(fields) >= 2:
+            installed[fields[0]] = fields[1]
+
+    available = {}
+    rc, stdout, stderr = module.run_command("pacman -Sl", check_rc=False)
+    for line in stdout.splitlines():
+        fields = line.split()
+        if len(fields) >= 3:
+            repo, name, version = fields[:3]
+            # the first repository listing a package wins, as with pacman -S
+            available.setdefault(name, version)
+            available["%s/%s" % (repo, name)] = version
+
+    return installed, available
+
+def query_package(module, name, index):
     """Query the package status in both the local system and the repository. Returns a boolean to indicate if the package is installed, and a second boolean to indicate if the package is up-to-date."""
-    if state == "present":
-        lcmd = "pacman -Qi %s" % (name)
-        lrc, lstdout, lstderr = module.run_command(lcmd, check_rc=False)
-        if lrc != 0:
-            # package is not installed locally
-            return False, False
-        
-        # get the version installed locally (if any)
-        lversion = get_version(lstdout)
-        
-        rcmd = "pacman -Si %s" % (name)
-        rrc, rstdout, rstderr = module.run_command(rcmd, check_rc=False)
-        # get the version in the repository
-        rversion = get_version(rstdout)
-
-        if rrc == 0:
-            # Return True to indicate that the package is installed locally, and the result of the version number comparison
-            # to determine if the package is up-to-date.
-            return True, (lversion == rversion)
+    installed, available = index
 
+    # get the version installed locally (if any)
+    lversion = installed.get(name.split('/')[-1])
+    if lversion is None:
+        # package is not installed locally
         return False, False
 
+    # get the version in the repository; packages that are not in any
+    # repository cannot be upgraded
+    rversion = available.get(name, lversion)
+
+    # Return True to indicate that the package is installed locally, and the result of the version number comparison
+    # to determine if the package is up-to-date.
+    return True, (lversion == rversion)
+
 
 def update_package_db(module):
     cmd = "pacman -Syy"
@@ -131,67 +140,92 @@ def update_package_db(module):
         module.fail_json(msg="could not update package db")
 
 
-def remove_packages(module, packages):
-    if module.params["recurse"]:
-        args = "Rs"
-    else:
-        args = "R"
+def find_failing_targets(module, args, targets):
+    """Bisect targets with --print dry runs, which resolve the transaction
+    without applying it, down to the targets that fail on their own."""
+    cmd = "pacman %s --print %s --noconfirm" % (args, " ".join(targets))
+    rc, stdout, stderr = module.run_command(cmd, check_rc=False)
+    if rc == 0:
+        return []
+    if len(targets) == 1:
+        return targets
 
-    remove_c = 0
-    # Using a for loop incase of error, we can report the package that failed
-    for package in packages:
-        # Query the package first, to see if we even need to remove
-        installed, updated = query_package(module, package)
-        if not installed:
-            continue
+    half = len(targets) / 2
+    return (find_failing_targets(module, args, targets[:half]) +
+            find_failing_targets(module, args, targets[half:]))
+
+
+def run_transaction(module, args, targets, action):
+    """Run a single pacman transaction for all targets. pacman applies
+    nothing when a transaction fails, so on failure the culprit is looked up
+    with dry runs only and reported without touching the system."""
+    cmd = "pacman %s %s --noconfirm" % (args, " ".join(targets))
+    rc, stdout, stderr = module.run_command(cmd, check_rc=False)
+    if rc == 0:
+        return
+
+    failing = find_failing_targets(module, args, targets)
+    if failing:
+        module.fail_json(msg="failed to %s %s" % (action, " ".join(failing)),
+                         stdout=stdout, stderr=stderr)
 
-        cmd = "pacman -%s %s --noconfirm" % (args, package)
-        rc, stdout, stderr = module.run_command(cmd, check_rc=False)
+    # every target resolves on its own, so only the combination failed
+    module.fail_json(msg="failed to %s %s together" % (action, " ".join(targets)),
+                     stdout=stdout, stderr=stderr)
 
-        if rc != 0:
-            module.fail_json(msg="failed to remove %s" % (package))
 
-        remove_c += 1
+def remove_packages(module, packages, index):
+    if module.params["recurse"]:
+        args = "-Rs"
+    else:
+        args = "-R"
+
+    # Query the packages first, to see if we even need to remove
+    targets = []
+    for package in packages:
+        installed, updated = query_package(module, package, index)
+        if installed:
+            targets.append(package)
 
-    if remove_c > 0:
+    if targets:
+        run_transaction(module, args, targets, "remove")
 
-        module.exit_json(changed=True, msg="removed %s package(s)" % remove_c)
+        module.exit_json(changed=True, msg="removed %s package(s)" % len(targets))
 
     module.exit_json(changed=False, msg="package(s) already absent")
 
 
-def install_packages(module, state, packages, package_files):
-    install_c = 0
+def install_packages(module, state, packages, package_files, index):
+    sync_targets = []
+    file_targets = []
 
     for i, package in enumerate(packages):
         # if the package is installed and state == present or state == latest and is up-to-date then skip
-        installed, updated = query_package(module, package)
+        installed, updated = query_package(module, package, index)
         if installed and (state == 'present' or (state == 'latest' and updated)):
             continue
 
         if package_files[i]:
-            params = '-U %s' % package_files[i]
+            file_targets.append(package_files[i])
         else:
-            params = '-S %s' % package
-
-        cmd = "pacman %s --noconfirm" % (params)
-        rc, stdout, stderr = module.run_command(cmd, check_rc=False)
+            sync_targets.append(package)
 
-        if rc != 0:
-            module.fail_json(msg="failed to install %s" % (package))
-
-        install_c += 1
+    if file_targets:
+        run_transaction(module, "-U", file_targets, "install")
+    if sync_targets:
+        run_transaction(module, "-S", sync_targets, "install")
 
+    install_c = len(file_targets) + len(sync_targets)
     if install_c > 0:
         module.exit_json(changed=True, msg="installed %s package(s)" % (install_c))
 
     module.exit_json(changed=False, msg="package(s) already installed")
 
 
-def check_packages(module, packages, state):
+def check_packages(module, packages, state, index):
     would_be_changed = []
     for package in packages:
-        installed, updated = query_package(module, package)
+        installed, updated = query_package(module, package, index)
         if ((state in ["present", "latest"] and not installed) or
                 (state == "absent" and installed) or
                 (state == "latest" and not updated)):
@@ -247,13 +281,15 @@ def main():
             else:
                 pkg_files.append(None)
 
+        index = get_package_index(module)
+
         if module.check_mode:
-            check_packages(module, pkgs, p['state'])
+            check_packages(module, pkgs, p['state'], index)
 
         if p['state'] in ['present', 'latest']:
-            install_packages(module, p['state'], pkgs, pkg_files)
+            install_packages(module, p['state'], pkgs, pkg_files, index)
         elif p['state'] == 'absent':
-            remove_packages(module, pkgs)
+            remove_packages(module, pkgs, index)
 
 # import module snippets
 from ansible.module_utils.basic import *
@@ -67,49 +67,21 @@ import os
 import sys
 import pipes
 
-def query_package(module, pkgin_path, name):
-    """Search for the package by name.
-
-    Possible return values:
-    * "present"  - installed, no upgrade needed
-    * "outdated" - installed, but can be upgraded
-    * False      - not installed or not found
-    """
-
-    # Use "pkgin search" to find the package. The regular expression will
-    # only match on the complete name.
-    rc, out, err = module.run_command("%s search \"^%s$\"" % (pkgin_path, name))
-
-    # rc will not be 0 unless the search was a success
-    if rc == 0:
-
-        # Get first line
-        line = out.split('\n')[0]
-
-        # Break up line at spaces.  The first part will be the package with its
-        # version (e.g. 'gcc47-libs-4.7.2nb4'), and the second will be the state
-        # of the package:
-        #     ''  - not installed
-        #     '<' - installed but out of date
-        #     '=' - installed and up to date
-        #     '>' - installed but newer than the repository version
-        pkgname_with_version, raw_state = out.split(' ')[0:2]
-
-        # Strip version
-        # (results in sth like 'gcc47-libs')
-        pkgname_without_version = '-'.join(pkgname_with_version.split('-')[:-1])
-
-        if name != pkgname_without_version:
-            return False
-        # no fall-through
-
-        # The package was found; now return its state
-        if raw_state == '<':
-            return 'outdated'
-        elif raw_state == '=' or raw_state == '>':
-            return 'present'
-        else:
-            return False
+def get_installed_packages(module, pkgin_path):
+    """Return the names of all installed packages, from one listing."""
+
+    rc, out, err = module.run_command("%s -p list" % pkgin_path)
+    if rc != 0:
+        module.fail_json(msg="could not list installed packages: %s" % err)
+
+    installed = set()
+    for line in out.splitlines():
+        # Parsable lines look like 'gcc47-libs-4.7.2nb4;comment'; strip the
+        # comment and the version (results in sth like 'gcc47-libs')
+        pkgname_with_version = line.split(';')[0]
+        if pkgname_with_version:
+            installed.add('-'.join(pkgname_with_version.split('-')[:-1]))
+    return installed
 
 
 def format_action_message(module, action, count):
@@ -140,48 +112,45 @@ def format_pkgin_command(module, pkgin_path, command, package):
 
 def remove_packages(module, pkgin_path, packages):
 
-    remove_c = 0
-
-    # Using a for loop incase of error, we can report the package that failed
-    for package in packages:
-        # Query the package first, to see if we even need to remove
-        if not query_package(module, pkgin_path, package):
-            continue
+    # Query the packages first, to see if we even need to remove
+    installed = get_installed_packages(module, pkgin_path)
+    to_remove = [package for package in packages if package in installed]
 
-        rc, out, err = module.run_command(
-            format_pkgin_command(module, pkgin_path, "remove", package))
+    if not to_remove:
+        module.exit_json(changed=False, msg="package(s) already absent")
 
-        if not module.check_mode and query_package(module, pkgin_path, package):
-            module.fail_json(msg="failed to remove %s: %s" % (package, out))
+    rc, out, err = module.run_command(
+        format_pkgin_command(module, pkgin_path, "remove", " ".join(to_remove)))
 
-        remove_c += 1
+    if not module.check_mode:
+        # verify against a fresh listing, so we can report the packages that failed
+        installed = get_installed_packages(module, pkgin_path)
+        failed = [package for package in to_remove if package in installed]
+        if failed:
+            module.fail_json(msg="failed to remove %s: %s" % (", ".join(failed), out))
 
-    if remove_c > 0:
-        module.exit_json(changed=True, msg=format_action_message(module, "removed", remove_c))
-
-    module.exit_json(changed=False, msg="package(s) already absent")
+    module.exit_json(changed=True, msg=format_action_message(module, "removed", len(to_remove)))
 
 
 def install_packages(module, pkgin_path, packages):
 
-    install_c = 0
-
-    for package in packages:
-        if query_package(module, pkgin_path, package):
-            continue
-
-        rc, out, err = module.run_command(
-            format_pkgin_command(module, pkgin_path, "install", package))
+    installed = get_installed_packages(module, pkgin_path)
+    to_install = [package for package in packages if package not in installed]
 
-        if not module.check_mode and not query_package(module, pkgin_path, package):
-            module.fail_json(msg="failed to install %s: %s" % (package, out))
+    if not to_install:
+        module.exit_json(changed=False, msg="package(s) already present")
 
-        install_c += 1
+    rc, out, err = module.run_command(
+        format_pkgin_command(module, pkgin_path, "install", " ".join(to_install)))
 
-    if install_c > 0:
-        module.exit_json(changed=True, msg=format_action_message(module, "installed", install_c))
+    if not module.check_mode:
+        # verify against a fresh listing, so we can report the packages that failed
+        installed = get_installed_packages(module, pkgin_path)
+        failed = [package for package in to_install if package not in installed]
+        if failed:
+            module.fail_json(msg="failed to install %s: %s" % (", ".join(failed), out))
 
-    module.exit_json(changed=False, msg="package(s) already present")
+    module.exit_json(changed=True, msg=format_action_message(module, "installed", len(to_install)))
 
 
 
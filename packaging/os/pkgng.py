@@ -46,6 +46,15 @@ options:
         choices: [ 'yes', 'no' ]
         required: false
         default: no
+    update_cache_valid_time:
+        description:
+            - skip updating the catalogue when the local copy of the
+              repository catalogue (or, with I(pkgsite), of that repository)
+              is less than this many seconds old. C(0) always updates unless
+              I(cached) is set.
+        required: false
+        default: 0
+        version_added: "2.0"
     annotation:
         description:
             - a comma-separated list of keyvalue-pairs of the form
@@ -72,6 +81,9 @@ EXAMPLES = '''
 # Install package foo
 - pkgng: name=foo state=present
 
+# Install package foo, updating the catalogue if older than a day
+- pkgng: name=foo state=present update_cache_valid_time=86400
+
 # Annotate package foo and bar
 - pkgng: name=foo,bar annotation=+test1=baz,-test2,:test3=foobar
 
@@ -80,20 +92,47 @@ EXAMPLES = '''
 '''
 
 
+import fnmatch
+import glob
 import json
 import shlex
 import os
 import re
 import sys
+import time
 
-def query_package(module, pkgng_path, name):
+# where pkg update stores the repository catalogues
+PKG_DBDIR = '/var/db/pkg'
 
-    rc, out, err = module.run_command("%s info -g -e %s" % (pkgng_path, name))
+def get_installed_index(module, pkgng_path):
+    """Return a dict mapping the name, name-version and origin of every
+    installed package to its name, built from a single pkg query."""
 
-    if rc == 0:
-        return True
+    rc, out, err = module.run_command("%s query -a '%%n %%v %%o'" % pkgng_path)
+    if rc != 0:
+        module.fail_json(msg="could not list installed packages", stderr=err)
 
-    return False
+    index = {}
+    for line in out.splitlines():
+        fields = line.split()
+        if len(fields) != 3:
+            continue
+        name, version, origin = fields
+        index[name] = name
+        index["%s-%s" % (name, version)] = name
+        index[origin] = name
+
+    return index
+
+def query_package(index, name):
+    """Return the names of the installed packages matching name, which may
+    be a glob like pkg info -g accepts."""
+
+    if name in index:
+        return [index[name]]
+    if re.search(r'[*?\[]', name):
+        return sorted(set([index[k] for k in fnmatch.filter(index.keys(), name)]))
+    return []
 
 def pkgng_older_than(module, pkgng_path, compare_version):
 
@@ -112,37 +151,62 @@ def pkgng_older_than(module, pkgng_path, compare_version):
     return not new_pkgng
 
 
-def remove_packages(module, pkgng_path, packages):
-    
-    remove_c = 0
-    # Using a for loop incase of error, we can report the package that failed
+def catalogue_is_fresh(repo, old_pkgng, valid_time):
+    """Return True if the catalogue of repo, or of every repository if repo
+    is empty, was updated less than valid_time seconds ago."""
+
+    if old_pkgng:
+        # a single catalogue, whatever PACKAGESITE points to
+        paths = [os.path.join(PKG_DBDIR, 'repo.sqlite')]
+    elif repo:
+        paths = [os.path.join(PKG_DBDIR, 'repo-%s.sqlite' % repo)]
+    else:
+        paths = glob.glob(os.path.join(PKG_DBDIR, 'repo-*.sqlite'))
+
+    if not paths:
+        return False
+    try:
+        oldest = min([os.path.getmtime(path) for path in paths])
+    except OSError:
+        return False
+    return time.time() - oldest < valid_time
+
+
+def remove_packages(module, pkgng_path, packages, index):
+
+    # Query the packages first, to see if we even need to remove
+    to_remove = []
     for package in packages:
-        # Query the package first, to see if we even need to remove
-        if not query_package(module, pkgng_path, package):
-            continue
+        for name in query_package(index, package):
+            if name not in to_remove:
+                to_remove.append(name)
 
-        if not module.check_mode:
-            rc, out, err = module.run_command("%s delete -y %s" % (pkgng_path, package))
+    if to_remove and not module.check_mode:
+        rc, out, err = module.run_command("%s delete -y %s" % (pkgng_path, " ".join(to_remove)))
 
-        if not module.check_mode and query_package(module, pkgng_path, package):
-            module.fail_json(msg="failed to remove %s: %s" % (package, out))
-    
-        remove_c += 1
+        index.clear()
+        index.update(get_installed_index(module, pkgng_path))
+        failed = [name for name in to_remove if name in index]
+        if failed:
+            module.fail_json(msg="failed to remove %s: %s" % (", ".join(failed), out), stderr=err)
 
-    if remove_c > 0:
+    if to_remove:
 
-        return (True, "removed %s package(s)" % remove_c)
+        return (True, "removed %s package(s)" % len(to_remove))
 
     return (False, "package(s) already absent")
 
 
-def install_packages(module, pkgng_path, packages, cached, pkgsite):
+def install_packages(module, pkgng_path, packages, cached, pkgsite, index, valid_time=0):
 
-    install_c = 0
+    to_install = [package for package in packages if not query_package(index, package)]
+    if not to_install:
+        return (False, "package(s) already present")
 
     # as of pkg-1.1.4, PACKAGESITE is deprecated in favor of repository definitions
     # in /usr/local/etc/pkg/repos
     old_pkgng = pkgng_older_than(module, pkgng_path, [1, 1, 4])
+    repo = pkgsite
     if pkgsite != "":
         if old_pkgng:
             pkgsite = "PACKAGESITE=%s" % (pkgsite)
@@ -152,44 +216,50 @@ def install_packages(module, pkgng_path, packages, cached, pkgsite):
     batch_var = 'env BATCH=yes' # This environment variable skips mid-install prompts,
                                 # setting them to their default values.
 
+    if valid_time and catalogue_is_fresh(repo, old_pkgng, valid_time):
+        cached = True
+
     if not module.check_mode and not cached:
         if old_pkgng:
             rc, out, err = module.run_command("%s %s update" % (pkgsite, pkgng_path))
         else:
-            rc, out, err = module.run_command("%s update" % (pkgng_path))
+            rc, out, err = module.run_command("%s update %s" % (pkgng_path, pkgsite))
         if rc != 0:
             module.fail_json(msg="Could not update catalogue")
 
-    for package in packages:
-        if query_package(module, pkgng_path, package):
-            continue
+    if not module.check_mode:
+        if old_pkgng:
+            rc, out, err = module.run_command("%s %s %s install -g -U -y %s" % (batch_var, pkgsite, pkgng_path, " ".join(to_install)))
+        else:
+            rc, out, err = module.run_command("%s %s install %s -g -U -y %s" % (batch_var, pkgng_path, pkgsite, " ".join(to_install)))
 
-        if not module.check_mode:
-            if old_pkgng:
-                rc, out, err = module.run_command("%s %s %s install -g -U -y %s" % (batch_var, pkgsite, pkgng_path, package))
-            else:
-                rc, out, err = module.run_command("%s %s install %s -g -U -y %s" % (batch_var, pkgng_path, pkgsite, package))
+        index.clear()
+        index.update(get_installed_index(module, pkgng_path))
+        failed = [package for package in to_install if not query_package(index, package)]
+        if failed:
+            module.fail_json(msg="failed to install %s: %s" % (", ".join(failed), out), stderr=err)
 
-        if not module.check_mode and not query_package(module, pkgng_path, package):
-            module.fail_json(msg="failed to install %s: %s" % (package, out), stderr=err)
+    return (True, "added %s package(s)" % (len(to_install)))
 
-        install_c += 1
-    
-    if install_c > 0:
-        return (True, "added %s package(s)" % (install_c))
+def get_annotation_index(module, pkgng_path):
+    """Return a dict mapping each installed package name to a dict of its
+    annotations, from a single pkg query."""
 
-    return (False, "package(s) already present")
+    rc, out, err = module.run_command("%s query -a '%%n %%At %%Av'" % pkgng_path)
 
-def annotation_query(module, pkgng_path, package, tag):
-    rc, out, err = module.run_command("%s info -g -A %s" % (pkgng_path, package))
-    match = re.search(r'^\s*(?P<tag>%s)\s*:\s*(?P<value>\w+)' % tag, out, flags=re.MULTILINE)
-    if match:
-        return match.group('value')
-    return False
+    annotations = {}
+    for line in out.splitlines():
+        match = re.match(r'^(?P<name>\S+) (?P<tag>\S+) (?P<value>.*)$', line)
+        if match:
+            annotations.setdefault(match.group('name'), {})[match.group('tag')] = match.group('value')
+    return annotations
 
+def annotation_query(annotations, package, tag):
+    return annotations.get(package, {}).get(tag, False)
 
-def annotation_add(module, pkgng_path, package, tag, value):
-    _value = annotation_query(module, pkgng_path, package, tag)
+
+def annotation_add(module, pkgng_path, annotations, package, tag, value):
+    _value = annotation_query(annotations, package, tag)
     if not _value:
         # Annotation does not exist, add it.
         rc, out, err = module.run_command('%s annotate -y -A %s %s "%s"'
@@ -208,8 +278,8 @@ def annotation_add(module, pkgng_path, package, tag, value):
         # Annotation exists, nothing to do
         return False
 
-def annotation_delete(module, pkgng_path, package, tag, value):
-    _value = annotation_query(module, pkgng_path, package, tag)
+def annotation_delete(module, pkgng_path, annotations, package, tag, value):
+    _value = annotation_query(annotations, package, tag)
     if _value:
         rc, out, err = module.run_command('%s annotate -y -D %s %s'
             % (pkgng_path, package, tag))
@@ -219,8 +289,8 @@ def annotation_delete(module, pkgng_path, package, tag, value):
         return True
     return False
 
-def annotation_modify(module, pkgng_path, package, tag, value):
-    _value = annotation_query(module, pkgng_path, package, tag)
+def annotation_modify(module, pkgng_path, annotations, package, tag, value):
+    _value = annotation_query(annotations, package, tag)
     if not value:
         # No such tag
         module.fail_json("could not change annotation to %s: tag %s does not exist"
@@ -237,7 +307,7 @@ def annotation_modify(module, pkgng_path, package, tag, value):
         return True
 
 
-def annotate_packages(module, pkgng_path, packages, annotation):
+def annotate_packages(module, pkgng_path, packages, annotation, index):
     annotate_c = 0
     annotations = map(lambda _annotation:
         re.match(r'(?P<operation>[\+-:])(?P<tag>\w+)(=(?P<value>\w+))?',
@@ -250,11 +320,14 @@ def annotate_packages(module, pkgng_path, packages, annotation):
         ':': annotation_modify
     }
 
+    current = get_annotation_index(module, pkgng_path)
+
     for package in packages:
-        for _annotation in annotations:
-            annotate_c += ( 1 if operation[_annotation['operation']](
-                module, pkgng_path, package,
-                _annotation['tag'], _annotation['value']) else 0 )
+        for name in query_package(index, package):
+            for _annotation in annotations:
+                annotate_c += ( 1 if operation[_annotation['operation']](
+                    module, pkgng_path, current, name,
+                    _annotation['tag'], _annotation['value']) else 0 )
 
     if annotate_c > 0:
         return (True, "added %s annotations." % annotate_c)
@@ -266,6 +339,7 @@ def main():
                 state           = dict(default="present", choices=["present","absent"], required=False),
                 name            = dict(aliases=["pkg"], required=True),
                 cached          = dict(default=False, type='bool'),
+                update_cache_valid_time = dict(default=0, type='int', required=False),
                 annotation      = dict(default="", required=False),
                 pkgsite         = dict(default="", required=False)),
             supports_check_mode = True)
@@ -279,18 +353,20 @@ def main():
     changed = False
     msgs = []
 
+    index = get_installed_index(module, pkgng_path)
+
     if p["state"] == "present":
-        _changed, _msg = install_packages(module, pkgng_path, pkgs, p["cached"], p["pkgsite"])
+        _changed, _msg = install_packages(module, pkgng_path, pkgs, p["cached"], p["pkgsite"], index, p["update_cache_valid_time"])
         changed = changed or _changed
         msgs.append(_msg)
 
     elif p["state"] == "absent":
-        _changed, _msg = remove_packages(module, pkgng_path, pkgs)
+        _changed, _msg = remove_packages(module, pkgng_path, pkgs, index)
         changed = changed or _changed
         msgs.append(_msg)
 
     if p["annotation"]:
-        _changed, _msg = annotate_packages(module, pkgng_path, pkgs, p["annotation"])
+        _changed, _msg = annotate_packages(module, pkgng_path, pkgs, p["annotation"], index)
         changed = changed or _changed
         msgs.append(_msg)
 
@@ -36,7 +36,7 @@ author: Alexander Winkler
 options:
   name:
     description:
-      - Package name, e.g. (C(CSWnrpe))
+      - Package name, e.g. (C(CSWnrpe)), or a list of packages. All packages are handled with a single pkgutil run.
     required: true
   site:
     description:
@@ -46,7 +46,6 @@ options:
     description:
       - Whether to install (C(present)), or remove (C(absent)) a package.
       - The upgrade (C(latest)) operation will update/install the package to the latest version available.
-      - "Note: The module has a limitation that (C(latest)) only works for one package, not lists of them."
     required: true
     choices: ["present", "absent", "latest"]
 '''
@@ -55,68 +54,74 @@ EXAMPLES = '''
 # Install a package
 pkgutil: name=CSWcommon state=present
 
+# Install several packages at once
+pkgutil: name=CSWcommon,CSWnrpe state=present
+
 # Install a package from a specific repository
 pkgutil: name=CSWnrpe site='ftp://myinternal.repo/opencsw/kiel state=latest'
 '''
 
 import os
-import pipes
 
-def package_installed(module, name):
+def get_installed_packages(module):
+    # one pkginfo listing for all packages; lines look like
+    # "application CSWcurl    curl - ..."
     cmd = [module.get_bin_path('pkginfo', True)]
-    cmd.append('-q')
-    cmd.append(name)
-    rc, out, err = module.run_command(' '.join(cmd))
-    if rc == 0:
-        return True
-    else:
-        return False
-
-def package_latest(module, name, site):
-    # Only supports one package
+    rc, out, err = module.run_command(cmd)
+    installed = set()
+    for line in out.splitlines():
+        fields = line.split()
+        if len(fields) >= 2:
+            installed.add(fields[1])
+    return installed
+
+def get_outdated_packages(module, names, site):
+    # one catalog comparison for all packages; up to date packages are
+    # reported as SAME in the last column
     cmd = [ 'pkgutil', '--single', '-c' ]
     if site is not None:
-        cmd += [ '-t', pipes.quote(site) ]
-    cmd.append(pipes.quote(name))
-    cmd += [ '| tail -1 | grep -v SAME' ]
-    rc, out, err = module.run_command(' '.join(cmd), use_unsafe_shell=True)
-    if rc == 1:
-        return True
-    else:
-        return False
+        cmd += [ '-t', site ]
+    cmd += names
+    (rc, out, err) = run_command(module, cmd)
+    outdated = []
+    for line in out.splitlines():
+        fields = line.split()
+        if len(fields) >= 3 and fields[0] in names and fields[-1] != 'SAME':
+            outdated.append(fields[0])
+    return outdated
 
 def run_command(module, cmd):
     progname = cmd[0]
     cmd[0] = module.get_bin_path(progname, True)
     return module.run_command(cmd)
 
-def package_install(module, state, name, site):
+def package_install(module, state, names, site):
     cmd = [ 'pkgutil', '-iy' ]
     if site is not None:
         cmd += [ '-t', site ]
     if state == 'latest':
         cmd += [ '-f' ] 
-    cmd.append(name)
+    cmd += names
     (rc, out, err) = run_command(module, cmd)
     return (rc, out, err)
 
-def package_upgrade(module, name, site):
+def package_upgrade(module, names, site):
     cmd = [ 'pkgutil', '-ufy' ]
     if site is not None:
         cmd += [ '-t', site ]
-    cmd.append(name)
+    cmd += names
     (rc, out, err) = run_command(module, cmd)
     return (rc, out, err)
 
-def package_uninstall(module, name):
-    cmd = [ 'pkgutil', '-ry', name]
+def package_uninstall(module, names):
+    cmd = [ 'pkgutil', '-ry' ] + names
     (rc, out, err) = run_command(module, cmd)
     return (rc, out, err)
 
 def main():
     module = AnsibleModule(
         argument_spec = dict(
-            name = dict(required = True),
+            name = dict(required = True, type = 'list'),
             state = dict(required = True, choices=['present', 'absent','latest']),
             site = dict(default = None),
         ),
@@ -132,35 +137,47 @@ def main():
     result['name'] = name
     result['state'] = state
 
-    if state == 'present':
-        if not package_installed(module, name):
-            if module.check_mode:
-                module.exit_json(changed=True)
-            (rc, out, err) = package_install(module, state, name, site)
-            # Stdout is normally empty but for some packages can be
-            # very long and is not often useful
-            if len(out) > 75:
-                out = out[:75] + '...'
-
-    elif state == 'latest':
-        if not package_installed(module, name):
-            if module.check_mode:
-                module.exit_json(changed=True)
-            (rc, out, err) = package_install(module, state, name, site)
+    installed = get_installed_packages(module)
+    missing = [package for package in name if package not in installed]
+    present = [package for package in name if package in installed]
+
+    outdated = []
+    if state == 'latest' and present:
+        outdated = get_outdated_packages(module, present, site)
+
+    if state == 'absent':
+        work = present
+    else:
+        work = missing + outdated
+    if work and module.check_mode:
+        module.exit_json(changed=True)
+
+    if state in ['present', 'latest'] and missing:
+        (rc, out, err) = package_install(module, state, missing, site)
+
+    if outdated and not rc:
+        (rc, upgrade_out, upgrade_err) = package_upgrade(module, outdated, site)
+        out += upgrade_out
+        err += upgrade_err
+
+    if state == 'absent' and present:
+        (rc, out, err) = package_uninstall(module, present)
+
+    if rc == 0 and (missing and state != 'absent' or present and state == 'absent'):
+        # pkgutil's return code is not enough, verify against a fresh listing
+        installed = get_installed_packages(module)
+        if state == 'absent':
+            failed = [package for package in present if package in installed]
         else:
-            if not package_latest(module, name, site):
-                if module.check_mode:
-                    module.exit_json(changed=True) 
-                (rc, out, err) = package_upgrade(module, name, site)
-                if len(out) > 75:
-                    out = out[:75] + '...'
-
-    elif state == 'absent':
-        if package_installed(module, name):
-            if module.check_mode:
-                module.exit_json(changed=True)
-            (rc, out, err) = package_uninstall(module, name)
-            out = out[:75]
+            failed = [package for package in missing if package not in installed]
+        if failed:
+            rc = 1
+            err += "failed to %s %s" % (state == 'absent' and 'remove' or 'install', ", ".join(failed))
+
+    # Stdout is normally empty but for some packages can be
+    # very long and is not often useful
+    if len(out) > 75:
+        out = out[:75] + '...'
 
     if rc is None:
         # pkgutil was not executed because the package was already present/absent
@@ -146,7 +146,31 @@ options:
     deafult: null
     choices: [ "yes" ]
 
-requirements: [ gentoolkit ]
+  usepkg:
+    description:
+      - Prefer binary packages from PKGDIR when they are available, and
+        build the others (--usepkg)
+    required: false
+    default: null
+    choices: [ "yes" ]
+    version_added: "2.0"
+
+  jobs:
+    description:
+      - Number of packages to build in parallel (--jobs)
+    required: false
+    default: null
+    version_added: "2.0"
+
+  load_average:
+    description:
+      - Do not start new builds while the load average is at least this
+        value (--load-average)
+    required: false
+    default: null
+    version_added: "2.0"
+
+requirements: []
 author: Yap Sok Ann, Andrew Udvare
 notes:  []
 '''
@@ -164,6 +188,9 @@ EXAMPLES = '''
 # Install package foo using PORTAGE_BINHOST setup
 - portage: package=foo getbinpkg=yes
 
+# Update world with four parallel builds, using binary packages when available
+- portage: package=@world update=yes deep=yes usepkg=yes jobs=4 load_average=8
+
 # Re-install world from binary packages only and do not allow any compiling
 - portage: package=@world usepkgonly=yes
 
@@ -183,6 +210,137 @@ import pipes
 import re
 
 
+# Installed package database and world sets, read in-process instead of
+# forking equery for every atom
+VDB_PATH = '/var/db/pkg'
+WORLD_SETS_PATH = '/var/lib/portage/world_sets'
+
+VERSION_RE = r'(?:\d+)(?:\.\d+)*[a-z]?(?:_(?:alpha|beta|pre|rc|p)\d*)*(?:-r\d+)?'
+PF_RE = re.compile(r'^(?P<pn>[\w+][\w+.-]*?)-(?P<pv>%s)$' % VERSION_RE)
+ATOM_RE = re.compile(
+    r'^(?P<op>[<>]=?|=|~)(?P<cp>(?:[\w+][\w+.-]*/)?[\w+][\w+.-]*?)-(?P<pv>%s)(?P<glob>\*)?'
+    r'(?::(?P<slot>[^:\[]+))?(?:::(?P<repo>[\w-]+))?(?:\[[^\]]*\])?$' % VERSION_RE)
+UNVERSIONED_ATOM_RE = re.compile(
+    r'^(?P<cp>(?:[\w+][\w+.-]*/)?[\w+][\w+.-]*)'
+    r'(?::(?P<slot>[^:\[]+))?(?:::(?P<repo>[\w-]+))?(?:\[[^\]]*\])?$')
+SUFFIX_ORDER = {'alpha': 0, 'beta': 1, 'pre': 2, 'rc': 3, 'p': 5}
+NO_SUFFIX = 4
+
+
+def split_version(version):
+    match = re.match(r'^(\d+(?:\.\d+)*)([a-z]?)((?:_(?:alpha|beta|pre|rc|p)\d*)*)(?:-r(\d+))?$', version)
+    numbers, letter, suffixes, revision = match.groups()
+    suffixes = [re.match(r'([a-z]+)(\d*)', x).groups()
+                for x in suffixes.split('_')[1:]]
+    suffixes = [(SUFFIX_ORDER[name], int(num or 0)) for name, num in suffixes]
+    return numbers.split('.'), letter, suffixes, int(revision or 0)
+
+
+def compare_versions(a, b):
+    """Compare two versions the way portage does. Returns -1, 0 or 1."""
+    a_numbers, a_letter, a_suffixes, a_revision = split_version(a)
+    b_numbers, b_letter, b_suffixes, b_revision = split_version(b)
+
+    result = cmp(int(a_numbers[0]), int(b_numbers[0]))
+    for x, y in zip(a_numbers[1:], b_numbers[1:]):
+        if result:
+            return result
+        if x.startswith('0') or y.startswith('0'):
+            # fractional comparison
+            result = cmp(x.rstrip('0'), y.rstrip('0'))
+        else:
+            result = cmp(int(x), int(y))
+    result = result or cmp(len(a_numbers), len(b_numbers)) or cmp(a_letter, b_letter)
+    if result:
+        return result
+
+    a_suffixes = a_suffixes + [(NO_SUFFIX, 0)] * (len(b_suffixes) - len(a_suffixes))
+    b_suffixes = b_suffixes + [(NO_SUFFIX, 0)] * (len(a_suffixes) - len(b_suffixes))
+    return cmp(a_suffixes, b_suffixes) or cmp(a_revision, b_revision)
+
+
+def read_file(path):
+    try:
+        f = open(path)
+        try:
+            return f.read().strip()
+        finally:
+            f.close()
+    except IOError:
+        return None
+
+
+def read_installed_packages():
+    """Return a dict mapping cat/pn and pn of every installed package to a
+    list of (cat/pn, version, path) entries."""
+    index = {}
+    if not os.path.isdir(VDB_PATH):
+        return index
+
+    for category in os.listdir(VDB_PATH):
+        category_path = os.path.join(VDB_PATH, category)
+        if not os.path.isdir(category_path):
+            continue
+        for pf in os.listdir(category_path):
+            # skip merges in progress
+            if pf.startswith('-MERGING-'):
+                continue
+            match = PF_RE.match(pf)
+            if match is None:
+                continue
+            cp = '%s/%s' % (category, match.group('pn'))
+            entry = (cp, match.group('pv'), os.path.join(category_path, pf))
+            index.setdefault(cp, []).append(entry)
+            index.setdefault(match.group('pn'), []).append(entry)
+    return index
+
+
+def version_matches(op, wanted, glob, version):
+    if op == '=' and glob:
+        return version == wanted or version.startswith(wanted) \
+            and not version[len(wanted)].isdigit()
+    if op == '~':
+        return compare_versions(version.split('-r')[0], wanted.split('-r')[0]) == 0
+
+    result = compare_versions(version, wanted)
+    return {
+        '=': result == 0,
+        '<': result < 0,
+        '<=': result <= 0,
+        '>': result > 0,
+        '>=': result >= 0,
+    }[op]
+
+
+def match_atom(index, atom):
+    """Return True if an installed package matches the atom, including its
+    version operator, slot and repository."""
+    match = ATOM_RE.match(atom) or UNVERSIONED_ATOM_RE.match(atom)
+    if match is None:
+        return False
+    atom = match.groupdict()
+
+    for cp, version, path in index.get(atom['cp'], []):
+        if atom.get('op') and not version_matches(atom['op'], atom['pv'], atom['glob'], version):
+            continue
+        if atom['slot'] and atom['slot'] not in ('*', '='):
+            slot = read_file(os.path.join(path, 'SLOT')) or '0'
+            wanted = atom['slot'].rstrip('=')
+            if wanted != slot and wanted != slot.split('/')[0]:
+                continue
+        if atom['repo'] and read_file(os.path.join(path, 'repository')) != atom['repo']:
+            continue
+        return True
+    return False
+
+
+def read_world_sets():
+    world_sets = read_file(WORLD_SETS_PATH)
+    if world_sets is None:
+        return set()
+    return set(world_sets.split())
+
+
 def query_package(module, package, action):
     if package.startswith('@'):
         return query_set(module, package, action)
@@ -190,10 +348,9 @@ def query_package(module, package, action):
 
 
 def query_atom(module, atom, action):
-    cmd = '%s list %s' % (module.equery_path, atom)
-
-    rc, out, err = module.run_command(cmd)
-    return rc == 0
+    if module.installed_packages is None:
+        module.installed_packages = read_installed_packages()
+    return match_atom(module.installed_packages, atom)
 
 
 def query_set(module, set, action):
@@ -213,14 +370,9 @@ def query_set(module, set, action):
             module.fail_json(msg='set %s cannot be removed' % set)
         return False
 
-    world_sets_path = '/var/lib/portage/world_sets'
-    if not os.path.exists(world_sets_path):
-        return False
-
-    cmd = 'grep %s %s' % (set, world_sets_path)
-
-    rc, out, err = module.run_command(cmd)
-    return rc == 0
+    if module.world_sets is None:
+        module.world_sets = read_world_sets()
+    return set in module.world_sets
 
 
 def sync_repositories(module, webrsync=False):
@@ -238,11 +390,6 @@ def sync_repositories(module, webrsync=False):
         module.fail_json(msg='could not sync package repositories')
 
 
-# Note: In the 3 functions below, equery is done one-by-one, but emerge is done
-# in one go. If that is not desirable, split the packages into multiple tasks
-# instead of joining them together with comma.
-
-
 def emerge_packages(module, packages):
     p = module.params
 
@@ -267,6 +414,7 @@ def emerge_packages(module, packages):
         'verbose': '--verbose',
         'getbinpkg': '--getbinpkg',
         'usepkgonly': '--usepkgonly',
+        'usepkg': '--usepkg',
     }
     for flag, arg in emerge_flags.iteritems():
         if p[flag]:
@@ -276,6 +424,35 @@ def emerge_packages(module, packages):
     if p['usepkgonly'] and not p['getbinpkg']:
         args.append('--getbinpkg')
 
+    # work out what would be merged first, so that changed and check mode
+    # do not depend on the output of the real run
+    pretend_args = [arg for arg in args if arg != '--verbose']
+    if '--quiet' not in pretend_args:
+        pretend_args.append('--quiet')
+    cmd, (rc, out, err) = run_emerge(module, packages, '--pretend', *pretend_args)
+    if rc != 0:
+        module.fail_json(
+            cmd=cmd, rc=rc, stdout=out, stderr=err,
+            msg='Packages cannot be installed.',
+        )
+
+    merges = parse_pretend(out)
+    if not merges:
+        module.exit_json(
+            changed=False, cmd=cmd, rc=rc, stdout=out, stderr=err,
+            packages=merges, msg='Packages already present.',
+        )
+    if module.check_mode:
+        module.exit_json(
+            changed=True, cmd=cmd, rc=rc, stdout=out, stderr=err,
+            packages=merges, msg='Packages installed.',
+        )
+
+    if p['jobs']:
+        args.append('--jobs=%d' % p['jobs'])
+    if p['load_average']:
+        args.append('--load-average=%s' % p['load_average'])
+
     cmd, (rc, out, err) = run_emerge(module, packages, *args)
     if rc != 0:
         module.fail_json(
@@ -293,19 +470,24 @@ def emerge_packages(module, packages):
                 'and your SSH authorized_keys file',
         )
 
-    changed = True
-    for line in out.splitlines():
-        if re.match(r'(?:>+) Emerging (?:binary )?\(1 of', line):
-            break
-    else:
-        changed = False
-
     module.exit_json(
-        changed=changed, cmd=cmd, rc=rc, stdout=out, stderr=err,
-        msg='Packages installed.',
+        changed=True, cmd=cmd, rc=rc, stdout=out, stderr=err,
+        packages=merges, msg='Packages installed.',
     )
 
 
+def parse_pretend(out):
+    """Return the cat/pf of the packages listed for merging by emerge
+    --pretend."""
+    merges = []
+    for line in out.splitlines():
+        match = re.match(r'^\[(?:ebuild|binary)\s+[^\]]*\]\s+(\S+)', line)
+        if match:
+            # drop the ::repository suffix printed with --verbose
+            merges.append(match.group(1).split('::')[0])
+    return merges
+
+
 def unmerge_packages(module, packages):
     p = module.params
 
@@ -373,7 +555,7 @@ def run_emerge(module, packages, *args):
     args = list(args)
 
     args.append('--ask=n')
-    if module.check_mode:
+    if module.check_mode and '--pretend' not in args:
         args.append('--pretend')
 
     cmd = [module.emerge_path] + args + packages
@@ -406,6 +588,9 @@ def main():
             sync=dict(default=None, choices=['yes', 'web']),
             getbinpkg=dict(default=None, choices=['yes']),
             usepkgonly=dict(default=None, choices=['yes']),
+            usepkg=dict(default=None, choices=['yes']),
+            jobs=dict(default=None, type='int'),
+            load_average=dict(default=None),
         ),
         required_one_of=[['package', 'sync', 'depclean']],
         mutually_exclusive=[['nodeps', 'onlydeps'], ['quiet', 'verbose']],
@@ -413,10 +598,17 @@ def main():
     )
 
     module.emerge_path = module.get_bin_path('emerge', required=True)
-    module.equery_path = module.get_bin_path('equery', required=True)
+    module.installed_packages = None
+    module.world_sets = None
 
     p = module.params
 
+    if p['load_average']:
+        try:
+            float(p['load_average'])
+        except ValueError:
+            module.fail_json(msg='load_average must be a number')
+
     if p['sync']:
         sync_repositories(module, webrsync=(p['sync'] == 'web'))
         if not p['package']:
@@ -34,7 +34,7 @@ author: Boyd Adamson
 options:
   name:
     description:
-      - Package name, e.g. C(SUNWcsr)
+      - Package name, e.g. C(SUNWcsr), or a list of packages. All packages are handled with a single pkgadd or pkgrm run.
     required: true
 
   state:
@@ -83,6 +83,9 @@ EXAMPLES = '''
 # Install a package with a response file
 - svr4pkg: name=CSWggrep src=/tmp/third-party.pkg response_file=/tmp/ggrep.response state=present
 
+# Install several packages from the same source at once
+- svr4pkg: name=CSWcommon,CSWpkgutil src=/tmp/cswpkgs.pkg state=present
+
 # Ensure that a package is not installed.
 - svr4pkg: name=SUNWgnome-sound-recorder state=absent
 
@@ -94,17 +97,27 @@ EXAMPLES = '''
 import os
 import tempfile
 
-def package_installed(module, name, category):
+def get_installed(module, category):
+    """Return the installed packages, or with category the installed
+    categories, from one pkginfo listing."""
     cmd = [module.get_bin_path('pkginfo', True)]
-    cmd.append('-q')
     if category:
-        cmd.append('-c')
-    cmd.append(name)
-    rc, out, err = module.run_command(' '.join(cmd))
-    if rc == 0:
-        return True
-    else:
-        return False
+        cmd.append('-l')
+    rc, out, err = module.run_command(cmd)
+
+    installed = set()
+    for line in out.splitlines():
+        if category:
+            # "   CATEGORY:  system,FIREFOX"
+            fields = line.split(':', 1)
+            if len(fields) == 2 and fields[0].strip() == 'CATEGORY':
+                installed.update([x.strip() for x in fields[1].split(',')])
+        else:
+            # "application CSWcurl    curl - ..."
+            fields = line.split()
+            if len(fields) >= 2:
+                installed.add(fields[1])
+    return installed
 
 def create_admin_file():
     (desc, filename) = tempfile.mkstemp(prefix='ansible_svr4pkg', text=True)
@@ -135,7 +148,7 @@ def run_command(module, cmd):
     cmd[0] = module.get_bin_path(progname, True)
     return module.run_command(cmd)
 
-def package_install(module, name, src, proxy, response_file, zone, category):
+def package_install(module, names, src, proxy, response_file, zone, category):
     adminfile = create_admin_file()
     cmd = [ 'pkgadd', '-n'] 
     if zone == 'current':
@@ -147,17 +160,17 @@ def package_install(module, name, src, proxy, response_file, zone, category):
         cmd += [ '-r', response_file ]
     if category:
         cmd += [ '-Y' ]
-    cmd.append(name)
+    cmd += names
     (rc, out, err) = run_command(module, cmd)
     os.unlink(adminfile)
     return (rc, out, err)
 
-def package_uninstall(module, name, src, category):
+def package_uninstall(module, names, src, category):
     adminfile = create_admin_file()
     if category:
-        cmd = [ 'pkgrm', '-na', adminfile, '-Y', name ]
+        cmd = [ 'pkgrm', '-na', adminfile, '-Y' ] + names
     else:
-        cmd = [ 'pkgrm', '-na', adminfile, name]
+        cmd = [ 'pkgrm', '-na', adminfile ] + names
     (rc, out, err) = run_command(module, cmd)
     os.unlink(adminfile)
     return (rc, out, err)
@@ -165,7 +178,7 @@ def package_uninstall(module, name, src, category):
 def main():
     module = AnsibleModule(
         argument_spec = dict(
-            name = dict(required = True),
+            name = dict(required = True, type = 'list'),
             state = dict(required = True, choices=['present', 'absent']),
             src = dict(default = None),
             proxy = dict(default = None),
@@ -193,22 +206,40 @@ def main():
         if src is None:
             module.fail_json(name=name,
                              msg="src is required when state=present")
-        if not package_installed(module, name, category):
+        installed = get_installed(module, category)
+        missing = [package for package in name if package not in installed]
+        if missing:
             if module.check_mode:
                 module.exit_json(changed=True)
-            (rc, out, err) = package_install(module, name, src, proxy, response_file, zone, category)
+            (rc, out, err) = package_install(module, missing, src, proxy, response_file, zone, category)
             # Stdout is normally empty but for some packages can be
             # very long and is not often useful
             if len(out) > 75:
                 out = out[:75] + '...'
 
+            # verify against a fresh listing, so we can report the packages that failed
+            installed = get_installed(module, category)
+            failed = [package for package in missing if package not in installed]
+            if failed and rc not in (1, 4, 5):
+                rc = 1
+                err += "failed to install %s" % ", ".join(failed)
+
     elif state == 'absent':
-        if package_installed(module, name, category):
+        installed = get_installed(module, category)
+        present = [package for package in name if package in installed]
+        if present:
             if module.check_mode:
                 module.exit_json(changed=True)
-            (rc, out, err) = package_uninstall(module, name, src, category)
+            (rc, out, err) = package_uninstall(module, present, src, category)
             out = out[:75]
 
+            # verify against a fresh listing, so we can report the packages that failed
+            installed = get_installed(module, category)
+            failed = [package for package in present if package in installed]
+            if failed and rc not in (1, 4, 5):
+                rc = 1
+                err += "failed to remove %s" % ", ".join(failed)
+
     # Success, Warning, Interruption, Reboot all, Reboot this return codes
     if rc in (0, 2, 3, 10, 20):
         result['changed'] = True
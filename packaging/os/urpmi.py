@@ -81,22 +81,24 @@ import sys
 URPMI_PATH = '/usr/sbin/urpmi'
 URPME_PATH = '/usr/sbin/urpme'
 
-def query_package(module, name):
-    # rpm -q returns 0 if the package is installed,
-    # 1 if it is not installed
-    cmd = "rpm -q %s" % (name)
+def get_installed_packages(module):
+    # one rpm query for all packages; rpm -q accepts name, name-version and
+    # name-version-release, so index all three
+    cmd = "rpm -qa --qf '%{NAME} %{VERSION} %{RELEASE}\\n'"
     rc, stdout, stderr = module.run_command(cmd, check_rc=False)
-    if rc == 0:
-        return True
-    else:
-        return False
+    if rc != 0:
+        module.fail_json(msg="could not list installed packages: %s" % stderr)
 
-def query_package_provides(module, name):
-    # rpm -q returns 0 if the package is installed,
-    # 1 if it is not installed
-    cmd = "rpm -q --provides %s" % (name)
-    rc, stdout, stderr = module.run_command(cmd, check_rc=False)
-    return rc == 0
+    installed = set()
+    for line in stdout.splitlines():
+        fields = line.split()
+        if len(fields) != 3:
+            continue
+        name, version, release = fields
+        installed.add(name)
+        installed.add("%s-%s" % (name, version))
+        installed.add("%s-%s-%s" % (name, version, release))
+    return installed
 
 
 def update_package_db(module):
@@ -107,37 +109,32 @@ def update_package_db(module):
          
 
 def remove_packages(module, packages):
-    
-    remove_c = 0
-    # Using a for loop incase of error, we can report the package that failed
-    for package in packages:
-        # Query the package first, to see if we even need to remove
-        if not query_package(module, package):
-            continue
 
-        cmd = "%s --auto %s" % (URPME_PATH, package)
-        rc, stdout, stderr = module.run_command(cmd, check_rc=False)
+    # Query the packages first, to see if we even need to remove
+    installed = get_installed_packages(module)
+    to_remove = [package for package in packages if package in installed]
 
-        if rc != 0:
-            module.fail_json(msg="failed to remove %s" % (package))
-    
-        remove_c += 1
+    if not to_remove:
+        module.exit_json(changed=False, msg="package(s) already absent")
 
-    if remove_c > 0:
+    cmd = "%s --auto %s" % (URPME_PATH, " ".join(to_remove))
+    rc, stdout, stderr = module.run_command(cmd, check_rc=False)
 
-        module.exit_json(changed=True, msg="removed %s package(s)" % remove_c)
+    # verify against a fresh listing, so we can report the packages that failed
+    installed = get_installed_packages(module)
+    failed = [package for package in to_remove if package in installed]
+    if rc != 0 or failed:
+        module.fail_json(msg="failed to remove %s" % (", ".join(failed or to_remove)))
 
-    module.exit_json(changed=False, msg="package(s) already absent")
+    module.exit_json(changed=True, msg="removed %s package(s)" % len(to_remove))
 
 
 def install_packages(module, pkgspec, force=True, no_suggests=True):
 
-    packages = ""
-    for package in pkgspec:
-        if not query_package_provides(module, package):
-            packages += "'%s' " % package
+    installed = get_installed_packages(module)
+    to_install = [package for package in pkgspec if package not in installed]
 
-    if len(packages) != 0:
+    if to_install:
         if no_suggests:
             no_suggests_yes = '--no-suggests'
         else:
@@ -148,18 +145,18 @@ def install_packages(module, pkgspec, force=True, no_suggests=True):
         else:
             force_yes = ''
 
+        packages = " ".join(["'%s'" % package for package in to_install])
         cmd = ("%s --auto %s --quiet %s %s" % (URPMI_PATH, force_yes, no_suggests_yes, packages))
 
         rc, out, err = module.run_command(cmd)
 
-        installed = True
-        for packages in pkgspec:
-            if not query_package_provides(module, package):
-                installed = False
+        # urpmi always have 0 for exit code if --force is used, so verify
+        # against a fresh listing
+        installed = get_installed_packages(module)
+        failed = [package for package in to_install if package not in installed]
 
-        # urpmi always have 0 for exit code if --force is used
-        if rc or not installed:
-            module.fail_json(msg="'urpmi %s' failed: %s" % (packages, err))
+        if rc or failed:
+            module.fail_json(msg="'urpmi %s' failed: %s" % (" ".join(failed or to_install), err))
         else:
             module.exit_json(changed=True, msg="%s present(s)" % packages)
     else:
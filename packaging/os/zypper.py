@@ -26,7 +26,13 @@
 # You should have received a copy of the GNU General Public License
 # along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+import os
 import re
+import tempfile
+import time
+from xml.dom.minidom import parseString
+from xml.parsers.expat import ExpatError
 
 DOCUMENTATION = '''
 ---
@@ -66,6 +72,15 @@ options:
         required: false
         default: "yes"
         choices: [ "yes", "no" ]
+    cache_valid_time:
+        version_added: "2.0"
+        description:
+          - Skip zypper's automatic repository refresh. Instead, refresh only
+            the repositories providing the requested packages, and only when
+            this module last refreshed them more than this many seconds ago.
+            C(0) leaves refreshing to zypper.
+        required: false
+        default: 0
 
 notes: []
 # informational: requirements for nodes
@@ -80,10 +95,16 @@ EXAMPLES = '''
 # Install apache2 with recommended packages
 - zypper: name=apache2 state=present disable_recommends=no
 
+# Install "nmap", refreshing its repository at most once an hour
+- zypper: name=nmap state=present cache_valid_time=3600
+
 # Remove the "nmap" package
 - zypper: name=nmap state=absent
 '''
 
+# Time of the last refresh of each repository done with cache_valid_time
+REFRESH_STAMPS = '~/.ansible/cache/zypper_refresh.json'
+
 # Function used for getting zypper version
 def zypper_version(module):
     """Return (rc, message) tuple"""
@@ -94,30 +115,145 @@ def zypper_version(module):
     else:
         return rc, stderr
 
-# Function used for getting versions of currently installed packages.
-def get_current_version(m, packages):
-    cmd = ['/bin/rpm', '-q', '--qf', '%{NAME} %{VERSION}-%{RELEASE}\n']
-    cmd.extend(packages)
-
+# Function used to load the time of the last refresh of each repository.
+def load_refresh_stamps():
+    try:
+        f = open(os.path.expanduser(REFRESH_STAMPS))
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return {}
+
+# Function used to record the time of the last refresh of each repository.
+def save_refresh_stamps(stamps):
+    path = os.path.expanduser(REFRESH_STAMPS)
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(stamps, f)
+        finally:
+            f.close()
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        # the next run will only refresh again
+        pass
+
+# Function used to refresh the repositories not refreshed in cache_valid_time.
+def refresh_repos(m, aliases, cache_valid_time):
+    stamps = load_refresh_stamps()
+    now = time.time()
+    stale = [alias for alias in aliases if now - stamps.get(alias, 0) >= cache_valid_time]
+    if stale:
+        cmd = ['/usr/bin/zypper', '--non-interactive', 'refresh']
+        cmd.extend(stale)
+        rc, stdout, stderr = m.run_command(cmd, check_rc=False)
+        if rc != 0:
+            m.fail_json(msg=stderr or stdout)
+        for alias in stale:
+            stamps[alias] = now
+        save_refresh_stamps(stamps)
+    return stale
+
+# Function used to get the aliases of the enabled repositories, by alias and name.
+def get_enabled_repos(m):
+    cmd = ['/usr/bin/zypper', '--non-interactive', '--xmlout', 'repos']
     rc, stdout, stderr = m.run_command(cmd, check_rc=False)
 
-    current_version = {}
-    rpmoutput_re = re.compile('^(\S+) (\S+)$')
+    repos = {}
+    try:
+        dom = parseString(stdout)
+    except ExpatError:
+        return repos
+    for repo in dom.getElementsByTagName('repo'):
+        if repo.getAttribute('enabled') == '1':
+            repos[repo.getAttribute('alias')] = repo.getAttribute('alias')
+            repos[repo.getAttribute('name')] = repo.getAttribute('alias')
+    return repos
+
+# Function used to find the repositories that provide the packages.
+def get_package_repos(m, packages):
+    """Search the cached metadata for the packages and return the aliases of
+    the repositories providing them. Every enabled repository is returned if
+    some package is not in the cached metadata yet."""
+    repos = get_enabled_repos(m)
+
+    cmd = ['/usr/bin/zypper', '--non-interactive', '--xmlout', '--no-refresh',
+           'search', '--details', '--match-exact', '-t', 'package']
+    cmd.extend(packages)
+    rc, stdout, stderr = m.run_command(cmd, check_rc=False)
 
-    for stdoutline in stdout.splitlines():
-        match = rpmoutput_re.match(stdoutline)
-        if match == None:
-            return None
-        package = match.group(1)
-        version = match.group(2)
-        current_version[package] = version
+    needed = set()
+    found = set()
+    try:
+        dom = parseString(stdout)
+    except ExpatError:
+        return sorted(set(repos.values()))
+    for solvable in dom.getElementsByTagName('solvable'):
+        alias = repos.get(solvable.getAttribute('repository'))
+        if alias is not None:
+            needed.add(alias)
+            found.add(solvable.getAttribute('name'))
+
+    if found.issuperset(packages):
+        return sorted(needed)
+    return sorted(set(repos.values()))
+
+# Function used to read the solver result from zypper --xmlout.
+def parse_zypper_xml(stdout):
+    """Return (changes, errors). changes maps each package in the install
+    summary to its action and versions, errors lists the error messages.
+    changes is None if the output could not be parsed."""
+    try:
+        dom = parseString(stdout)
+    except ExpatError:
+        return None, []
+
+    errors = []
+    for message in dom.getElementsByTagName('message'):
+        if message.getAttribute('type') == 'error' and message.firstChild:
+            errors.append(message.firstChild.data.strip())
+
+    changes = {}
+    for summary in dom.getElementsByTagName('install-summary'):
+        for group in summary.childNodes:
+            if group.nodeType != group.ELEMENT_NODE or not group.tagName.startswith('to-'):
+                continue
+            action = group.tagName[len('to-'):]
+            for solvable in group.getElementsByTagName('solvable'):
+                if solvable.getAttribute('type') not in ('', 'package'):
+                    continue
+                change = {'action': action, 'version': solvable.getAttribute('edition')}
+                if solvable.hasAttribute('edition-old'):
+                    change['old_version'] = solvable.getAttribute('edition-old')
+                changes[solvable.getAttribute('name')] = change
+
+    return changes, errors
+
+# Function used to run one zypper solver transaction.
+def run_zypper(m, command, packages, disable_gpg_check):
+    cmd = ['/usr/bin/zypper', '--non-interactive', '--xmlout']
+    # add global options before zypper command
+    if m.params.get('cache_valid_time'):
+        cmd.append('--no-refresh')
+    if disable_gpg_check:
+        cmd.append('--no-gpg-checks')
+    cmd.extend(command)
+    cmd.extend(packages)
+    rc, stdout, stderr = m.run_command(cmd, check_rc=False)
 
-    for package in packages:
-        if package not in current_version:
-            print package + ' was not returned by rpm \n'
-            return None
+    changes, errors = parse_zypper_xml(stdout)
+    if errors and not stderr:
+        stderr = '\n'.join(errors)
+    if changes is None:
+        # unparseable output, assume the transaction did what was asked
+        changes = dict([(package, {'action': command[0]}) for package in packages])
 
-    return current_version
+    return (rc, stdout, stderr, changes)
 
 
 # Function used to find out if a package is currently installed.
@@ -153,60 +289,23 @@ def package_present(m, name, installed_state, disable_gpg_check, disable_recomme
     for package in name:
         if installed_state[package] is False:
             packages.append(package)
-    if len(packages) != 0:
-        cmd = ['/usr/bin/zypper', '--non-interactive']
-        # add global options before zypper command
-        if disable_gpg_check:
-            cmd.append('--no-gpg-checks')
-        cmd.extend(['install', '--auto-agree-with-licenses'])
-        # add install parameter
-        if disable_recommends and not old_zypper:
-            cmd.append('--no-recommends')
-        cmd.extend(packages)
-        rc, stdout, stderr = m.run_command(cmd, check_rc=False)
+    if len(packages) == 0:
+        return (0, '', '', {})
 
-        if rc == 0:
-            changed=True
-        else:
-            changed=False
-    else:
-        rc = 0
-        stdout = ''
-        stderr = ''
-        changed=False
-
-    return (rc, stdout, stderr, changed)
+    command = ['install', '--auto-agree-with-licenses']
+    # add install parameter
+    if disable_recommends and not old_zypper:
+        command.append('--no-recommends')
+    return run_zypper(m, command, packages, disable_gpg_check)
 
 # Function used to make sure a package is the latest available version.
 def package_latest(m, name, installed_state, disable_gpg_check, disable_recommends, old_zypper):
-
-    # first of all, make sure all the packages are installed
-    (rc, stdout, stderr, changed) = package_present(m, name, installed_state, disable_gpg_check, disable_recommends, old_zypper)
-
-    # if we've already made a change, we don't have to check whether a version changed
-    if not changed:
-        pre_upgrade_versions = get_current_version(m, name)
-
-    cmd = ['/usr/bin/zypper', '--non-interactive']
-
-    if disable_gpg_check:
-        cmd.append('--no-gpg-checks')
-
-    if old_zypper:
-        cmd.extend(['install', '--auto-agree-with-licenses'])
-    else:
-        cmd.extend(['update', '--auto-agree-with-licenses'])
-
-    cmd.extend(name)
-    rc, stdout, stderr = m.run_command(cmd, check_rc=False)
-
-    # if we've already made a change, we don't have to check whether a version changed
-    if not changed:
-        post_upgrade_versions = get_current_version(m, name)
-        if pre_upgrade_versions != post_upgrade_versions:
-            changed = True
-
-    return (rc, stdout, stderr, changed)
+    # install picks the best candidate, so missing packages get installed and
+    # installed ones upgraded in the same solver run
+    command = ['install', '--auto-agree-with-licenses']
+    if disable_recommends and not old_zypper:
+        command.append('--no-recommends')
+    return run_zypper(m, command, name, disable_gpg_check)
 
 # Function used to make sure a package is not installed.
 def package_absent(m, name, installed_state, old_zypper):
@@ -214,22 +313,10 @@ def package_absent(m, name, installed_state, old_zypper):
     for package in name:
         if installed_state[package] is True:
             packages.append(package)
-    if len(packages) != 0:
-        cmd = ['/usr/bin/zypper', '--non-interactive', 'remove']
-        cmd.extend(packages)
-        rc, stdout, stderr = m.run_command(cmd)
+    if len(packages) == 0:
+        return (0, '', '', {})
 
-        if rc == 0:
-            changed=True
-        else:
-            changed=False
-    else:
-        rc = 0
-        stdout = ''
-        stderr = ''
-        changed=False
-
-    return (rc, stdout, stderr, changed)
+    return run_zypper(m, ['remove'], packages, False)
 
 # ===========================================
 # Main control flow
@@ -241,6 +328,7 @@ def main():
             state = dict(required=False, default='present', choices=['absent', 'installed', 'latest', 'present', 'removed']),
             disable_gpg_check = dict(required=False, default='no', type='bool'),
             disable_recommends = dict(required=False, default='yes', type='bool'),
+            cache_valid_time = dict(required=False, default=0, type='int'),
         ),
         supports_check_mode = False
     )
@@ -252,6 +340,7 @@ def main():
     state = params['state']
     disable_gpg_check = params['disable_gpg_check']
     disable_recommends = params['disable_recommends']
+    cache_valid_time = params['cache_valid_time']
 
     rc = 0
     stdout = ''
@@ -270,13 +359,17 @@ def main():
     # Get package state
     installed_state = get_package_state(module, name)
 
+    # Refresh only what the transaction needs
+    if cache_valid_time and state not in ['absent', 'removed']:
+        result['refreshed_repos'] = refresh_repos(module, get_package_repos(module, name), cache_valid_time)
+
     # Perform requested action
     if state in ['installed', 'present']:
-        (rc, stdout, stderr, changed) = package_present(module, name, installed_state, disable_gpg_check, disable_recommends, old_zypper)
+        (rc, stdout, stderr, changes) = package_present(module, name, installed_state, disable_gpg_check, disable_recommends, old_zypper)
     elif state in ['absent', 'removed']:
-        (rc, stdout, stderr, changed) = package_absent(module, name, installed_state, old_zypper)
+        (rc, stdout, stderr, changes) = package_absent(module, name, installed_state, old_zypper)
     elif state == 'latest':
-        (rc, stdout, stderr, changed) = package_latest(module, name, installed_state, disable_gpg_check, disable_recommends, old_zypper)
+        (rc, stdout, stderr, changes) = package_latest(module, name, installed_state, disable_gpg_check, disable_recommends, old_zypper)
 
     if rc != 0:
         if stderr:
@@ -284,7 +377,8 @@ def main():
         else:
             module.fail_json(msg=stdout)
 
-    result['changed'] = changed
+    result['changed'] = bool(changes)
+    result['packages'] = changes
 
     module.exit_json(**result)
 
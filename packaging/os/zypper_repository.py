@@ -66,6 +66,15 @@ options:
         default: "yes"
         choices: [ "yes", "no" ]
         aliases: []
+    cache_valid_time:
+        version_added: "2.0"
+        description:
+            - When state is I(present), refresh the metadata of the repository
+              if it was not refreshed in this many seconds, and record the
+              refresh for the I(cache_valid_time) option of the zypper module.
+              Requires I(name). C(0) disables refreshing.
+        required: false
+        default: 0
 notes: []
 requirements: [ zypper ]
 '''
@@ -77,12 +86,24 @@ EXAMPLES = '''
 # Remove NVIDIA repository
 - zypper_repository: name=nvidia-repo repo='ftp://download.nvidia.com/opensuse/12.2' state=absent
 
+# Add NVIDIA repository and refresh its metadata unless done in the last day
+- zypper_repository: name=nvidia-repo repo='ftp://download.nvidia.com/opensuse/12.2' cache_valid_time=86400
+
 # Add python development repository
 - zypper_repository: repo=http://download.opensuse.org/repositories/devel:/languages:/python/SLE_11_SP3/devel:languages:python.repo
 '''
 
+import json
+import os
+import tempfile
+import time
+
 REPO_OPTS = ['alias', 'name', 'priority', 'enabled', 'autorefresh', 'gpgcheck']
 
+# Time of the last refresh of each repository done with cache_valid_time,
+# shared with the zypper module
+REFRESH_STAMPS = '~/.ansible/cache/zypper_refresh.json'
+
 def zypper_version(module):
     """Return (rc, message) tuple"""
     cmd = ['/usr/bin/zypper', '-V']
@@ -210,6 +231,49 @@ def remove_repo(module, repo, alias, old_zypper):
     return changed
 
 
+def load_refresh_stamps():
+    try:
+        f = open(os.path.expanduser(REFRESH_STAMPS))
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return {}
+
+
+def save_refresh_stamps(stamps):
+    path = os.path.expanduser(REFRESH_STAMPS)
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        f = os.fdopen(fd, 'w')
+        try:
+            json.dump(stamps, f)
+        finally:
+            f.close()
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        # the next run will only refresh again
+        pass
+
+
+def refresh_repo(module, alias, cache_valid_time):
+    """refreshes the repo unless it was refreshed less than cache_valid_time ago"""
+    stamps = load_refresh_stamps()
+    now = time.time()
+    if now - stamps.get(alias, 0) < cache_valid_time:
+        return False
+
+    cmd = ['/usr/bin/zypper', '--non-interactive', 'refresh', alias]
+    rc, stdout, stderr = module.run_command(cmd, check_rc=False)
+    fail_if_rc_is_null(module, rc, stdout, stderr)
+    stamps[alias] = now
+    save_refresh_stamps(stamps)
+    return True
+
+
 def fail_if_rc_is_null(module, rc, stdout, stderr):
     if rc != 0:
         #module.fail_json(msg=stderr if stderr else stdout)
@@ -228,6 +292,7 @@ def main():
             description=dict(required=False),
             disable_gpg_check = dict(required=False, default='no', type='bool'),
             refresh = dict(required=False, default='yes', type='bool'),
+            cache_valid_time = dict(required=False, default=0, type='int'),
         ),
         supports_check_mode=False,
     )
@@ -238,6 +303,12 @@ def main():
     description = module.params['description']
     disable_gpg_check = module.params['disable_gpg_check']
     refresh = module.params['refresh']
+    cache_valid_time = module.params['cache_valid_time']
+
+    def refresh_metadata():
+        if cache_valid_time and name:
+            return refresh_repo(module, name, cache_valid_time)
+        return False
 
     def exit_unchanged():
         module.exit_json(changed=False, repo=repo, state=state, name=name)
@@ -271,9 +342,12 @@ def main():
 
     if state == 'present':
         if exists:
-            exit_unchanged()
+            refreshed = refresh_metadata()
+            module.exit_json(changed=refreshed, repo=repo, state=state, name=name, refreshed=refreshed)
 
         changed = add_repo(module, repo, name, description, disable_gpg_check, old_zypper, refresh)
+        refreshed = refresh_metadata()
+        module.exit_json(changed=changed or refreshed, repo=repo, state=state, refreshed=refreshed)
     elif state == 'absent':
         if not exists:
             exit_unchanged()